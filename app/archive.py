@@ -0,0 +1,221 @@
+"""
+Retention and archival for audit_logs and inbound_emails.
+
+Rows older than the configured retention are streamed out in keyset-ordered
+chunks, written to compressed JSONL files partitioned by table and day
+(ARCHIVE_DIR/<table>/<YYYY-MM-DD>/part-*.jsonl.gz), and then deleted chunk by
+chunk so each write transaction stays short. A part file is named after its
+first row, so when a delete fails the next run rewrites the same files
+instead of archiving the rows twice. Bodies kept in the blob store are
+written into the archive record itself, and blobs no remaining row refers to
+are deleted after each chunk.
+
+CLI:
+    python -m app.archive run
+    python -m app.archive query audit_logs --since 2026-01-01 --request-id <id>
+"""
+import argparse, datetime, enum, gzip, json, logging, os, sys
+from sqlalchemy import select, delete
+from .db import SessionLocal
+from .models import AuditLog, InboundEmail
+from .blobstore import get_blob_store
+from .outbox import prune_outbox
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# table name -> (model, timestamp column, retention days setting)
+ARCHIVED_TABLES = {
+    "audit_logs": (AuditLog, AuditLog.timestamp, "AUDIT_RETENTION_DAYS"),
+    "inbound_emails": (InboundEmail, InboundEmail.received_at, "INBOUND_RETENTION_DAYS"),
+}
+
+# table name -> {blob ref column: inline column its content is archived into}
+BLOB_COLUMNS = {
+    "inbound_emails": {"text_ref": "text", "html_ref": "html", "raw_ref": "raw_payload"},
+}
+
+def _inline_blobs(table: str, record: dict):
+    """Copy offloaded content into the archive record, so the archive is self-contained."""
+    for ref_col, inline_col in BLOB_COLUMNS.get(table, {}).items():
+        ref = record.get(ref_col)
+        if not ref:
+            continue
+        try:
+            record[inline_col] = get_blob_store().get_text(ref)
+        except (KeyError, OSError):
+            logger.warning("Blob %s of %s row %s is missing; archiving the ref only", ref, table, record.get("id"))
+
+def _collect_garbage(db, table: str, refs) -> int:
+    """Delete blobs of `refs` that no remaining row refers to. Returns the number deleted."""
+    ref_cols = BLOB_COLUMNS.get(table)
+    if not ref_cols or not refs:
+        return 0
+    model = ARCHIVED_TABLES[table][0]
+    refs = list(refs)
+    in_use = set()
+    for name in ref_cols:
+        col = getattr(model, name)
+        in_use.update(db.execute(select(col).where(col.in_(refs)).distinct()).scalars())
+    store = get_blob_store()
+    return sum(1 for ref in refs if ref not in in_use and store.delete_if_stale(ref))
+
+def _codec():
+    """Return (file extension, open function). zstd is used when configured and installed."""
+    if settings.ARCHIVE_COMPRESSION == "zstd":
+        try:
+            import zstandard
+
+            def open_zstd(path, mode):
+                if "w" in mode:
+                    return zstandard.open(path, "wt", cctx=zstandard.ZstdCompressor(level=10), encoding="utf-8")
+                return zstandard.open(path, "rt", encoding="utf-8")
+            return ".jsonl.zst", open_zstd
+        except ImportError:
+            logger.warning("ARCHIVE_COMPRESSION=zstd but zstandard is not installed; using gzip")
+    return ".jsonl.gz", lambda path, mode: gzip.open(path, mode + "t", encoding="utf-8")
+
+def _open_archive(path):
+    if path.endswith(".zst"):
+        import zstandard
+        return zstandard.open(path, "rt", encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+def _to_json(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+_EXTENSIONS = (".jsonl.gz", ".jsonl.zst")
+
+def _part_name(ts, row_id) -> str:
+    """Deterministic part name: time and id of the part's first (oldest) row."""
+    return f"part-{ts:%H%M%S%f}-{row_id}" if ts else f"part-{row_id}"
+
+def _write_partition(table: str, day: str, name: str, rows) -> str:
+    ext, open_fn = _codec()
+    directory = os.path.join(settings.ARCHIVE_DIR, table, day)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + ext)
+    tmp = path + ".tmp"
+    with open_fn(tmp, "w") as fh:
+        for row in rows:
+            fh.write(json.dumps(row, separators=(",", ":")) + "\n")
+    # only visible (and only deleted from the DB) once fully written; replaces a part
+    # left by a run whose delete failed
+    os.replace(tmp, path)
+    for other in _EXTENSIONS:
+        if other != ext and os.path.exists(os.path.join(directory, name + other)):
+            os.remove(os.path.join(directory, name + other))
+    return path
+
+def archive_table(table: str, older_than: datetime.datetime, chunk_size: int = None) -> int:
+    """Archive and delete rows of `table` older than `older_than`. Returns the number moved."""
+    model, ts_col, _ = ARCHIVED_TABLES[table]
+    chunk_size = chunk_size or settings.ARCHIVE_CHUNK_SIZE
+    columns = [c.name for c in model.__table__.columns]
+    moved = 0
+    db = SessionLocal()
+    try:
+        while True:
+            # always the oldest remaining chunk: the previous one has been deleted
+            q = (select(model.__table__)
+                 .where(ts_col < older_than)
+                 .order_by(ts_col, model.id)
+                 .limit(chunk_size))
+            rows = db.execute(q).mappings().all()
+            if not rows:
+                break
+            by_day, names, refs = {}, {}, set()
+            for row in rows:
+                ts = row[ts_col.name]
+                day = ts.strftime("%Y-%m-%d") if ts else "unknown"
+                record = {c: _to_json(row[c]) for c in columns}
+                _inline_blobs(table, record)
+                refs.update(record[c] for c in BLOB_COLUMNS.get(table, {}) if record.get(c))
+                names.setdefault(day, _part_name(ts, row["id"]))
+                by_day.setdefault(day, []).append(record)
+            for day, records in by_day.items():
+                _write_partition(table, day, names[day], records)
+            db.execute(delete(model).where(model.id.in_([row["id"] for row in rows])))
+            db.commit()
+            moved += len(rows)
+            _collect_garbage(db, table, refs)
+        return moved
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def run_retention() -> dict:
+    """Scheduled job: archive every table whose retention is enabled (> 0 days) and prune the outbox."""
+    now = datetime.datetime.utcnow()
+    counts = {}
+    for table, (_, _, setting) in ARCHIVED_TABLES.items():
+        days = getattr(settings, setting)
+        if not days:
+            continue
+        try:
+            counts[table] = archive_table(table, now - datetime.timedelta(days=days))
+        except Exception as e:
+            logger.exception("Retention for %s failed: %s", table, e)
+    try:
+        # sent/failed mail is not archived: its bodies held bearer links and are already cleared
+        counts["outbound_emails"] = prune_outbox(now)
+    except Exception as e:
+        logger.exception("Retention for outbound_emails failed: %s", e)
+    if any(counts.values()):
+        logger.info("Retention archived %s", counts)
+    return counts
+
+def query_archive(table: str, since: datetime.date = None, until: datetime.date = None, request_id: str = None,
+                  contains: str = None):
+    """Yield archived records of `table`, pruning partitions by day before opening files."""
+    root = os.path.join(settings.ARCHIVE_DIR, table)
+    if not os.path.isdir(root):
+        return
+    for day in sorted(os.listdir(root)):
+        if day != "unknown":
+            d = datetime.date.fromisoformat(day)
+            if (since and d < since) or (until and d > until):
+                continue
+        directory = os.path.join(root, day)
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(_EXTENSIONS):
+                continue
+            with _open_archive(os.path.join(directory, name)) as fh:
+                for line in fh:
+                    if contains and contains not in line:
+                        continue
+                    record = json.loads(line)
+                    if request_id and record.get("request_id") != request_id:
+                        continue
+                    yield record
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.archive", description="Archive retention and archive queries")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("run", help="archive rows older than the configured retention now")
+    q = sub.add_parser("query", help="print archived records as JSON lines")
+    q.add_argument("table", choices=sorted(ARCHIVED_TABLES))
+    q.add_argument("--since", type=datetime.date.fromisoformat, help="first day (YYYY-MM-DD)")
+    q.add_argument("--until", type=datetime.date.fromisoformat, help="last day (YYYY-MM-DD)")
+    q.add_argument("--request-id")
+    q.add_argument("--contains", help="substring match on the raw record")
+    q.add_argument("--limit", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        print(json.dumps(run_retention()))
+        return 0
+    for n, record in enumerate(query_archive(args.table, args.since, args.until, args.request_id, args.contains), 1):
+        sys.stdout.write(json.dumps(record) + "\n")
+        if args.limit and n >= args.limit:
+            break
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Buffered audit log writer.
+
+log_audit() hands records to the process-wide AuditSink, which a background
+thread flushes to audit_logs with one bulk INSERT per batch (on size or time
+threshold). When the writer is not running, or AUDIT_ASYNC is off, records
+are written synchronously, so scripts and tests see them immediately.
+
+A batch that fails to insert is put back on the queue and retried with
+backoff; after AUDIT_MAX_ATTEMPTS its records are written to the blob store
+as JSON lines (dead letters) and the ref logged. A failed synchronous write
+is logged and dead-lettered the same way.
+"""
+import atexit, datetime, json, logging, queue, threading, time, uuid
+from sqlalchemy import insert
+from .blobstore import get_blob_store
+from .db import SessionLocal
+from .models import AuditLog
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+class AuditSink:
+    def __init__(self, batch_size: int = 200, flush_interval: float = 1.0, max_queue: int = 10000,
+                 enqueue_timeout: float = 0.05, max_attempts: int = 5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_attempts = max_attempts
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._failures = 0   # consecutive failed batches, for backoff
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, record: dict):
+        record.setdefault("id", str(uuid.uuid4()))
+        record.setdefault("timestamp", datetime.datetime.utcnow())
+        if not self.running:
+            self._write_now(record)
+            return
+        try:
+            self._queue.put((record, 0), timeout=self.enqueue_timeout)
+        except queue.Full:
+            # backpressure: the writer is behind, so this caller pays for its own insert
+            logger.warning("Audit queue full; writing record synchronously")
+            self._write_now(record)
+
+    def _write(self, rows):
+        """Insert one batch; raises when it was not stored."""
+        with self._write_lock:
+            db = SessionLocal()
+            try:
+                db.execute(insert(AuditLog), rows)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+    def _write_now(self, record):
+        try:
+            self._write([record])
+        except Exception:
+            logger.exception("Failed to write audit record %s", record.get("action"))
+            self._dead_letter([record], 1)
+
+    def _write_or_requeue(self, items):
+        """Background path: on failure put the batch back (with backoff) instead of dropping it."""
+        if not items:
+            return
+        try:
+            self._write([record for record, _ in items])
+            self._failures = 0
+            return
+        except Exception:
+            logger.exception("Failed to write %d audit records; will retry", len(items))
+        self._failures += 1
+        dead = []
+        for record, attempts in items:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                dead.append(record)
+                continue
+            try:
+                self._queue.put_nowait((record, attempts))
+            except queue.Full:
+                dead.append(record)
+        if dead:
+            self._dead_letter(dead, self.max_attempts)
+        # back off while the database is failing
+        self._stop.wait(min(self.flush_interval * 2 ** self._failures, 30))
+
+    def _dead_letter(self, records, attempts: int):
+        data = "\n".join(json.dumps(r, default=str) for r in records).encode()
+        try:
+            ref = get_blob_store().put(data)
+            logger.error("%d audit records not written after %d attempts; kept as blob %s", len(records), attempts, ref)
+        except Exception:
+            logger.exception("%d audit records not written after %d attempts and could not be dead-lettered",
+                             len(records), attempts)
+
+    def _drain(self, limit: int):
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def flush(self):
+        """Write everything currently buffered."""
+        # terminates: failing records are dead-lettered after max_attempts
+        while True:
+            items = self._drain(self.batch_size)
+            if not items:
+                return
+            self._write_or_requeue(items)
+
+    def _run(self):
+        while not self._stop.is_set():
+            items = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                items.extend(self._drain(self.batch_size - len(items)))
+                if self._stop.is_set():
+                    break
+            self._write_or_requeue(items)
+        self.flush()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Stop the writer and flush whatever is still buffered."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+sink = AuditSink(batch_size=settings.AUDIT_BATCH_SIZE,
+                 flush_interval=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+                 max_queue=settings.AUDIT_QUEUE_MAX,
+                 max_attempts=settings.AUDIT_MAX_ATTEMPTS)
+
+def start_audit_writer():
+    if settings.AUDIT_ASYNC:
+        sink.start()
+
+def stop_audit_writer():
+    sink.stop()
+
+atexit.register(stop_audit_writer)
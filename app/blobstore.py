@@ -0,0 +1,171 @@
+"""
+Content-addressed blob storage for large inbound email bodies and raw payloads.
+
+Blobs are zlib-compressed and keyed by the sha256 of their uncompressed bytes,
+so identical content (webhook retries, repeated signatures, quoted threads) is
+stored once. Rows keep only the hex digest ("ref"); content is read on demand.
+
+Blobs are deleted by retention (app.archive) once no inbound_emails row refers
+to them. put() refreshes a blob's last-touched time even when it already
+exists, and delete_if_stale() spares blobs touched within BLOB_GC_GRACE_SECONDS,
+so content being re-stored for a row that is not committed yet survives.
+
+Backends:
+  fs     - one file per blob under BLOB_DIR/<aa>/<bb>/<sha256>.z
+  sqlite - a single `blobs` table in a separate SQLite file (BLOB_SQLITE_PATH),
+           so payloads never land in the main database
+"""
+import hashlib, logging, os, sqlite3, threading, time, uuid, zlib
+from typing import Optional
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+class BlobStore:
+    def put(self, data: bytes) -> str:
+        """Store `data` (if not already present) and return its ref."""
+        ref = hashlib.sha256(data).hexdigest()
+        if not self._touch(ref):
+            self._write(ref, zlib.compress(data, settings.BLOB_COMPRESSION_LEVEL))
+        return ref
+
+    def get(self, ref: str) -> bytes:
+        return zlib.decompress(self._read(ref))
+
+    def put_text(self, text: str) -> str:
+        return self.put(text.encode("utf-8"))
+
+    def get_text(self, ref: str) -> str:
+        return self.get(ref).decode("utf-8")
+
+    def delete_if_stale(self, ref: str, grace_seconds: float = None) -> bool:
+        """Delete a blob not touched within the grace period. True when it was deleted."""
+        if grace_seconds is None:
+            grace_seconds = settings.BLOB_GC_GRACE_SECONDS
+        return self._delete_before(ref, time.time() - grace_seconds)
+
+    def _touch(self, ref: str) -> bool:
+        """Mark an existing blob as just used; False when it does not exist."""
+        raise NotImplementedError
+
+    def _delete_before(self, ref: str, cutoff: float) -> bool:
+        raise NotImplementedError
+
+    def _write(self, ref: str, compressed: bytes):
+        raise NotImplementedError
+
+    def _read(self, ref: str) -> bytes:
+        raise NotImplementedError
+
+class LocalFSBlobStore(BlobStore):
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, ref: str) -> str:
+        return os.path.join(self.root, ref[:2], ref[2:4], ref + ".z")
+
+    def _touch(self, ref):
+        try:
+            os.utime(self._path(ref))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _delete_before(self, ref, cutoff):
+        path = self._path(ref)
+        try:
+            if os.stat(path).st_mtime >= cutoff:
+                return False
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _write(self, ref, compressed):
+        path = self._path(ref)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(compressed)
+        # atomic, and harmless if a concurrent writer stored the same content first
+        os.replace(tmp, path)
+
+    def _read(self, ref):
+        with open(self._path(ref), "rb") as fh:
+            return fh.read()
+
+class SQLiteBlobStore(BlobStore):
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS blobs (ref TEXT PRIMARY KEY, data BLOB NOT NULL, touched REAL NOT NULL DEFAULT 0)")
+        if "touched" not in {row[1] for row in conn.execute("PRAGMA table_info(blobs)")}:
+            # stores created before garbage collection; existing blobs count as untouched
+            conn.execute("ALTER TABLE blobs ADD COLUMN touched REAL NOT NULL DEFAULT 0")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _touch(self, ref):
+        conn = self._conn()
+        touched = conn.execute("UPDATE blobs SET touched = ? WHERE ref = ?", (time.time(), ref)).rowcount
+        conn.commit()
+        return touched == 1
+
+    def _write(self, ref, compressed):
+        conn = self._conn()
+        conn.execute("INSERT OR IGNORE INTO blobs (ref, data, touched) VALUES (?, ?, ?)", (ref, compressed, time.time()))
+        conn.commit()
+
+    def _delete_before(self, ref, cutoff):
+        conn = self._conn()
+        deleted = conn.execute("DELETE FROM blobs WHERE ref = ? AND touched < ?", (ref, cutoff)).rowcount
+        conn.commit()
+        return deleted == 1
+
+    def _read(self, ref):
+        row = self._conn().execute("SELECT data FROM blobs WHERE ref = ?", (ref,)).fetchone()
+        if row is None:
+            raise KeyError(ref)
+        return row[0]
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide blob store for the configured BLOB_BACKEND."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if settings.BLOB_BACKEND == "sqlite":
+                _store = SQLiteBlobStore(settings.BLOB_SQLITE_PATH)
+            else:
+                _store = LocalFSBlobStore(settings.BLOB_DIR)
+        return _store
+
+def offload_text(text: Optional[str]):
+    """
+    Split a value into (inline, ref): short values stay inline in the row,
+    anything of BLOB_MIN_BYTES or more goes to the blob store.
+    """
+    if text is None:
+        return None, None
+    data = text.encode("utf-8")
+    if len(data) < settings.BLOB_MIN_BYTES:
+        return text, None
+    return None, get_blob_store().put(data)
+
+def load_text(inline: Optional[str], ref: Optional[str]) -> Optional[str]:
+    if ref:
+        return get_blob_store().get_text(ref)
+    return inline
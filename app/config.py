@@ -7,7 +7,23 @@ class Settings:
     APP_HOST = os.getenv("APP_HOST", "0.0.0.0")
     APP_PORT = int(os.getenv("APP_PORT", 8081))
     APP_BASE = os.getenv("APP_BASE", "http://localhost:8081")
+    # approval emails go to the first address; replies from any of them may approve/reject
+    APPROVER_EMAILS = [e.strip().lower() for e in os.getenv("APPROVER_EMAILS", "approver@example.com").split(",") if e.strip()]
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/iam.db")
+    # run `alembic upgrade head` at startup; turn off when migrations run as a separate deploy step
+    DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+    # "tuned": SQLite pragmas below / pool settings for Postgres & MySQL; "plain": SQLAlchemy defaults
+    DB_PROFILE = os.getenv("DB_PROFILE", "tuned")
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+    SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -65536))  # negative = KiB (64 MiB)
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 268435456))
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
 
     KEYCLOAK_SERVER_URL = os.getenv("KEYCLOAK_SERVER_URL")
     KEYCLOAK_REALM = os.getenv("KEYCLOAK_REALM", "master")
@@ -16,6 +32,23 @@ class Settings:
     # Optional: Admin username/password (alternative to client credentials)
     KEYCLOAK_ADMIN_USERNAME = os.getenv("KEYCLOAK_ADMIN_USERNAME")
     KEYCLOAK_ADMIN_PASSWORD = os.getenv("KEYCLOAK_ADMIN_PASSWORD")
+    KEYCLOAK_POOL_SIZE = int(os.getenv("KEYCLOAK_POOL_SIZE", 10))
+    # refresh the admin token this long before it expires
+    KEYCLOAK_TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("KEYCLOAK_TOKEN_REFRESH_MARGIN_SECONDS", 30))
+    # lookup caches (user ids incl. "not found", realm role representations)
+    KEYCLOAK_CACHE_SIZE = int(os.getenv("KEYCLOAK_CACHE_SIZE", 4096))
+    KEYCLOAK_USER_CACHE_TTL_SECONDS = float(os.getenv("KEYCLOAK_USER_CACHE_TTL_SECONDS", 300))
+    KEYCLOAK_NEGATIVE_CACHE_TTL_SECONDS = float(os.getenv("KEYCLOAK_NEGATIVE_CACHE_TTL_SECONDS", 30))
+    KEYCLOAK_ROLE_CACHE_TTL_SECONDS = float(os.getenv("KEYCLOAK_ROLE_CACHE_TTL_SECONDS", 3600))
+
+    # Provisioning worker: assigns Keycloak roles for approved requests (opt-in; needs KEYCLOAK_SERVER_URL)
+    PROVISION_ENABLED = os.getenv("PROVISION_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROVISION_INTERVAL_SECONDS = int(os.getenv("PROVISION_INTERVAL_SECONDS", 30))
+    PROVISION_BATCH_SIZE = int(os.getenv("PROVISION_BATCH_SIZE", 200))
+    PROVISION_MAX_ATTEMPTS = int(os.getenv("PROVISION_MAX_ATTEMPTS", 5))
+    PROVISION_RETRY_BACKOFF_SECONDS = float(os.getenv("PROVISION_RETRY_BACKOFF_SECONDS", 30))
+    # a claimed batch is hidden from other workers this long (a crashed run's rows come back after it)
+    PROVISION_LEASE_SECONDS = int(os.getenv("PROVISION_LEASE_SECONDS", 300))
 
     MAILER_BACKEND = os.getenv("MAILER_BACKEND", "mailersend").lower()
 
@@ -23,19 +56,111 @@ class Settings:
     SMTP_PORT = int(os.getenv("SMTP_PORT", 465))
     SMTP_USER = os.getenv("SMTP_USER")
     SMTP_PASS = os.getenv("SMTP_PASS")
+    # implicit TLS (SMTP_SSL) by default; true = plain connection upgraded with STARTTLS (e.g. port 587)
+    SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() in ("1", "true", "yes")
+    SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", 30))
+    SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 4))
+    SMTP_POOL_MAX_IDLE_SECONDS = float(os.getenv("SMTP_POOL_MAX_IDLE_SECONDS", 60))
+    SMTP_POOL_MAX_MESSAGES = int(os.getenv("SMTP_POOL_MAX_MESSAGES", 100))
 
     MAILERSEND_API_KEY = os.getenv("MAILERSEND_API_KEY")
     MAILERSEND_FROM_EMAIL = os.getenv("MAILERSEND_FROM_EMAIL")
     MAILERSEND_FROM_NAME = os.getenv("MAILERSEND_FROM_NAME", "IAM Automation")
     MAILERSEND_MAX_RETRIES = int(os.getenv("MAILERSEND_MAX_RETRIES", 3))
     MAILERSEND_RETRY_BACKOFF = float(os.getenv("MAILERSEND_RETRY_BACKOFF", 1.5))
+    MAILERSEND_POOL_SIZE = int(os.getenv("MAILERSEND_POOL_SIZE", 10))
+    MAILERSEND_CONNECT_TIMEOUT = float(os.getenv("MAILERSEND_CONNECT_TIMEOUT", 5))
+    MAILERSEND_READ_TIMEOUT = float(os.getenv("MAILERSEND_READ_TIMEOUT", 10))
+    MAILERSEND_HTTP2 = os.getenv("MAILERSEND_HTTP2", "false").lower() in ("1", "true", "yes")  # needs httpx[http2]
+    MAILERSEND_BULK_MAX_MESSAGES = int(os.getenv("MAILERSEND_BULK_MAX_MESSAGES", 500))  # provider limit per bulk request
     MAILERSEND_INBOUND_SECRET = os.getenv("MAILERSEND_INBOUND_SECRET", "")  # Empty for dev/testing
 
     TOKEN_SECRET = os.getenv("TOKEN_SECRET", "change_me")
     TOKEN_EXPIRY_SECONDS = int(os.getenv("TOKEN_EXPIRY_SECONDS", 7*24*3600))
+    # "db": one approval_tokens row per token; "stateless": signed JWT only, used jtis kept in consumed_tokens
+    TOKEN_MODE = os.getenv("TOKEN_MODE", "db").lower()
+    TOKEN_USED_RETENTION_HOURS = int(os.getenv("TOKEN_USED_RETENTION_HOURS", 24))
+    TOKEN_COMPACTION_INTERVAL_MINUTES = int(os.getenv("TOKEN_COMPACTION_INTERVAL_MINUTES", 60))
+    TOKEN_COMPACTION_BATCH_SIZE = int(os.getenv("TOKEN_COMPACTION_BATCH_SIZE", 1000))
+
+    # POST /api/v1/requests:batch
+    REQUEST_BATCH_MAX_ITEMS = int(os.getenv("REQUEST_BATCH_MAX_ITEMS", 1000))
 
     REMINDER_HOURS = int(os.getenv("REMINDER_HOURS", 48))
+    # per-role reminder interval overrides, e.g. "admin:4,viewer:72"
+    REMINDER_HOURS_BY_ROLE = {role.strip(): float(hours) for role, hours in
+                              (item.split(":", 1) for item in os.getenv("REMINDER_HOURS_BY_ROLE", "").split(",") if ":" in item)}
+    # longest the reminder timer sleeps between sweeps (picks up requests created by other processes)
     REMINDER_CHECK_INTERVAL_MINUTES = int(os.getenv("REMINDER_CHECK_INTERVAL_MINUTES", 60))
+    REMINDER_MAX_NOTIFICATIONS = int(os.getenv("REMINDER_MAX_NOTIFICATIONS", 10))  # then expire; 0 = unlimited
+    REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", 500))
+    REMINDER_LEASE_SECONDS = int(os.getenv("REMINDER_LEASE_SECONDS", 300))
+
+    # pending requests whose newest links are past TOKEN_EXPIRY_SECONDS move to expired
+    EXPIRY_INTERVAL_MINUTES = int(os.getenv("EXPIRY_INTERVAL_MINUTES", 60))
+    EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", 500))
+    EXPIRY_NOTIFY_REQUESTER = os.getenv("EXPIRY_NOTIFY_REQUESTER", "true").lower() in ("1", "true", "yes")
+
+    # Outbound email queue: handlers enqueue, worker threads deliver
+    OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true").lower() in ("1", "true", "yes")
+    OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 4))
+    OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 20))
+    OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", 2))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+    OUTBOX_RETRY_BACKOFF = float(os.getenv("OUTBOX_RETRY_BACKOFF", 2))
+    OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", 300))
+    # accepted MailerSend bulks are checked (GET /bulk-email/{id}) this often until they complete
+    OUTBOX_BULK_CHECK_INTERVAL_SECONDS = int(os.getenv("OUTBOX_BULK_CHECK_INTERVAL_SECONDS", 30))
+    # ...and are failed if the bulk is still unconfirmed this long after the message was queued
+    OUTBOX_BULK_MAX_AGE_HOURS = int(os.getenv("OUTBOX_BULK_MAX_AGE_HOURS", 24))
+
+    # Templates: reload from disk only in dev; compiled bytecode cached on disk
+    TEMPLATES_AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "false").lower() in ("1", "true", "yes")
+    TEMPLATES_PRECOMPILE = os.getenv("TEMPLATES_PRECOMPILE", "true").lower() in ("1", "true", "yes")
+    TEMPLATE_BYTECODE_CACHE = os.getenv("TEMPLATE_BYTECODE_CACHE", "true").lower() in ("1", "true", "yes")
+    TEMPLATE_BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR", "")  # empty = system temp dir
+
+    # Audit log writer: buffered bulk inserts from a background thread
+    AUDIT_ASYNC = os.getenv("AUDIT_ASYNC", "true").lower() in ("1", "true", "yes")
+    AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 200))
+    AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", 1))
+    AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", 10000))
+    # failed batches are retried; after this many attempts the records go to the blob store (dead letters)
+    AUDIT_MAX_ATTEMPTS = int(os.getenv("AUDIT_MAX_ATTEMPTS", 5))
+
+    # Inbound webhook: ack fast, parse/dedupe/store in batches from a background thread
+    INBOUND_ASYNC = os.getenv("INBOUND_ASYNC", "true").lower() in ("1", "true", "yes")
+    INBOUND_BATCH_SIZE = int(os.getenv("INBOUND_BATCH_SIZE", 100))
+    INBOUND_FLUSH_INTERVAL_SECONDS = float(os.getenv("INBOUND_FLUSH_INTERVAL_SECONDS", 0.5))
+    INBOUND_QUEUE_MAX = int(os.getenv("INBOUND_QUEUE_MAX", 10000))
+    INBOUND_DEDUP_CACHE_SIZE = int(os.getenv("INBOUND_DEDUP_CACHE_SIZE", 10000))
+    # failed batches are retried; after this many attempts raw bodies go to the blob store (dead letters)
+    INBOUND_MAX_ATTEMPTS = int(os.getenv("INBOUND_MAX_ATTEMPTS", 5))
+    # classify stored inbound emails: approver replies decide requests, "request access" mails file new ones
+    INBOUND_ROUTING = os.getenv("INBOUND_ROUTING", "true").lower() in ("1", "true", "yes")
+    # rules only look at the start of the body; a huge body must not stall the batcher thread
+    INBOUND_CLASSIFY_MAX_CHARS = int(os.getenv("INBOUND_CLASSIFY_MAX_CHARS", 20000))
+    # approve/reject by reply: needs SPF+DKIM pass and the approval email's secret reference (TOKEN_MODE=db)
+    INBOUND_EMAIL_APPROVAL = os.getenv("INBOUND_EMAIL_APPROVAL", "false").lower() in ("1", "true", "yes")
+
+    # Retention: rows older than N days are archived to ARCHIVE_DIR and deleted (0 = keep forever)
+    AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", 365))
+    INBOUND_RETENTION_DAYS = int(os.getenv("INBOUND_RETENTION_DAYS", 90))
+    # sent/failed outbox rows are deleted (not archived) after this many days
+    OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", 30))
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./data/archive")
+    ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "gzip")  # gzip | zstd (needs zstandard)
+    ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", 1000))
+    ARCHIVE_INTERVAL_HOURS = int(os.getenv("ARCHIVE_INTERVAL_HOURS", 24))
+
+    # Blob store for inbound bodies/raw payloads: values >= BLOB_MIN_BYTES are kept out of the main DB
+    BLOB_BACKEND = os.getenv("BLOB_BACKEND", "fs")  # fs | sqlite
+    BLOB_DIR = os.getenv("BLOB_DIR", "./data/blobs")
+    BLOB_SQLITE_PATH = os.getenv("BLOB_SQLITE_PATH", "./data/blobs.db")
+    BLOB_MIN_BYTES = int(os.getenv("BLOB_MIN_BYTES", 1024))
+    BLOB_COMPRESSION_LEVEL = int(os.getenv("BLOB_COMPRESSION_LEVEL", 6))
+    # retention deletes unreferenced blobs unless they were (re)stored this recently
+    BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", 3600))
 
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
@@ -1,14 +1,79 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, insert, inspect
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import settings
 import os
 
-connect_args = {"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(settings.DATABASE_URL, connect_args=connect_args)
+def _sqlite_pragmas(dbapi_conn, _record):
+    """Per-connection SQLite tuning (DB_PROFILE=tuned)."""
+    cur = dbapi_conn.cursor()
+    cur.execute(f"PRAGMA busy_timeout = {settings.SQLITE_BUSY_TIMEOUT_MS}")
+    cur.execute(f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}")
+    cur.execute(f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}")
+    cur.execute(f"PRAGMA cache_size = {settings.SQLITE_CACHE_SIZE}")
+    cur.execute(f"PRAGMA mmap_size = {settings.SQLITE_MMAP_SIZE}")
+    cur.execute("PRAGMA temp_store = MEMORY")
+    cur.close()
+
+def _build_engine(url: str):
+    """
+    Engine for DATABASE_URL. DB_PROFILE=tuned (default) applies the SQLite pragmas
+    above, or pool sizing, pre-ping and recycling for server databases;
+    DB_PROFILE=plain keeps SQLAlchemy's defaults.
+    """
+    backend = make_url(url).get_backend_name()
+    tuned = settings.DB_PROFILE == "tuned"
+    if backend == "sqlite":
+        connect_args = {"check_same_thread": False}
+        if tuned:
+            connect_args["timeout"] = settings.SQLITE_BUSY_TIMEOUT_MS / 1000
+        engine = create_engine(url, connect_args=connect_args)
+        # WAL and mmap need a real file
+        if tuned and make_url(url).database not in (None, "", ":memory:"):
+            event.listen(engine, "connect", _sqlite_pragmas)
+        return engine
+    if not tuned:
+        return create_engine(url)
+    return create_engine(url,
+                         pool_size=settings.DB_POOL_SIZE,
+                         max_overflow=settings.DB_MAX_OVERFLOW,
+                         pool_timeout=settings.DB_POOL_TIMEOUT,
+                         pool_recycle=settings.DB_POOL_RECYCLE,
+                         pool_pre_ping=settings.DB_POOL_PRE_PING)
+
+engine = _build_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
-def create_tables():
-    from .models import AccessRequest, ApprovalToken, AuditLog
-    Base.metadata.create_all(bind=engine)
+def insert_ignore(db, table):
+    """INSERT that silently skips primary-key/unique conflicts (rowcount 0 on conflict)."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        return dialect_insert(table).on_conflict_do_nothing()
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        return dialect_insert(table).on_conflict_do_nothing()
+    if dialect == "mysql":
+        return insert(table).prefix_with("IGNORE")
+    raise NotImplementedError(f"INSERT ... ON CONFLICT DO NOTHING is not supported on {dialect}")
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+def migrate_database():
+    """
+    Bring the schema to the latest Alembic revision. A database without an
+    alembic_version table but with tables was made by the old create_tables()
+    (create_all of the 0001_initial schema): it is stamped 0001_initial first.
+    """
+    from alembic import command
+    from alembic.config import Config
+
+    # no ini file: env.py then leaves the app's logging configuration alone
+    cfg = Config()
+    cfg.set_main_option("script_location", MIGRATIONS_DIR)
+    tables = inspect(engine).get_table_names()
+    if tables and "alembic_version" not in tables:
+        command.stamp(cfg, "0001_initial")
+    command.upgrade(cfg, "head")
 
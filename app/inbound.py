@@ -0,0 +1,336 @@
+"""
+Inbound email ingestion for the MailerSend webhook.
+
+The webhook only verifies the signature and hands the raw body to the
+process-wide InboundBatcher, so MailerSend gets its ack immediately. A
+background thread parses batches of bodies, drops duplicates (MailerSend
+retries) using an in-memory LRU of recent message ids backed by the unique
+index on inbound_emails.message_id, and bulk-inserts the rest together with
+their audit records in one transaction. Only the rows the insert actually
+created (not those another process stored first) are audited and passed
+through the pipeline stages (inbound routing, see app.inbound_rules).
+
+A batch that fails to store is put back on the queue and retried with
+backoff; after INBOUND_MAX_ATTEMPTS its raw bodies are written to the blob
+store (dead letters) and their refs logged. The synchronous store() path
+raises instead, so the webhook can answer 5xx and MailerSend retries; it only
+stores, and hands the pipeline stages to a background thread so routing
+(Keycloak lookups, replies) never runs on the request thread.
+"""
+import atexit, datetime, hashlib, json, logging, queue, threading, time, uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select
+from .db import SessionLocal, insert_ignore
+from .models import InboundEmail
+from .blobstore import offload_text, get_blob_store
+from .mailer_utils import log_audit
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+def _headers(value) -> dict:
+    """Headers arrive as a dict or as a list of {name, value}; return them lower-cased."""
+    if isinstance(value, dict):
+        return {str(k).lower(): v for k, v in value.items()}
+    if isinstance(value, list):
+        return {str(h.get("name")).lower(): h.get("value") for h in value if isinstance(h, dict)}
+    return {}
+
+def parse_inbound(raw_body: bytes) -> dict:
+    """Extract the InboundEmail fields from a MailerSend inbound payload (defensively)."""
+    try:
+        payload = json.loads(raw_body) if raw_body else None
+    except ValueError:
+        # if JSON parse fails, still save raw payload
+        payload = None
+
+    mail_data = {"message_id": None, "from_email": None, "from_name": None, "to_email": None,
+                 "subject": None, "text": None, "html": None, "headers": {}, "auth": {"spf": False, "dkim": False}}
+    if isinstance(payload, dict):
+        # Some payloads include top-level 'mail' object (depends on webhook type). Try common patterns.
+        m = payload["mail"] if isinstance(payload.get("mail"), dict) else payload
+        headers = _headers(m.get("headers"))
+
+        mail_data["message_id"] = m.get("message_id") or m.get("Message-Id") or headers.get("message-id")
+        # 'from' may be dict or string
+        frm = m.get("from") or {}
+        if isinstance(frm, dict):
+            mail_data["from_email"] = frm.get("email") or frm.get("address")
+            mail_data["from_name"] = frm.get("name")
+        else:
+            mail_data["from_email"] = frm
+
+        # recipients
+        envelope = m.get("envelope") if isinstance(m.get("envelope"), dict) else {}
+        to_field = m.get("to") or m.get("recipients") or envelope.get("to")
+        if isinstance(to_field, list):
+            mail_data["to_email"] = ",".join([(t.get("email") if isinstance(t, dict) else t) for t in to_field])
+        else:
+            mail_data["to_email"] = to_field
+
+        mail_data["subject"] = m.get("subject") or headers.get("subject")
+        mail_data["text"] = m.get("text") or m.get("plain") or ""
+        mail_data["html"] = m.get("html") or ""
+        # threading headers for inbound routing (not stored as columns)
+        mail_data["headers"] = {k: headers.get(k) or m.get(k.replace("-", "_"))
+                                for k in ("in-reply-to", "references", "x-request-id")}
+        # MailerSend's sender checks: spf_check {"code": "+"} is a pass, dkim_check is a bool
+        spf = m.get("spf_check") if isinstance(m.get("spf_check"), dict) else {}
+        mail_data["auth"] = {"spf": spf.get("code") == "+", "dkim": m.get("dkim_check") is True}
+
+    # payloads without a message id are deduplicated on their exact content
+    if not mail_data["message_id"]:
+        mail_data["message_id"] = "sha256:" + hashlib.sha256(raw_body or b"").hexdigest()
+    return mail_data
+
+class _RecentIds:
+    """Thread-safe LRU set of recently ingested message ids."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._ids:
+                self._ids.move_to_end(key)
+                return True
+            return False
+
+    def add(self, key):
+        with self._lock:
+            self._ids[key] = None
+            self._ids.move_to_end(key)
+            while len(self._ids) > self.capacity:
+                self._ids.popitem(last=False)
+
+class InboundBatcher:
+    def __init__(self, batch_size: int = 100, flush_interval: float = 0.5, max_queue: int = 10000,
+                 cache_size: int = 10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.recent = _RecentIds(cache_size)
+        self.stats = {"received": 0, "stored": 0, "duplicates": 0}
+        self._stats_lock = threading.Lock()
+        # callables run (in order) with the newly stored emails after each commit
+        self.stages = []
+        self._stage_executor = None   # runs the stages for store(), created on first use
+        self._stage_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._failures = 0   # consecutive failed batches, for backoff
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, raw_body: bytes) -> bool:
+        """Queue a webhook body without blocking. False when it was not queued; call store() instead."""
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait((raw_body, datetime.datetime.utcnow()))
+            return True
+        except queue.Full:
+            logger.warning("Inbound queue full; storing email synchronously")
+            return False
+
+    def store(self, raw_body: bytes):
+        """
+        Parse and store one body synchronously (writer not running, or backpressure).
+        Raises if not stored. The pipeline stages run afterwards on a background thread.
+        """
+        return self._process([(raw_body, datetime.datetime.utcnow())], defer_stages=True)
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self.stats[name] += delta
+
+    def _run_stages(self, emails):
+        for stage in self.stages:
+            try:
+                stage(emails)
+            except Exception:
+                logger.exception("Inbound pipeline stage %s failed", getattr(stage, "__name__", stage))
+
+    def _defer_stages(self, emails):
+        with self._stage_lock:
+            if self._stage_executor is None:
+                # one thread: stages run in order, as they do on the batcher thread
+                self._stage_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inbound-stages")
+            self._stage_executor.submit(self._run_stages, emails)
+
+    def _insert(self, db, rows):
+        """Insert ignoring duplicates; return the message ids that were actually inserted."""
+        stmt = insert_ignore(db, InboundEmail.__table__)
+        if db.get_bind().dialect.insert_returning:
+            return set(db.execute(stmt.returning(InboundEmail.message_id), rows).scalars())
+        # no INSERT ... RETURNING (MySQL): per-row rowcount
+        return {r["message_id"] for r in rows if db.execute(stmt, [r]).rowcount == 1}
+
+    def _process(self, items, defer_stages=False):
+        """
+        Parse, dedupe and store a batch, then run the pipeline stages (here, or on
+        the stage thread with `defer_stages`). Returns the stored rows (as dicts);
+        raises when the batch could not be stored.
+        """
+        if not items:
+            return []
+        self._count(received=len(items))
+        rows, parsed = {}, {}
+        for raw_body, received_at in items:
+            mail_data = parse_inbound(raw_body)
+            key = mail_data["message_id"]
+            if key in rows or key in self.recent:
+                continue
+            text, text_ref = offload_text(mail_data["text"])
+            html, html_ref = offload_text(mail_data["html"])
+            raw, raw_ref = offload_text(raw_body.decode("utf-8", errors="ignore") if raw_body else None)
+            headers, auth = mail_data.pop("headers"), mail_data.pop("auth")
+            rows[key] = dict(mail_data, id=str(uuid.uuid4()), received_at=received_at, text=text, html=html,
+                             raw_payload=raw, text_ref=text_ref, html_ref=html_ref, raw_ref=raw_ref)
+            # handed to the pipeline stages only
+            parsed[key] = dict(rows[key], headers=headers, auth=auth, text=mail_data["text"], html=mail_data["html"])
+        stored = []
+        with self._write_lock:
+            db = SessionLocal()
+            try:
+                if rows:
+                    # ids already in the table (e.g. ingested before a restart); the unique index covers races
+                    existing = set(db.execute(select(InboundEmail.message_id)
+                                              .where(InboundEmail.message_id.in_(list(rows)))).scalars())
+                    stored = [r for k, r in rows.items() if k not in existing]
+                if stored:
+                    # a concurrent writer may have stored some of these since the check above
+                    inserted = self._insert(db, stored)
+                    stored = [r for r in stored if r["message_id"] in inserted]
+                    for r in stored:
+                        log_audit(request_id=None, actor="mailersend_inbound", action="inbound_received",
+                                  meta=f"msg_id={r['message_id']}, from={r['from_email']}", db=db)
+                    db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+        for key in rows:
+            self.recent.add(key)
+        self._count(stored=len(stored), duplicates=len(items) - len(stored))
+        emails = [parsed[r["message_id"]] for r in stored]
+        if not emails or not self.stages:
+            return stored
+        if defer_stages:
+            self._defer_stages(emails)
+        else:
+            self._run_stages(emails)
+        return stored
+
+    def _process_or_requeue(self, items):
+        """Background path: on failure put the batch back (with backoff) instead of dropping it."""
+        try:
+            self._process([item[:2] for item in items])
+            self._failures = 0
+            return
+        except Exception:
+            logger.exception("Failed to store %d inbound emails; will retry", len(items))
+        self._failures += 1
+        for raw_body, received_at, *attempt in items:
+            attempts = (attempt[0] if attempt else 0) + 1
+            if attempts >= settings.INBOUND_MAX_ATTEMPTS:
+                self._dead_letter(raw_body, attempts)
+                continue
+            try:
+                self._queue.put_nowait((raw_body, received_at, attempts))
+            except queue.Full:
+                self._dead_letter(raw_body, attempts)
+        # back off while the database is failing
+        self._stop.wait(min(self.flush_interval * 2 ** self._failures, 30))
+
+    def _dead_letter(self, raw_body: bytes, attempts: int):
+        try:
+            ref = get_blob_store().put(raw_body or b"")
+            logger.error("Inbound email not stored after %d attempts; raw body kept as blob %s", attempts, ref)
+        except Exception:
+            logger.exception("Inbound email not stored after %d attempts and could not be dead-lettered", attempts)
+
+    def _drain(self, limit: int):
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def flush(self):
+        """Store everything currently buffered."""
+        # terminates: failing items are dead-lettered after INBOUND_MAX_ATTEMPTS
+        while True:
+            items = self._drain(self.batch_size)
+            if not items:
+                return
+            self._process_or_requeue(items)
+
+    def _run(self):
+        while not self._stop.is_set():
+            items = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                items.extend(self._drain(self.batch_size - len(items)))
+                if self._stop.is_set():
+                    break
+            if items:
+                self._process_or_requeue(items)
+        self.flush()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="inbound-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Stop the batcher, store whatever is still buffered and finish deferred stages."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+        with self._stage_lock:
+            executor, self._stage_executor = self._stage_executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+batcher = InboundBatcher(batch_size=settings.INBOUND_BATCH_SIZE,
+                         flush_interval=settings.INBOUND_FLUSH_INTERVAL_SECONDS,
+                         max_queue=settings.INBOUND_QUEUE_MAX,
+                         cache_size=settings.INBOUND_DEDUP_CACHE_SIZE)
+
+def _route_stage(emails):
+    from .inbound_rules import route_inbound
+    route_inbound(emails)
+
+if settings.INBOUND_ROUTING:
+    batcher.stages.append(_route_stage)
+
+def start_inbound_batcher():
+    if settings.INBOUND_ASYNC:
+        batcher.start()
+
+def stop_inbound_batcher():
+    batcher.stop()
+
+atexit.register(stop_inbound_batcher)
@@ -0,0 +1,181 @@
+"""
+Inbound email routing: turns stored inbound emails into request actions.
+
+Rules match on subject, sender and body (the body cut to
+INBOUND_CLASSIFY_MAX_CHARS). Rules are tried in order and each pattern is
+searched at most once per email, only when an earlier rule has not already
+decided. The first rule whose field conditions all match decides the action:
+
+  approve / reject - an approver's reply to an approval email. The request is
+                     found via In-Reply-To/References (<req-<id>.…@…>), the
+                     X-Request-ID header or the [ref:<id>:<secret>] subject
+                     tag. Only applied with INBOUND_EMAIL_APPROVAL on, when
+                     the sender is an approver, SPF and DKIM passed, and the
+                     secret matches an open approve token of that request.
+  file             - a "request access" email from a requester; creates an
+                     AccessRequest for the sender (looked up in Keycloak).
+                     Also needs SPF and DKIM to have passed.
+"""
+import datetime, logging, re
+from .db import SessionLocal
+from .models import AccessRequest, RequestStatus
+from .workflow import apply_decision
+from .tokens import revoke_request_tokens, reply_reference_valid
+from .mailer_utils import log_audit, send_response_email
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# (name, action, needs a request reference, {field: pattern}); first match wins
+DEFAULT_RULES = [
+    ("reply_approve", "approve", True, {"body": r"\A\W*(?:approved?|yes)\b"}),
+    ("reply_reject", "reject", True, {"body": r"\A\W*(?:reject(?:ed)?|den(?:y|ied)|no)\b"}),
+    ("file_request", "file", False, {"subject": r"\b(?:request(?:ing)?\s+access|access\s+request)\b"}),
+]
+
+_UUID = r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+_THREAD_REF_RE = re.compile(rf"<req-({_UUID})\.")
+_SUBJECT_REF_RE = re.compile(rf"\[ref:({_UUID})(?::({_UUID}))?\]")
+_ID_RE = re.compile(rf"^\s*<?({_UUID})>?\s*$")
+_ROLE_RE = re.compile(r"\brole\s*[:=]\s*([\w.\-]+)", re.I)
+
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = [(name, action, needs_ref, {field: re.compile(pattern, re.I) for field, pattern in conds.items()})
+                      for name, action, needs_ref, conds in rules]
+
+    def classify(self, fields: dict, has_ref: bool):
+        """Return (rule name, action) of the first matching rule, or (None, None)."""
+        for name, action, needs_ref, conds in self.rules:
+            if needs_ref == has_ref and all(p.search(fields.get(f) or "") for f, p in conds.items()):
+                return name, action
+        return None, None
+
+rules = RuleSet(DEFAULT_RULES)
+
+def find_request_ref(email: dict):
+    """
+    (request id, secret reply reference) an inbound email refers to. The id comes
+    from threading headers or the subject tag; the secret only from the subject tag.
+    """
+    subject_ref = _SUBJECT_REF_RE.search(email.get("subject") or "")
+    secret = subject_ref.group(2) if subject_ref else None
+    headers = email.get("headers") or {}
+    for key in ("in-reply-to", "references"):
+        m = _THREAD_REF_RE.search(headers.get(key) or "")
+        if m:
+            return m.group(1), secret
+    m = _ID_RE.match(headers.get("x-request-id") or "")
+    if m:
+        return m.group(1), secret
+    return (subject_ref.group(1), secret) if subject_ref else (None, None)
+
+def _body(email: dict) -> str:
+    """Plain body for matching, cut to INBOUND_CLASSIFY_MAX_CHARS (replies put the verdict first)."""
+    limit = settings.INBOUND_CLASSIFY_MAX_CHARS
+    if email.get("text"):
+        return email["text"][:limit]
+    return re.sub(r"<[^>]+>", " ", (email.get("html") or "")[:limit])
+
+def _authenticated(email: dict) -> bool:
+    # From: is trivially forged; the receiving side's checks are what tie it to the domain
+    auth = email.get("auth") or {}
+    return bool(auth.get("spf") and auth.get("dkim"))
+
+def _reject_reason(email: dict, sender: str):
+    if not settings.INBOUND_EMAIL_APPROVAL:
+        return "email approval is disabled"
+    if sender not in settings.APPROVER_EMAILS:
+        return "sender is not an approver"
+    if not _authenticated(email):
+        return "SPF/DKIM did not pass"
+    return None
+
+def _decide(email: dict, request_id: str, secret: str, action: str):
+    sender = (email.get("from_email") or "").lower()
+    reason = _reject_reason(email, sender)
+    if reason:
+        log_audit(request_id, actor=sender or "unknown", action="inbound_ignored",
+                  meta=f"msg_id={email['message_id']}, reason={reason}")
+        return
+    db = SessionLocal()
+    try:
+        # request ids are handed to requesters; the secret only went to the approver
+        if not reply_reference_valid(db, request_id, secret):
+            log_audit(request_id, actor=sender, action="inbound_ignored",
+                      meta=f"msg_id={email['message_id']}, reason=missing or invalid reply reference", db=db)
+            db.commit()
+            return
+        # with the outbox off the response email is sent after commit, outside the write lock
+        req, status_str = apply_decision(db, request_id, action, actor=sender, notify=settings.OUTBOX_ENABLED)
+        if not req or status_str is None:
+            db.rollback()
+            log_audit(request_id, actor=sender, action="inbound_ignored",
+                      meta=f"msg_id={email['message_id']}, reason={'not found' if not req else req.status.value}")
+            return
+        revoke_request_tokens(db, request_id)
+        requester_email, requested_role = req.requester_email, req.requested_role
+        db.commit()
+        logger.info("Request %s %s by email from %s", request_id, status_str, sender)
+        if requester_email and not settings.OUTBOX_ENABLED:
+            send_response_email(requester_email, requested_role, status_str, request_id=request_id)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def _file_request(email: dict, keycloak):
+    sender = email.get("from_email")
+    if not _authenticated(email):
+        # otherwise anyone could file requests (and trigger approval emails) as any Keycloak user
+        log_audit(None, actor=sender or "unknown", action="inbound_ignored",
+                  meta=f"msg_id={email['message_id']}, reason=SPF/DKIM did not pass")
+        return
+    m = _ROLE_RE.search(email.get("subject") or "") or _ROLE_RE.search(_body(email))
+    if not sender or not m:
+        log_audit(None, actor=sender or "unknown", action="inbound_ignored",
+                  meta=f"msg_id={email['message_id']}, reason=no requested role")
+        return
+    user_id = keycloak.get_user_id_by_username_or_email(sender) if keycloak else None
+    if not user_id:
+        log_audit(None, actor=sender, action="inbound_ignored",
+                  meta=f"msg_id={email['message_id']}, reason=unknown Keycloak user")
+        return
+    from .tasks import send_initial_email, next_reminder_at
+    db = SessionLocal()
+    try:
+        req = AccessRequest(keycloak_user_id=user_id, requester_email=sender, requested_role=m.group(1),
+                            meta=f"inbound:{email['message_id']}", status=RequestStatus.pending,
+                            next_reminder_at=next_reminder_at(m.group(1), datetime.datetime.utcnow()))
+        db.add(req)
+        db.flush()
+        request_id = req.id
+        log_audit(request_id, actor=sender, action="request_created", meta=f"via email msg_id={email['message_id']}", db=db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    send_initial_email(request_id, settings.APPROVER_EMAILS[0])
+
+def route_inbound(emails):
+    """Pipeline stage: classify each newly stored email and apply its action."""
+    keycloak = None
+    for email in emails:
+        request_id, secret = find_request_ref(email)
+        fields = {"subject": email.get("subject"), "sender": email.get("from_email"), "body": _body(email)}
+        name, action = rules.classify(fields, has_ref=request_id is not None)
+        if action is None:
+            continue
+        try:
+            if action in ("approve", "reject"):
+                _decide(email, request_id, secret, action)
+            elif action == "file":
+                if keycloak is None and settings.KEYCLOAK_SERVER_URL:
+                    from .keyclock_client import get_keycloak_client
+                    keycloak = get_keycloak_client()
+                _file_request(email, keycloak)
+        except Exception:
+            logger.exception("Inbound rule %s failed for %s", name, email.get("message_id"))
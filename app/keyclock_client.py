@@ -1,11 +1,86 @@
 from keycloak import KeycloakAdmin
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from .config import settings
-import logging
+import datetime, logging, threading, time
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after a TTL. `None` is a valid
+    cached value (negative caching) and may use a shorter TTL.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300, negative_ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key, default=_MISSING):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def set(self, key, value, ttl: float = None):
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, key=_MISSING):
+        """Drop one key, or everything when called without a key."""
+        with self._lock:
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+# shared by every KeycloakClient in the process unless a client is given its own
+_user_cache = TTLCache(maxsize=settings.KEYCLOAK_CACHE_SIZE,
+                       ttl=settings.KEYCLOAK_USER_CACHE_TTL_SECONDS,
+                       negative_ttl=settings.KEYCLOAK_NEGATIVE_CACHE_TTL_SECONDS)
+_role_cache = TTLCache(maxsize=settings.KEYCLOAK_CACHE_SIZE,
+                       ttl=settings.KEYCLOAK_ROLE_CACHE_TTL_SECONDS,
+                       negative_ttl=settings.KEYCLOAK_NEGATIVE_CACHE_TTL_SECONDS)
+
 class KeycloakClient:
-    def __init__(self):
+    """
+    Admin API wrapper. Use get_keycloak_client() for the process-wide instance,
+    which keeps one admin token and one pooled HTTP session for all callers.
+    """
+
+    def __init__(self, kc_admin=None, user_cache=None, role_cache=None):
+        self.user_cache = user_cache if user_cache is not None else _user_cache
+        self.role_cache = role_cache if role_cache is not None else _role_cache
+        self._token_lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+        if kc_admin is not None:
+            self.kc_admin = kc_admin
+            return
+
         # Prefer admin username/password if provided (useful for local testing)
         admin_user = getattr(settings, "KEYCLOAK_ADMIN_USERNAME", None)
         admin_pass = getattr(settings, "KEYCLOAK_ADMIN_PASSWORD", None)
@@ -28,19 +103,149 @@ class KeycloakClient:
             except Exception as e:
                 logger.exception("Failed to initialize KeycloakAdmin using client credentials: %s", e)
                 raise
+        self._tune_connection()
+
+    def _tune_connection(self):
+        """Size the admin session's keep-alive pool for concurrent callers."""
+        session = getattr(self.kc_admin.connection, "_s", None)  # python-keycloak's requests.Session
+        if session is None:
+            return
+        # one retry on a dropped keep-alive connection, for idempotent methods only: a replayed
+        # POST could repeat a user creation or role change that already reached Keycloak
+        retry = Retry(total=1, allowed_methods=Retry.DEFAULT_ALLOWED_METHODS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.KEYCLOAK_POOL_SIZE, max_retries=retry)
+        for prefix in ("https://", "http://"):
+            session.mount(prefix, adapter)
+
+    def _token_due(self) -> bool:
+        expires_at = getattr(getattr(self.kc_admin, "connection", None), "expires_at", None)
+        if expires_at is None:
+            return False
+        margin = datetime.timedelta(seconds=settings.KEYCLOAK_TOKEN_REFRESH_MARGIN_SECONDS)
+        return datetime.datetime.now() >= expires_at - margin
+
+    def _ensure_token(self):
+        """Refresh the admin token ahead of expiry; only one thread refreshes."""
+        if not self._token_due():
+            return
+        with self._token_lock:
+            if self._token_due():
+                self.kc_admin.connection.refresh_token()
+                logger.debug("Keycloak admin token refreshed")
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            expires_at = self.kc_admin.connection.expires_at
+            margin = settings.KEYCLOAK_TOKEN_REFRESH_MARGIN_SECONDS
+            wait = (expires_at - datetime.datetime.now()).total_seconds() - margin
+            if self._stop.wait(max(wait, 1)):
+                return
+            try:
+                self._ensure_token()
+            except Exception as e:
+                logger.warning("Keycloak token refresh failed, retrying: %s", e)
+                self._stop.wait(5)
+
+    def start_token_refresher(self):
+        """Refresh the token in the background so callers never wait for a grant."""
+        if self._refresher is not None or getattr(self.kc_admin.connection, "expires_at", None) is None:
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="keycloak-token-refresh", daemon=True)
+        self._refresher.start()
+
+    def close(self):
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join(5)
+            self._refresher = None
+        session = getattr(getattr(self.kc_admin, "connection", None), "_s", None)
+        if session is not None:
+            session.close()
 
     def get_user_id_by_username_or_email(self, username_or_email):
+        key = (username_or_email or "").lower()
+        user_id = self.user_cache.get(key)
+        if user_id is not _MISSING:
+            return user_id
+        self._ensure_token()
         users = self.kc_admin.get_users({"username": username_or_email}) or []
         if not users:
             users = self.kc_admin.get_users({"email": username_or_email}) or []
-        if not users:
-            return None
-        return users[0]["id"]
+        user_id = users[0]["id"] if users else None
+        # misses are cached too, for KEYCLOAK_NEGATIVE_CACHE_TTL_SECONDS
+        self.user_cache.set(key, user_id)
+        return user_id
+
+    def get_realm_role(self, role_name):
+        role = self.role_cache.get(role_name)
+        if role is not _MISSING:
+            return role
+        self._ensure_token()
+        try:
+            role = self.kc_admin.get_realm_role(role_name)
+        except Exception as e:
+            # python-keycloak raises KeycloakGetError (404) for unknown roles
+            if getattr(e, "response_code", None) != 404:
+                raise
+            role = None
+        self.role_cache.set(role_name, role or None)
+        return role or None
 
     def assign_realm_role(self, user_id, role_name):
-        role = self.kc_admin.get_realm_role(role_name)
-        if not role:
-            raise Exception("role not found")
-        self.kc_admin.assign_realm_role(user_id=user_id, roles=[role])
-        logger.info("Assigned role %s to user %s", role_name, user_id)
+        self.assign_realm_roles(user_id, [role_name])
+
+    def assign_realm_roles(self, user_id, role_names):
+        """Assign several realm roles to one user with a single admin API call."""
+        roles = []
+        for role_name in role_names:
+            role = self.get_realm_role(role_name)
+            if not role:
+                raise Exception(f"role not found: {role_name}")
+            roles.append(role)
+        self._ensure_token()
+        try:
+            self.kc_admin.assign_realm_roles(user_id=user_id, roles=roles)
+        except Exception:
+            # the cached representations may be stale (role deleted or recreated)
+            for role_name in role_names:
+                self.role_cache.invalidate(role_name)
+            raise
+        logger.info("Assigned roles %s to user %s", ", ".join(role_names), user_id)
+
+    def invalidate_user(self, username_or_email=None):
+        if username_or_email is None:
+            self.user_cache.invalidate()
+        else:
+            self.user_cache.invalidate(username_or_email.lower())
+
+    def invalidate_role(self, role_name=None):
+        if role_name is None:
+            self.role_cache.invalidate()
+        else:
+            self.role_cache.invalidate(role_name)
+
+    def cache_stats(self) -> dict:
+        return {"users": dict(self.user_cache.stats, size=len(self.user_cache)),
+                "roles": dict(self.role_cache.stats, size=len(self.role_cache))}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_keycloak_client() -> KeycloakClient:
+    """Process-wide client: one token grant, proactive refresh, shared connection pool."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                client = KeycloakClient()
+                client.start_token_refresher()
+                _client = client
+    return _client
 
+def close_keycloak_client():
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
@@ -1,7 +1,18 @@
 from importlib import import_module
+import threading
 from .config import settings
 
-def get_mailer():
+_async_mailer = None
+_async_lock = threading.Lock()
+
+def get_mailer(asynchronous: bool = False):
+    """
+    Return the configured mailer. By default this is the blocking
+    `send_email(to, subject, html, text, request_id=None)` function; with
+    `asynchronous=True` it is a shared AsyncMailer for use in `async def` code.
+    """
+    if asynchronous:
+        return _get_async_mailer()
     backend = settings.MAILER_BACKEND
     if backend == "mailersend":
         mod = import_module("app.mailers.mailersend_adapter")
@@ -9,3 +20,52 @@ def get_mailer():
         mod = import_module("app.mailer_smtp")
     return mod.send_email
 
+def _get_async_mailer():
+    global _async_mailer
+    with _async_lock:
+        if _async_mailer is None:
+            mod = import_module("app.mailers.async_mailer")
+            if settings.MAILER_BACKEND == "mailersend":
+                _async_mailer = mod.AsyncMailerSendMailer()
+            else:
+                _async_mailer = mod.AsyncSMTPMailer()
+        return _async_mailer
+
+async def close_async_mailer():
+    global _async_mailer
+    with _async_lock:
+        mailer, _async_mailer = _async_mailer, None
+    if mailer is not None:
+        await mailer.aclose()
+
+def _send_each(messages):
+    send = get_mailer()
+    results = []
+    for msg in messages:
+        try:
+            send(msg["to_email"], msg["subject"], msg.get("html_body"), msg.get("text_body"), request_id=msg.get("request_id"))
+            results.append({"ok": True, "error": None})
+        except Exception as e:
+            results.append({"ok": False, "error": str(e) or e.__class__.__name__})
+    return results
+
+def get_batch_mailer(confirmed: bool = False):
+    """
+    Return a callable taking a list of message dicts (to_email, subject, html_body,
+    text_body, request_id) and returning one {"ok", "error"} result per message.
+    Results with a "bulk_email_id" were only accepted; see get_bulk_status_checker().
+    With `confirmed` every result is final: callers that keep no outbox rows have
+    nothing to reconcile a bulk against, so messages are sent one by one.
+    """
+    if settings.MAILER_BACKEND == "mailersend" and not confirmed:
+        return import_module("app.mailers.mailersend_adapter").send_bulk
+    return _send_each
+
+def get_bulk_status_checker():
+    """
+    Return `get_bulk_status(bulk_email_id) -> dict` for backends whose bulk sends
+    are confirmed asynchronously, else None.
+    """
+    if settings.MAILER_BACKEND == "mailersend":
+        return import_module("app.mailers.mailersend_adapter").get_bulk_status
+    return None
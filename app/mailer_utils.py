@@ -1,47 +1,71 @@
-from .db import SessionLocal
 from .models import AuditLog
-import logging
+import logging, uuid
 from .mailer_factory import get_mailer
-import os
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from .templating import render_email
 from .config import settings
 
 
 logger = logging.getLogger(__name__)
 
-def log_audit(request_id, actor, action, meta=None, ip=None, user_agent=None):
-    db = SessionLocal()
-    try:
-        rec = AuditLog(request_id=request_id, actor=actor, action=action, ip=ip or "", user_agent=user_agent or "", meta=str(meta))
-        db.add(rec)
-        db.commit()
-    except Exception:
-        db.rollback()
-        logger.exception("Failed to write audit log")
-    finally:
-        db.close()
+def log_audit(request_id, actor, action, meta=None, ip=None, user_agent=None, db=None):
+    """
+    Record an audit entry. With `db` the record joins the caller's transaction;
+    otherwise it goes to the buffered audit writer (see app.audit).
+    """
+    record = dict(request_id=request_id, actor=actor, action=action, ip=ip or "", user_agent=user_agent or "", meta=str(meta))
+    if db is not None:
+        db.add(AuditLog(**record))
+        return
+    from .audit import sink
+    sink.submit(record)
+
+def request_message_id(request_id, sender_email: str = None) -> str:
+    """
+    Message-ID for mail about a request, e.g. <req-<request_id>.<random>@example.com>.
+    Replies quote it in In-Reply-To, which lets inbound routing find the request.
+    """
+    domain = (sender_email or "").rpartition("@")[2] or "localhost"
+    return f"<req-{request_id}.{uuid.uuid4().hex}@{domain}>"
 
 def _render_response_templates(ctx):
-    here = os.path.join(os.path.dirname(__file__), "templates")
-    env = Environment(loader=FileSystemLoader(here), autoescape=select_autoescape(["html"]))
-    html = env.get_template("response_email.html").render(**ctx)
-    text = env.get_template("response_email.txt").render(**ctx)
-    return html, text
+    return render_email("response_email", ctx)
 
 
 
-def send_response_email(to_email, requested_role, status, request_id=None):
+def _build_response_email(requested_role, status):
     subject = f"Your access request was {status}"
     text = f"Your request for role '{requested_role}' has been {status}."
     html = f"<p>{text}</p>"
+    return subject, html, text
+
+def response_message(to_email, requested_role, status, request_id=None) -> dict:
+    """Response email as a message dict for outbox.submit_batch."""
+    subject, html, text = _build_response_email(requested_role, status)
+    return {"to_email": to_email, "subject": subject, "html_body": html, "text_body": text, "request_id": request_id}
+
+def send_response_email(to_email, requested_role, status, request_id=None, db=None):
+    """With `db`, the outbox row and audit entry join the caller's transaction."""
+    subject, html, text = _build_response_email(requested_role, status)
+
+    try:
+        from .outbox import submit_email
+        submit_email(to_email, subject, html, text, request_id=request_id, db=db)
+        log_audit(request_id=request_id, actor="system", action=f"response_email_{status}", meta=f"to={to_email}", db=db)
+    except Exception as e:
+        logger.exception("Failed to queue response email to %s: %s", to_email, e)
 
+async def send_response_email_async(to_email, requested_role, status, request_id=None):
+    """
+    Event-loop friendly send_response_email: the outbox insert (or, with the outbox
+    disabled, the async mailer) never blocks the loop.
+    """
+    from starlette.concurrency import run_in_threadpool
+    if settings.OUTBOX_ENABLED:
+        await run_in_threadpool(send_response_email, to_email, requested_role, status, request_id=request_id)
+        return
+    subject, html, text = _build_response_email(requested_role, status)
     try:
-        if settings.MAILER_BACKEND == "smtp":
-            from .mailers.smtp_adapter import send_email as mailer
-        else:
-            from .mailers.mailersend_adapter import send_email as mailer
-        mailer(to_email, subject, html, text, request_id=request_id)
-        from .mailer_utils import log_audit
-        log_audit(request_id=request_id, actor="system", action=f"response_email_{status}", meta=f"to={to_email}")
+        await get_mailer(asynchronous=True).send_email(to_email, subject, html, text, request_id=request_id)
+        await run_in_threadpool(log_audit, request_id=request_id, actor="system", action=f"response_email_{status}", meta=f"to={to_email}")
     except Exception as e:
         logger.exception("Failed to send response email to %s: %s", to_email, e)
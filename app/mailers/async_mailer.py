@@ -0,0 +1,79 @@
+# app/mailers/async_mailer.py
+import asyncio, logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional, Protocol
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+class AsyncMailer(Protocol):
+    """Awaitable counterpart of the sync `send_email(to, subject, html, text, request_id=None)` mailers."""
+
+    async def send_email(self, to_email: str, subject: str, html_body: str, text_body: str,
+                         request_id: Optional[str] = None) -> bool: ...
+
+    async def send_bulk(self, messages: List[dict]) -> List[dict]: ...
+
+    async def aclose(self) -> None: ...
+
+class _ExecutorMailer:
+    """
+    Runs a blocking backend on a dedicated, bounded thread pool so coroutines never
+    block the event loop. The pool is sized to the backend's connection pool, so
+    excess sends queue here instead of piling up on sockets.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"mailer-{name}")
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def aclose(self):
+        self._executor.shutdown(wait=False)
+
+class AsyncMailerSendMailer(_ExecutorMailer):
+    """MailerSend over the adapter's shared keep-alive session."""
+
+    def __init__(self):
+        super().__init__("mailersend", settings.MAILERSEND_POOL_SIZE)
+        from . import mailersend_adapter
+        self._backend = mailersend_adapter
+
+    async def send_email(self, to_email, subject, html_body, text_body, request_id=None):
+        return await self._run(self._backend.send_email, to_email, subject, html_body, text_body, request_id=request_id)
+
+    async def send_bulk(self, messages):
+        return await self._run(self._backend.send_bulk, messages)
+
+    async def aclose(self):
+        await super().aclose()
+        self._backend.close_session()
+
+class AsyncSMTPMailer(_ExecutorMailer):
+    """SMTP over the pooled, authenticated sessions from smtp_pool."""
+
+    def __init__(self):
+        super().__init__("smtp", settings.SMTP_POOL_SIZE)
+        from .. import mailer_smtp
+        self._backend = mailer_smtp
+
+    async def send_email(self, to_email, subject, html_body, text_body, request_id=None):
+        return await self._run(self._backend.send_email, to_email, subject, html_body, text_body, request_id=request_id)
+
+    async def send_bulk(self, messages):
+        async def one(msg):
+            try:
+                await self.send_email(msg["to_email"], msg["subject"], msg.get("html_body"), msg.get("text_body"),
+                                      request_id=msg.get("request_id"))
+                return {"ok": True, "error": None}
+            except Exception as e:
+                return {"ok": False, "error": str(e) or e.__class__.__name__}
+        return list(await asyncio.gather(*(one(m) for m in messages)))
+
+    async def aclose(self):
+        await super().aclose()
+        from .smtp_pool import close_pools
+        close_pools()
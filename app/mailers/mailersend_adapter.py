@@ -1,5 +1,6 @@
-import time, logging, requests
-from typing import Optional
+import time, logging, threading, requests
+from requests.adapters import HTTPAdapter
+from typing import Optional, List
 from ..config import settings
 from ..mailer_utils import log_audit
 
@@ -9,11 +10,17 @@ EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
 
 logger = logging.getLogger(__name__)
 MAILERSEND_API_URL = "https://api.mailersend.com/v1/email"
+MAILERSEND_BULK_API_URL = "https://api.mailersend.com/v1/bulk-email"
 MAILERSEND_API_KEY = settings.MAILERSEND_API_KEY
 MAILERSEND_FROM_EMAIL = settings.MAILERSEND_FROM_EMAIL
 MAILERSEND_FROM_NAME = settings.MAILERSEND_FROM_NAME
 MAILERSEND_MAX_RETRIES = settings.MAILERSEND_MAX_RETRIES
 MAILERSEND_RETRY_BACKOFF = settings.MAILERSEND_RETRY_BACKOFF
+MAILERSEND_BULK_MAX_MESSAGES = settings.MAILERSEND_BULK_MAX_MESSAGES
+MAILERSEND_TIMEOUT = (settings.MAILERSEND_CONNECT_TIMEOUT, settings.MAILERSEND_READ_TIMEOUT)
+# statuses that mean "something in this payload is bad": split the batch to isolate it.
+# Anything else (401/403 bad key, 400, ...) would fail every half the same way.
+SPLIT_STATUSES = (413, 422)
 
 if not MAILERSEND_API_KEY or not MAILERSEND_FROM_EMAIL:
     logger.warning("MailerSend not configured. Please set MAILERSEND_API_KEY and MAILERSEND_FROM_EMAIL")
@@ -30,54 +37,219 @@ def _build_payload(to_email: str, subject: str, html_body: str, text_body: str):
 def _ensure_valid_email(email: str) -> bool:
     return bool(email and EMAIL_RE.match(email))
 
-def send_email(to_email: str, subject: str, html_body: str, text_body: str, request_id: Optional[str] = None) -> bool:
-    if not MAILERSEND_API_KEY:
-        raise RuntimeError("MailerSend API key not configured")
-
-    headers = {
+def _headers():
+    return {
         "Authorization": f"Bearer {MAILERSEND_API_KEY}",
         "Content-Type": "application/json",
         "Accept": "application/json"
     }
-    payload = _build_payload(to_email, subject, html_body, text_body)
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_request_count = 0
+
+def _create_session():
+    if settings.MAILERSEND_HTTP2:
+        try:
+            import httpx
+            client = httpx.Client(
+                http2=True,
+                headers=_headers(),
+                timeout=httpx.Timeout(MAILERSEND_TIMEOUT[1], connect=MAILERSEND_TIMEOUT[0]),
+                limits=httpx.Limits(max_connections=settings.MAILERSEND_POOL_SIZE,
+                                    max_keepalive_connections=settings.MAILERSEND_POOL_SIZE),
+            )
+            logger.info("MailerSend using HTTP/2 client")
+            return client
+        except ImportError:
+            logger.warning("MAILERSEND_HTTP2 is set but httpx[http2] is not installed; using HTTP/1.1 keep-alive")
+    session = requests.Session()
+    session.headers.update(_headers())
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.MAILERSEND_POOL_SIZE, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _get_session():
+    """Process-wide keep-alive session; the underlying connection pool is thread-safe."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+def _transport_errors():
+    try:
+        import httpx
+        return (requests.RequestException, httpx.TransportError)
+    except ImportError:
+        return (requests.RequestException,)
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def _count_request():
+    global _request_count
+    with _stats_lock:
+        _request_count += 1
+
+def connection_stats() -> dict:
+    """
+    Connection reuse metrics for the shared session. `reuse_rate` is the share of
+    requests served on an already-open connection (HTTP/1.1 session only).
+    """
+    with _stats_lock:
+        requests_sent = _request_count
+    stats = {"requests": requests_sent, "connections": None, "reuse_rate": None}
+    session = _session
+    if isinstance(session, requests.Session):
+        # both endpoints share one host, hence one urllib3 pool
+        pool = session.get_adapter(MAILERSEND_API_URL).poolmanager.connection_from_url(MAILERSEND_API_URL)
+        stats["connections"] = pool.num_connections
+        stats["reuse_rate"] = (1 - pool.num_connections / requests_sent) if requests_sent else None
+    return stats
+
+def _post_with_retries(url: str, payload, label: str):
+    """
+    POST to MailerSend, retrying connection errors, 429 and 5xx with backoff.
+    Returns the response for 2xx and non-retryable 4xx; raises once retries are exhausted.
+    """
+    session = _get_session()
+    errors = _transport_errors()
     backoff = MAILERSEND_RETRY_BACKOFF
 
     for attempt in range(1, MAILERSEND_MAX_RETRIES + 1):
         try:
-            resp = requests.post(MAILERSEND_API_URL, json=payload, headers=headers, timeout=10)
-        except requests.RequestException as e:
+            _count_request()
+            resp = session.post(url, json=payload, timeout=MAILERSEND_TIMEOUT)
+        except errors as e:
             logger.warning("MailerSend exception (attempt %d): %s", attempt, e)
             if attempt == MAILERSEND_MAX_RETRIES:
-                logger.exception("MailerSend failed permanently for %s", to_email)
+                logger.exception("MailerSend failed permanently for %s", label)
                 raise
             time.sleep(backoff ** attempt)
             continue
 
-        if resp.status_code in (200, 202):
-            log_audit(request_id=request_id, actor="mailersend", action=f"email_sent:{subject}", meta=f"to={to_email}")
-            logger.info("MailerSend delivered email to %s", to_email)
-            return True
-
         if resp.status_code == 429:
             retry_after = resp.headers.get("Retry-After")
             sleep_for = float(retry_after) if retry_after else backoff ** attempt
             logger.warning("MailerSend rate limited (429). Sleeping %s secs", sleep_for)
             time.sleep(sleep_for)
             if attempt == MAILERSEND_MAX_RETRIES:
-                logger.error("MailerSend rate-limit exhausted for %s", to_email)
+                logger.error("MailerSend rate-limit exhausted for %s", label)
                 resp.raise_for_status()
             continue
 
         if 500 <= resp.status_code < 600:
             logger.warning("MailerSend server error %d (attempt %d)", resp.status_code, attempt)
             if attempt == MAILERSEND_MAX_RETRIES:
-                logger.error("MailerSend permanent 5xx for %s", to_email)
+                logger.error("MailerSend permanent 5xx for %s", label)
                 resp.raise_for_status()
             time.sleep(backoff ** attempt)
             continue
 
-        logger.error("MailerSend permanent failure %d: %s", resp.status_code, resp.text)
-        resp.raise_for_status()
+        return resp
 
     raise RuntimeError("MailerSend failed after retries")
 
+def send_email(to_email: str, subject: str, html_body: str, text_body: str, request_id: Optional[str] = None) -> bool:
+    if not MAILERSEND_API_KEY:
+        raise RuntimeError("MailerSend API key not configured")
+
+    payload = _build_payload(to_email, subject, html_body, text_body)
+    resp = _post_with_retries(MAILERSEND_API_URL, payload, to_email)
+
+    if resp.status_code in (200, 202):
+        log_audit(request_id=request_id, actor="mailersend", action=f"email_sent:{subject}", meta=f"to={to_email}")
+        logger.info("MailerSend delivered email to %s", to_email)
+        return True
+
+    logger.error("MailerSend permanent failure %d: %s", resp.status_code, resp.text)
+    resp.raise_for_status()
+    raise RuntimeError(f"MailerSend unexpected status {resp.status_code}")
+
+def _send_single(msg: dict) -> dict:
+    try:
+        send_email(msg["to_email"], msg["subject"], msg.get("html_body"), msg.get("text_body"), request_id=msg.get("request_id"))
+        return {"ok": True, "bulk_email_id": None, "error": None}
+    except Exception as e:
+        return {"ok": False, "bulk_email_id": None, "error": str(e) or e.__class__.__name__}
+
+def _send_chunk(messages: List[dict], indexes: List[int], results: List[Optional[dict]]):
+    if len(indexes) == 1:
+        results[indexes[0]] = _send_single(messages[indexes[0]])
+        return
+
+    payload = [_build_payload(messages[i]["to_email"], messages[i]["subject"],
+                              messages[i].get("html_body"), messages[i].get("text_body")) for i in indexes]
+    try:
+        resp = _post_with_retries(MAILERSEND_BULK_API_URL, payload, f"bulk of {len(indexes)}")
+    except Exception as e:
+        # transport or provider failure on the whole batch: fall back to individual sends
+        logger.warning("MailerSend bulk request failed (%s); falling back to single sends", e)
+        for i in indexes:
+            results[i] = _send_single(messages[i])
+        return
+
+    if resp.status_code in (200, 202):
+        try:
+            bulk_id = resp.json().get("bulk_email_id")
+        except ValueError:
+            bulk_id = None
+        # accepted only: per-message validation results arrive later via get_bulk_status()
+        for position, i in enumerate(indexes):
+            msg = messages[i]
+            results[i] = {"ok": True, "bulk_email_id": bulk_id, "bulk_index": position, "error": None}
+            log_audit(request_id=msg.get("request_id"), actor="mailersend", action=f"email_accepted:{msg['subject']}",
+                      meta=f"to={msg['to_email']} bulk_email_id={bulk_id}")
+        logger.info("MailerSend accepted bulk of %d emails (bulk_email_id=%s)", len(indexes), bulk_id)
+        return
+
+    if resp.status_code not in SPLIT_STATUSES:
+        error = f"MailerSend bulk rejected ({resp.status_code}): {resp.text[:500]}"
+        logger.error(error)
+        for i in indexes:
+            results[i] = {"ok": False, "bulk_email_id": None, "error": error}
+        return
+
+    # the provider rejected the batch (size / validation); split it to isolate bad messages
+    logger.warning("MailerSend rejected bulk of %d (%d): %s; splitting", len(indexes), resp.status_code, resp.text[:500])
+    mid = len(indexes) // 2
+    _send_chunk(messages, indexes[:mid], results)
+    _send_chunk(messages, indexes[mid:], results)
+
+def send_bulk(messages: List[dict]) -> List[dict]:
+    """
+    Send many messages through the bulk-email endpoint.
+
+    Each message is a dict with to_email, subject, html_body, text_body and optional request_id.
+    Returns one result dict per message, in order: {"ok", "bulk_email_id", "error"}.
+    Messages of an accepted bulk also carry "bulk_index", their position in that
+    request; they are only final once get_bulk_status() reports the bulk completed.
+    Batches rejected with 413/422 are split in half until the offending messages are
+    isolated and sent (or failed) individually; other rejections fail the batch.
+    """
+    if not MAILERSEND_API_KEY:
+        raise RuntimeError("MailerSend API key not configured")
+
+    results: List[Optional[dict]] = [None] * len(messages)
+    for start in range(0, len(messages), MAILERSEND_BULK_MAX_MESSAGES):
+        indexes = list(range(start, min(start + MAILERSEND_BULK_MAX_MESSAGES, len(messages))))
+        _send_chunk(messages, indexes, results)
+    return results
+
+def get_bulk_status(bulk_email_id: str) -> dict:
+    """
+    Fetch the provider-side state of a bulk request: "state" ("completed" once
+    processed), "validation_errors" keyed "message.<index>.<field>", and
+    "suppressed_recipients".
+    """
+    resp = _get_session().get(f"{MAILERSEND_BULK_API_URL}/{bulk_email_id}", timeout=MAILERSEND_TIMEOUT)
+    resp.raise_for_status()
+    return resp.json().get("data", {})
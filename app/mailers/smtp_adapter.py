@@ -1,8 +1,9 @@
 # app/mailers/smtp_adapter.py
-import smtplib, ssl
 from email.message import EmailMessage
 import logging
 from ..config import settings
+from .smtp_pool import get_pool
+from ..mailer_utils import request_message_id
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +30,7 @@ def _build_message(to_email: str, subject: str, html: str, text: str, request_id
     # optional headers for traceability
     if request_id:
         msg['X-Request-ID'] = str(request_id)
+        msg['Message-ID'] = request_message_id(request_id, sender_email)
     return msg
 
 def send_email(to_email: str, subject: str, html: str, text: str, request_id=None):
@@ -42,11 +44,8 @@ def send_email(to_email: str, subject: str, html: str, text: str, request_id=Non
 
     msg = _build_message(to_email, subject, html, text, request_id=request_id)
 
-    context = ssl.create_default_context()
     try:
-        with smtplib.SMTP_SSL(host, port, context=context) as server:
-            server.login(user, password)
-            server.send_message(msg)
+        get_pool(host, port, user, password).send_message(msg)
         logger.info("SMTP: sent mail to %s subj=%s", to_email, subject)
     except Exception as e:
         logger.exception("SMTP send failed for %s: %s", to_email, e)
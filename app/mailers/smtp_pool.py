@@ -0,0 +1,167 @@
+# app/mailers/smtp_pool.py
+import smtplib, ssl, threading, time, logging
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# errors that mean the session is gone and the message can safely be retried on a new one
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError, ssl.SSLError)
+
+class _PooledConnection:
+    def __init__(self, server):
+        self.server = server
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.sent = 0
+
+class SMTPConnectionPool:
+    """
+    Keeps authenticated SMTP sessions alive and reuses them across messages.
+
+    At most `max_size` connections are open at once; callers block until one is free.
+    Idle sessions are checked with NOOP before reuse and replaced transparently when
+    the server has dropped them. A session is retired after `max_messages` sends or
+    `max_idle` seconds of inactivity. Sessions use implicit TLS (SMTP_SSL) unless
+    `starttls` is set.
+    """
+
+    def __init__(self, host, port, user, password, max_size=4, max_idle=60.0, max_messages=100,
+                 noop_after=5.0, timeout=30.0, starttls=False):
+        self.host = host
+        self.port = int(port)
+        self.starttls = starttls
+        self.user = user
+        self.password = password
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_messages = max_messages
+        self.noop_after = noop_after
+        self.timeout = timeout
+        self._context = ssl.create_default_context()
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.stats = {"connects": 0, "reused": 0, "noop_failures": 0, "messages": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def snapshot(self) -> dict:
+        """Consistent copy of the counters."""
+        with self._lock:
+            return dict(self.stats)
+
+    def _connect(self):
+        if self.starttls:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            server.starttls(context=self._context)
+        else:
+            server = smtplib.SMTP_SSL(self.host, self.port, context=self._context, timeout=self.timeout)
+        if self.user and self.password:
+            server.login(self.user, self.password)
+        self._count("connects")
+        return _PooledConnection(server)
+
+    def _close(self, conn):
+        try:
+            conn.server.quit()
+        except Exception:
+            try:
+                conn.server.close()
+            except Exception:
+                pass
+
+    def _alive(self, conn):
+        now = time.monotonic()
+        if now - conn.last_used > self.max_idle or conn.sent >= self.max_messages:
+            return False
+        if now - conn.last_used < self.noop_after:
+            return True
+        try:
+            return conn.server.noop()[0] == 250
+        except Exception:
+            self._count("noop_failures")
+            return False
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._connect(), False
+            if self._alive(conn):
+                self._count("reused")
+                return conn, True
+            self._close(conn)
+
+    def send_message(self, msg):
+        self._slots.acquire()
+        try:
+            conn, reused = self._checkout()
+            try:
+                conn.server.send_message(msg)
+            except _CONNECTION_ERRORS:
+                self._close(conn)
+                if not reused:
+                    raise
+                # the pooled session went away between NOOP and send; retry once on a fresh one
+                logger.info("SMTP pooled session to %s dropped, reconnecting", self.host)
+                conn = self._connect()
+                try:
+                    conn.server.send_message(msg)
+                except Exception:
+                    self._close(conn)
+                    raise
+            except smtplib.SMTPRecipientsRefused:
+                # the session itself is still healthy
+                conn.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(conn)
+                raise
+            except Exception:
+                self._close(conn)
+                raise
+            conn.sent += 1
+            conn.last_used = time.monotonic()
+            with self._lock:
+                self.stats["messages"] += 1
+                self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(host=None, port=None, user=None, password=None, starttls=None) -> SMTPConnectionPool:
+    """Return the process-wide pool for the given (or configured) SMTP account."""
+    host = host or settings.SMTP_HOST
+    port = int(port or settings.SMTP_PORT or 465)
+    user = user or settings.SMTP_USER
+    password = password or settings.SMTP_PASS
+    starttls = settings.SMTP_STARTTLS if starttls is None else starttls
+    key = (host, port, user, starttls)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SMTPConnectionPool(host, port, user, password,
+                                      max_size=settings.SMTP_POOL_SIZE,
+                                      max_idle=settings.SMTP_POOL_MAX_IDLE_SECONDS,
+                                      max_messages=settings.SMTP_POOL_MAX_MESSAGES,
+                                      timeout=settings.SMTP_TIMEOUT_SECONDS,
+                                      starttls=starttls)
+            _pools[key] = pool
+        return pool
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
@@ -1,32 +1,38 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import HTMLResponse
 from .config import settings
-from .db import create_tables, SessionLocal
-from .schemas import CreateRequest, CreateResponse
+from .db import migrate_database, SessionLocal
+from .schemas import (CreateRequest, CreateResponse, RequestSummary, RequestPage,
+                      BatchCreateRequest, BatchCreateResponse, BatchItemResult)
 from .models import AccessRequest, RequestStatus
-from .tasks import start_scheduler, send_initial_email
-from .tokens import validate_token_no_mark, mark_token_used
-from .mailer_utils import log_audit
-from .keyclock_client import KeycloakClient
+from .tasks import start_scheduler, stop_scheduler, send_initial_email, build_initial_email, next_reminder_at, reminder_timer
+from .outbox import submit_batch
+from .outbox import start_workers, stop_workers
+from .audit import start_audit_writer, stop_audit_writer
+from .tokens import decode_token, consume_token, token_rejection_reason, revoke_request_tokens
+from .workflow import apply_decision
+from .mailer_utils import log_audit, send_response_email
+from .keyclock_client import close_keycloak_client
 import uvicorn, logging
-from fastapi import FastAPI, Request, HTTPException, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-import os
+from fastapi import FastAPI, Request, HTTPException, Form, Query
+from sqlalchemy import select, insert, tuple_
+from pydantic import ValidationError
+import uuid
+from typing import Optional, Union
+import urllib.parse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from .templating import render, precompile_templates
 import datetime
 import hmac, hashlib, base64
 from fastapi import Header, Request
-from .models import InboundEmail
+from .inbound import batcher, start_inbound_batcher, stop_inbound_batcher
 from .config import settings
-import json
 
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Keycloak Email Approval")
 
-# helper to load templates directory
-_templates_dir = os.path.join(os.path.dirname(__file__), "templates")
-_jinja_env = Environment(loader=FileSystemLoader(_templates_dir), autoescape=select_autoescape(["html", "xml"]))
 
 def _verify_mailersend_signature(secret: str, raw_body: bytes, signature_header: str) -> bool:
     """
@@ -62,10 +68,32 @@ def _verify_mailersend_signature(secret: str, raw_body: bytes, signature_header:
 
 @app.on_event("startup")
 def startup():
-    create_tables()
+    if settings.DB_MIGRATE_ON_STARTUP:
+        migrate_database()
+    if settings.TEMPLATES_PRECOMPILE:
+        precompile_templates()
+    start_audit_writer()
+    start_inbound_batcher()
     start_scheduler()
+    start_workers()
     logger.info("App started and scheduler launched")
 
+@app.on_event("shutdown")
+async def shutdown():
+    await run_in_threadpool(stop_scheduler)
+    await run_in_threadpool(stop_workers)
+    from .mailer_factory import close_async_mailer
+    await close_async_mailer()
+    from .mailers.smtp_pool import close_pools
+    close_pools()
+    if settings.MAILER_BACKEND == "mailersend":
+        from .mailers.mailersend_adapter import close_session
+        close_session()
+    await run_in_threadpool(stop_inbound_batcher)
+    close_keycloak_client()
+    # last, so records from the steps above are flushed too
+    await run_in_threadpool(stop_audit_writer)
+
 @app.post("/api/v1/requests", response_model=CreateResponse)
 def create_request(payload: CreateRequest):
     db = SessionLocal()
@@ -75,61 +103,115 @@ def create_request(payload: CreateRequest):
             requester_email=payload.requester_email,
             requested_role=payload.requested_role,
             meta=str(payload.metadata),
-            status=RequestStatus.pending
+            status=RequestStatus.pending,
+            # reminder still fires if the initial email can't be queued
+            next_reminder_at=next_reminder_at(payload.requested_role, datetime.datetime.utcnow()),
         )
         db.add(req)
         db.commit()
         db.refresh(req)
-        approver_email = "approver@example.com"
+        approver_email = settings.APPROVER_EMAILS[0]
         send_initial_email(req.id, approver_email)
         log_audit(req.id, actor="system", action="request_created", meta=str(payload.dict()))
         return CreateResponse(request_id=req.id, status=req.status.value)
     finally:
         db.close()
 
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+@app.post("/api/v1/requests:batch", response_model=BatchCreateResponse)
+def create_requests_batch(payload: BatchCreateRequest):
+    """
+    File many requests at once. Items are validated individually; the valid ones
+    are inserted with one statement, and their tokens, approval emails (outbox)
+    and audit entries commit in the same transaction. Invalid items are reported
+    in `results` without affecting the others.
+    """
+    if len(payload.items) > settings.REQUEST_BATCH_MAX_ITEMS:
+        raise HTTPException(413, f"at most {settings.REQUEST_BATCH_MAX_ITEMS} items per batch")
+    results, valid = [], []
+    for index, item in enumerate(payload.items):
+        if not isinstance(item, dict):
+            results.append(BatchItemResult(index=index, ok=False, error="item must be a JSON object"))
+            continue
+        try:
+            valid.append((index, CreateRequest.parse_obj(item)))
+        except ValidationError as e:
+            results.append(BatchItemResult(index=index, ok=False, error=_validation_message(e)))
+    if not valid:
+        return BatchCreateResponse(created=0, failed=len(results), results=results)
+
+    now = datetime.datetime.utcnow()
+    approver_email = settings.APPROVER_EMAILS[0]
+    rows = [dict(id=str(uuid.uuid4()),
+                 keycloak_user_id=item.keycloak_user_id,
+                 requester_email=item.requester_email,
+                 requested_role=item.requested_role,
+                 meta=str(item.metadata),
+                 status=RequestStatus.pending,
+                 created_at=now, updated_at=now,
+                 # the approval emails below are queued in this same transaction
+                 last_notified_at=now, notify_count=1,
+                 next_reminder_at=next_reminder_at(item.requested_role, now))
+            for _, item in valid]
+    db = SessionLocal()
+    try:
+        db.execute(insert(AccessRequest), rows)
+        messages = [build_initial_email(AccessRequest(**row), approver_email, db=db) for row in rows]
+        submit_batch(messages, db=db)
+        for row, (_, item) in zip(rows, valid):
+            log_audit(row["id"], actor="system", action="request_created", meta=str(item.dict()), db=db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Batch request creation failed")
+        raise HTTPException(500, "batch insert failed; no requests were created")
+    finally:
+        db.close()
+    reminder_timer.schedule(min(row["next_reminder_at"] for row in rows))
+    results.extend(BatchItemResult(index=index, ok=True, request_id=row["id"], status=RequestStatus.pending.value)
+                   for row, (index, _) in zip(rows, valid))
+    results.sort(key=lambda r: r.index)
+    return BatchCreateResponse(created=len(rows), failed=len(results) - len(rows), results=results)
+
 @app.get("/callback", response_class=HTMLResponse)
 def callback(token: str = None, request: Request = None):
+    """
+    Apply an approve/reject link. Consuming the token, the status transition, the
+    audit entries and the queued response email commit as one transaction. With the
+    outbox off the email is sent after the commit, so no write lock is held during
+    the mailer round trip.
+    """
     if not token:
         raise HTTPException(400, "missing token")
-    payload, err = validate_token_no_mark(token)
+    payload, err = decode_token(token)
     if err:
         raise HTTPException(400, f"token error: {err}")
     request_id = payload.get("request_id")
-    jti = payload.get("jti")
     action = payload.get("action")
     db = SessionLocal()
     try:
-        req = db.query(AccessRequest).filter_by(id=request_id).first()
+        if not consume_token(db, payload):
+            raise HTTPException(400, f"token error: {token_rejection_reason(db, payload)}")
+
+        # Update status and log action (roles are assigned later by app.provisioning)
+        req, status_str = apply_decision(db, request_id, action, actor="approver",
+                                         ip=request.client.host if request.client else None,
+                                         user_agent=request.headers.get("user-agent"),
+                                         notify=settings.OUTBOX_ENABLED)
         if not req:
             raise HTTPException(404, "request not found")
-        if req.status != RequestStatus.pending:
+        if status_str is None:
+            # leave the token unused, as before
+            db.rollback()
             return HTMLResponse(f"<h3>Request already {req.status.value}</h3>")
 
-        # Update status and log action (no Keycloak role assignment)
-        if action == "approve":
-            req.status = RequestStatus.approved
-            log_audit(request_id, actor="approver", action="approved", ip=request.client.host if request.client else None, user_agent=request.headers.get("user-agent"))
-            status_str = "approved"
-        else:
-            req.status = RequestStatus.rejected
-            log_audit(request_id, actor="approver", action="rejected", ip=request.client.host if request.client else None, user_agent=request.headers.get("user-agent"))
-            status_str = "rejected"
-
+        requester_email, requested_role = req.requester_email, req.requested_role
         db.commit()
-
-        # mark token used after success
-        mark_token_used(jti)
-
-        # Send confirmation email to requester
-        try:
-            from .mailer_utils import send_response_email
-            if req.requester_email:
-                send_response_email(to_email=req.requester_email, requested_role=req.requested_role, status=status_str, request_id=req.id)
-        except Exception:
-            # don't fail the callback if email send fails; mailer_utils should log errors
-            pass
-
-        return HTMLResponse(f"<h3>Request {req.status.value}</h3>")
+        if requester_email and not settings.OUTBOX_ENABLED:
+            send_response_email(requester_email, requested_role, status_str, request_id=request_id)
+        return HTMLResponse(f"<h3>Request {status_str}</h3>")
     except HTTPException:
         db.rollback()
         raise
@@ -143,18 +225,112 @@ def callback(token: str = None, request: Request = None):
 def health():
     return {"status": "ok"}
 
-@app.get("/admin/requests", response_class=HTMLResponse)
-def admin_list():
-    """Render inbox of requests"""
+def _encode_cursor(created_at: datetime.datetime, request_id: str) -> str:
+    raw = f"{created_at.isoformat()}|{request_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, request_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.datetime.fromisoformat(created_at), request_id
+    except Exception:
+        raise HTTPException(400, "invalid cursor")
+
+def _is_day(value) -> bool:
+    return isinstance(value, datetime.date) and not isinstance(value, datetime.datetime)
+
+def _parse_when(value: Optional[str], name: str):
+    """Form value -> date (YYYY-MM-DD), datetime (ISO) or None for an empty field."""
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value) if len(value) == 10 else datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(400, f"invalid {name}: {value}")
+
+@app.get("/api/v1/requests", response_model=RequestPage)
+def list_requests(status: Optional[RequestStatus] = None,
+                  role: Optional[str] = None,
+                  requester: Optional[str] = None,
+                  created_from: Optional[Union[datetime.datetime, datetime.date]] = None,
+                  created_to: Optional[Union[datetime.datetime, datetime.date]] = None,
+                  cursor: Optional[str] = None,
+                  limit: int = Query(50, ge=1, le=200)):
+    """
+    List requests newest first with keyset pagination.
+    Pass `next_cursor` from the previous page as `cursor` to continue.
+    `created_from`/`created_to` take a date or a datetime; both ends are inclusive
+    (a `created_to` date covers that whole day).
+    """
+    cols = (AccessRequest.id, AccessRequest.requester_email, AccessRequest.requested_role,
+            AccessRequest.status, AccessRequest.created_at)
+    q = select(*cols)
+    if status is not None:
+        q = q.where(AccessRequest.status == status)
+    if role:
+        q = q.where(AccessRequest.requested_role == role)
+    if requester:
+        q = q.where(AccessRequest.requester_email == requester)
+    if created_from:
+        if _is_day(created_from):
+            created_from = datetime.datetime.combine(created_from, datetime.time.min)
+        q = q.where(AccessRequest.created_at >= created_from)
+    if created_to:
+        if _is_day(created_to):
+            q = q.where(AccessRequest.created_at < datetime.datetime.combine(created_to, datetime.time.min)
+                        + datetime.timedelta(days=1))
+        else:
+            q = q.where(AccessRequest.created_at <= created_to)
+    if cursor:
+        q = q.where(tuple_(AccessRequest.created_at, AccessRequest.id) < tuple_(*_decode_cursor(cursor)))
+    # fetch one extra row to know whether another page exists
+    q = q.order_by(AccessRequest.created_at.desc(), AccessRequest.id.desc()).limit(limit + 1)
+
     db = SessionLocal()
     try:
-        reqs = db.query(AccessRequest).order_by(AccessRequest.created_at.desc()).all()
-        # convert to simple dicts or pass objects; Jinja can access attributes
-        html = _jinja_env.get_template("admin_list.html").render(requests=reqs)
-        return HTMLResponse(html)
+        rows = db.execute(q).all()
     finally:
         db.close()
 
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id)
+    items = [RequestSummary(id=r.id, requester_email=r.requester_email, requested_role=r.requested_role,
+                            status=r.status.value, created_at=r.created_at) for r in rows]
+    return RequestPage(items=items, next_cursor=next_cursor)
+
+@app.get("/admin/requests", response_class=HTMLResponse)
+def admin_list(status: Optional[str] = None,
+               role: Optional[str] = None,
+               requester: Optional[str] = None,
+               created_from: Optional[str] = None,
+               created_to: Optional[str] = None,
+               cursor: Optional[str] = None,
+               limit: int = Query(50, ge=1, le=200)):
+    """
+    Render one page of the inbox, using the same listing as GET /api/v1/requests.
+    Takes raw form values: the filter form submits empty fields and plain dates.
+    """
+    try:
+        status = RequestStatus(status) if status else None
+    except ValueError:
+        raise HTTPException(400, f"invalid status: {status}")
+    created_from = _parse_when(created_from, "created_from")
+    created_to = _parse_when(created_to, "created_to")
+    page = list_requests(status=status, role=role, requester=requester, created_from=created_from,
+                         created_to=created_to, cursor=cursor, limit=limit)
+    filters = {"status": status.value if status else None, "role": role or None, "requester": requester or None,
+               "created_from": created_from.isoformat() if created_from else None,
+               "created_to": created_to.isoformat() if created_to else None}
+    filters = {k: v for k, v in filters.items() if v}
+    next_url = None
+    if page.next_cursor:
+        next_url = "/admin/requests?" + urllib.parse.urlencode({**filters, "cursor": page.next_cursor, "limit": limit})
+    html = render("admin_list.html", requests=page.items, filters=filters, next_url=next_url,
+                  statuses=[s.value for s in RequestStatus])
+    return HTMLResponse(html)
+
 @app.get("/admin/requests/{request_id}", response_class=HTMLResponse)
 def admin_view(request_id: str):
     """Render a single request with full email HTML embedded"""
@@ -163,87 +339,79 @@ def admin_view(request_id: str):
         req = db.query(AccessRequest).filter_by(id=request_id).first()
         if not req:
             raise HTTPException(404, "request not found")
-        # Build email HTML as the same as send_initial_email would produce (fresh tokens not needed)
-        # We can re-create the original email content with approve/reject links (new tokens)
-        from .tokens import create_token_jti
-        approve_token = create_token_jti(req.id, "approve")
-        reject_token = create_token_jti(req.id, "reject")
-        approve_url = f"{settings.APP_BASE}/callback?token={approve_token}"
-        reject_url = f"{settings.APP_BASE}/callback?token={reject_token}"
-        expiry = (datetime.datetime.utcnow() + datetime.timedelta(seconds=settings.TOKEN_EXPIRY_SECONDS)).isoformat()
-        ctx = {"approver_name": None, "requester_email": req.requester_email, "requested_role": req.requested_role, "approve_url": approve_url, "reject_url": reject_url, "expiry_date": expiry}
-        email_html = _jinja_env.get_template("approve_email.html").render(**ctx)
-        html = _jinja_env.get_template("admin_view.html").render(req=req, email_html=email_html)
+        # Same email send_initial_email produces, but in preview mode: no live tokens are minted
+        email_html = build_initial_email(req, approver_email=None, preview=True)["html_body"]
+        html = render("admin_view.html", req=req, email_html=email_html)
         return HTMLResponse(html)
     finally:
         db.close()
 
-@app.post("/admin/requests/{request_id}/action")
-async def admin_action(request_id: str, payload: dict = None, request: Request = None):
+def _apply_admin_action(request_id: str, action: str, ip: str = None, user_agent: str = None):
     """
-    Perform approve/reject action from admin UI.
-    payload = {"action": "approve" or "reject"}
+    Blocking part of admin_action (runs in the threadpool).
+    Returns (response, notification) where notification holds the response-email
+    arguments when the email still has to be sent by the caller.
     """
+    if action not in ("approve", "reject"):
+        return HTMLResponse("invalid action", status_code=400), None
     db = SessionLocal()
     try:
-        req = db.query(AccessRequest).filter_by(id=request_id).first()
+        # with the outbox on, the response email is queued in the same transaction
+        req, status_str = apply_decision(db, request_id, action, actor="admin", ip=ip, user_agent=user_agent,
+                                         notify=settings.OUTBOX_ENABLED)
         if not req:
-            return HTMLResponse("not found", status_code=404)
-        if req.status != RequestStatus.pending:
-            return {"ok": False, "message": "already acted", "status": req.status.value}
-
-        body = None
-        if payload is None:
-            try:
-                body = await request.json()
-            except Exception:
-                body = {}
-        else:
-            body = payload
-
-        action = body.get("action")
-        if action not in ("approve", "reject"):
-            return HTMLResponse("invalid action", status_code=400)
-
-        # Update status and log action (no Keycloak)
-        if action == "approve":
-            req.status = RequestStatus.approved
-            log_audit(req.id, actor="admin", action="approved", ip=request.client.host if request.client else None, user_agent=request.headers.get("user-agent"))
-        else:
-            req.status = RequestStatus.rejected
-            log_audit(req.id, actor="admin", action="rejected", ip=request.client.host if request.client else None, user_agent=request.headers.get("user-agent"))
+            return HTMLResponse("not found", status_code=404), None
+        if status_str is None:
+            db.rollback()
+            return {"ok": False, "message": "already acted", "status": req.status.value}, None
 
+        # mark any existing tokens for this request as used (optional safety)
+        revoke_request_tokens(db, request_id)
         db.commit()
 
-        # mark any existing tokens for this request as used (optional safety)
+        notification = None
+        if req.requester_email and not settings.OUTBOX_ENABLED:
+            notification = {"to_email": req.requester_email, "requested_role": req.requested_role,
+                            "status": status_str, "request_id": req.id}
+        return {"ok": True, "status": status_str}, notification
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@app.post("/admin/requests/{request_id}/action")
+async def admin_action(request_id: str, payload: dict = None, request: Request = None):
+    """
+    Perform approve/reject action from admin UI.
+    payload = {"action": "approve" or "reject"}
+    Database work runs in the threadpool and mail goes through the async mailer path,
+    so the event loop is never blocked.
+    """
+    body = None
+    if payload is None:
         try:
-            from .db import SessionLocal as _SL
-            s2 = _SL()
-            from .models import ApprovalToken
-            toks = s2.query(ApprovalToken).filter(ApprovalToken.request_id == req.id, ApprovalToken.used_at == None).all()
-            for t in toks:
-                t.used_at = datetime.datetime.utcnow()
-            s2.commit()
-            s2.close()
+            body = await request.json()
         except Exception:
-            # non-fatal
-            pass
+            body = {}
+    else:
+        body = payload
+
+    ip = request.client.host if request.client else None
+    result, notification = await run_in_threadpool(_apply_admin_action, request_id, body.get("action"),
+                                                   ip, request.headers.get("user-agent"))
 
-        # send response email to requester
+    # send response email to requester
+    if notification:
         try:
-            from .mailer_utils import send_response_email
-            if req.requester_email:
-                send_response_email(req.requester_email, req.requested_role, "approved" if action == "approve" else "rejected", request_id=req.id)
+            from .mailer_utils import send_response_email_async
+            await send_response_email_async(**notification)
         except Exception:
-            # ignore send failures, already logged inside send_response_email
+            # ignore send failures, already logged inside send_response_email_async
             pass
 
-        return {"ok": True, "status": req.status.value}
-    finally:
-        db.close()
-        
-        
-        
+    return result
+
 @app.get("/", response_class=HTMLResponse)
 def root():
     """
@@ -298,79 +466,17 @@ async def mailersend_inbound(request: Request, signature: str = Header(None, con
     if secret:
         sig_header = signature or request.headers.get("Signature") or request.headers.get("signature")
         if not sig_header or not _verify_mailersend_signature(secret, raw_body, sig_header):
-            return {"ok": False, "error": "invalid signature"}, 400
+            return JSONResponse({"ok": False, "error": "invalid signature"}, status_code=400)
 
+    # ack immediately; parsing, dedupe and persistence happen in the inbound batcher
+    if batcher.submit(raw_body):
+        return {"ok": True, "queued": True}
     try:
-        payload = await request.json()
+        await run_in_threadpool(batcher.store, raw_body)
     except Exception:
-        # if JSON parse fails, still save raw payload
-        payload = None
-
-    # Payload shape: MailerSend inbound JSON uses keys like "from", "to", "subject", "text", "html", "message_id".
-    # Be defensive when extracting fields.
-    mail_data = {}
-    if isinstance(payload, dict):
-        # Some payloads include top-level 'mail' object (depends on webhook type). Try common patterns.
-        if "mail" in payload and isinstance(payload["mail"], dict):
-            m = payload["mail"]
-        else:
-            m = payload
-
-        # Try several likely keys
-        mail_data["message_id"] = m.get("message_id") or m.get("Message-Id") or m.get("headers", {}).get("message-id")
-        # 'from' may be dict or string
-        frm = m.get("from") or {}
-        if isinstance(frm, dict):
-            mail_data["from_email"] = frm.get("email") or frm.get("address")
-            mail_data["from_name"] = frm.get("name")
-        else:
-            # parse "Name <email@example.com>"
-            mail_data["from_email"] = frm
-            mail_data["from_name"] = None
-
-        # recipients
-        to_field = m.get("to") or m.get("recipients") or m.get("envelope", {}).get("to")
-        if isinstance(to_field, list):
-            mail_data["to_email"] = ",".join([ (t.get("email") if isinstance(t, dict) else t) for t in to_field ])
-        else:
-            mail_data["to_email"] = to_field
-
-        mail_data["subject"] = m.get("subject") or m.get("headers", {}).get("subject")
-        mail_data["text"] = m.get("text") or m.get("plain") or ""
-        mail_data["html"] = m.get("html") or ""
-    else:
-        mail_data = {"message_id": None, "from_email": None, "from_name": None, "to_email": None, "subject": None, "text": None, "html": None}
-
-    # Save into DB
-    db = SessionLocal()
-    try:
-        rec = InboundEmail(
-            message_id = mail_data.get("message_id"),
-            from_email  = mail_data.get("from_email"),
-            from_name   = mail_data.get("from_name"),
-            to_email    = mail_data.get("to_email"),
-            subject     = mail_data.get("subject"),
-            text        = mail_data.get("text"),
-            html        = mail_data.get("html"),
-            raw_payload = json.dumps(payload) if payload is not None else raw_body.decode("utf-8", errors="ignore")
-        )
-        db.add(rec)
-        db.commit()
-        db.refresh(rec)
-
-        # Optional: create an AccessRequest automatically when inbound email matches some pattern
-        # e.g., if subject contains "Request access" or sender is a known user — implement here if desired.
-
-        # Log audit
-        from .mailer_utils import log_audit
-        log_audit(request_id=None, actor="mailersend_inbound", action="inbound_received", meta=f"msg_id={rec.message_id}, from={rec.from_email}")
-
-        return {"ok": True, "id": rec.id}
-    except Exception as e:
-        db.rollback()
-        return {"ok": False, "error": str(e)}, 500
-    finally:
-        db.close()
+        # not stored: a 5xx makes MailerSend retry the delivery
+        return JSONResponse({"ok": False, "error": "could not store email"}, status_code=503)
+    return {"ok": True, "queued": False}
 
 
 if __name__ == "__main__":
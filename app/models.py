@@ -1,5 +1,5 @@
 import datetime, uuid, enum
-from sqlalchemy import Column, String, DateTime, Integer, Text, Enum, ForeignKey
+from sqlalchemy import Column, String, DateTime, Integer, Text, Enum, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from .db import Base
 
@@ -22,6 +22,30 @@ class AccessRequest(Base):
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     last_notified_at = Column(DateTime, nullable=True)
     notify_count = Column(Integer, default=0)
+    next_reminder_at = Column(DateTime, nullable=True)
+    # Keycloak role assignment for approved requests (see app.provisioning)
+    provisioned_at = Column(DateTime, nullable=True)
+    provision_attempts = Column(Integer, default=0)
+    provision_next_at = Column(DateTime, nullable=True)
+    provision_error = Column(Text, nullable=True)
+    provision_lease_owner = Column(String(36), nullable=True)   # claim of the run working on it
+    # reminder sweep lease (SQLite; Postgres/MySQL use row locks instead)
+    reminder_lease_owner = Column(String(36), nullable=True)
+    reminder_lease_until = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # reminder sweep: equality on status, keyset range on (created_at, id)
+        Index("ix_access_requests_status_created_id", "status", "created_at", "id"),
+        # admin inbox ordering
+        Index("ix_access_requests_created_id", "created_at", "id"),
+        # partial: the column is NULL outside a sweep, and a full index on it looks useless to the planner
+        Index("ix_access_requests_reminder_lease_owner", "reminder_lease_owner",
+              sqlite_where=reminder_lease_owner.isnot(None), postgresql_where=reminder_lease_owner.isnot(None)),
+        # reminder timer: equality on status, range/min on next_reminder_at
+        Index("ix_access_requests_status_next_reminder", "status", "next_reminder_at"),
+        # provisioning: equality on (status, provisioned_at IS NULL), rows already in (updated_at, id) order
+        Index("ix_access_requests_provision_due", "status", "provisioned_at", "updated_at", "id"),
+    )
 
 class ApprovalToken(Base):
     __tablename__ = "approval_tokens"
@@ -34,6 +58,25 @@ class ApprovalToken(Base):
 
     request = relationship("AccessRequest")
 
+    __table_args__ = (
+        Index("ix_approval_tokens_request_used", "request_id", "used_at"),
+        # token compaction
+        Index("ix_approval_tokens_expires_at", "expires_at"),
+        Index("ix_approval_tokens_used_at", "used_at"),
+    )
+
+class ConsumedToken(Base):
+    """Single-use ledger for stateless tokens (TOKEN_MODE=stateless); pruned once tokens expire."""
+    __tablename__ = "consumed_tokens"
+    jti = Column(String(64), primary_key=True)
+    request_id = Column(String(36), nullable=True)
+    consumed_at = Column(DateTime, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_consumed_tokens_expires_at", "expires_at"),
+    )
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -45,6 +88,11 @@ class AuditLog(Base):
     meta = Column(Text, nullable=True)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_audit_logs_request_timestamp", "request_id", "timestamp"),
+        Index("ix_audit_logs_timestamp", "timestamp"),
+    )
+
 class InboundEmail(Base):
     __tablename__ = "inbound_emails"
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -56,4 +104,63 @@ class InboundEmail(Base):
     text = Column(Text, nullable=True)
     html = Column(Text, nullable=True)
     received_at = Column(DateTime, default=datetime.datetime.utcnow)
-    raw_payload = Column(Text, nullable=True) 
\ No newline at end of file
+    raw_payload = Column(Text, nullable=True)
+    # sha256 refs into the blob store; when set, the matching inline column is empty
+    # indexed for blob garbage collection (is a ref still in use?)
+    text_ref = Column(String(64), nullable=True, index=True)
+    html_ref = Column(String(64), nullable=True, index=True)
+    raw_ref = Column(String(64), nullable=True, index=True)
+
+    @property
+    def text_body(self):
+        from .blobstore import load_text
+        return load_text(self.text, self.text_ref)
+
+    @property
+    def html_body(self):
+        from .blobstore import load_text
+        return load_text(self.html, self.html_ref)
+
+    @property
+    def raw(self):
+        from .blobstore import load_text
+        return load_text(self.raw_payload, self.raw_ref)
+
+    __table_args__ = (
+        Index("ix_inbound_emails_message_id", "message_id", unique=True),
+        Index("ix_inbound_emails_received_at", "received_at"),
+    )
+
+class OutboxStatus(str, enum.Enum):
+    pending = "pending"
+    sending = "sending"
+    accepted = "accepted"   # taken by the provider's bulk endpoint; per-message verdict still pending
+    sent = "sent"
+    failed = "failed"
+
+class OutboundEmail(Base):
+    __tablename__ = "outbound_emails"
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    request_id = Column(String(36), nullable=True)
+    to_email = Column(String(256), nullable=False)
+    subject = Column(String(512), nullable=False)
+    html = Column(Text, nullable=True)
+    text = Column(Text, nullable=True)
+    status = Column(Enum(OutboxStatus), default=OutboxStatus.pending, nullable=False)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow)
+    locked_by = Column(String(36), nullable=True)           # claim token of the worker batch
+    locked_until = Column(DateTime, nullable=True)          # lease; expired leases are re-claimed
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    # MailerSend bulk request this message went out in, and its position in that request
+    bulk_email_id = Column(String(64), nullable=True)
+    bulk_index = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbound_emails_status_next_attempt", "status", "next_attempt_at"),
+        # partial, like the reminder lease index: only in-flight rows carry a claim
+        Index("ix_outbound_emails_locked_by", "locked_by",
+              sqlite_where=locked_by.isnot(None), postgresql_where=locked_by.isnot(None)),
+    )
@@ -0,0 +1,431 @@
+"""
+Persistent outbound email queue.
+
+Request handlers call submit_email(), which only inserts a row into
+outbound_emails. A pool of worker threads claims due rows in batches,
+hands them to the configured mailer and records the outcome, retrying
+failed sends with exponential backoff.
+
+Messages a provider only accepted in bulk (MailerSend answers 202 with a
+bulk_email_id) are stored as `accepted` with that id. reconcile_bulk() later
+reads the bulk status and marks each message sent, or failed when the
+provider reported a validation error or suppression for it, or when the bulk
+is still unconfirmed OUTBOX_BULK_MAX_AGE_HOURS after the message was queued.
+
+Bodies carry live approve/reject links, so they are cleared once a message
+is handed to the provider or given up on, and prune_outbox() deletes settled
+rows after OUTBOX_RETENTION_DAYS.
+"""
+import re
+import datetime, logging, threading, uuid
+from sqlalchemy import event, update, delete, or_, and_
+from .db import SessionLocal
+from .models import OutboundEmail, OutboxStatus
+from .mailer_factory import get_mailer, get_batch_mailer, get_bulk_status_checker
+from .mailer_utils import log_audit
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# bodies hold bearer approve/reject links; nothing reads them after the provider has the message
+_CLEARED_BODIES = {"html": None, "text": None}
+_SETTLED = (OutboxStatus.sent, OutboxStatus.failed)
+
+_wake = threading.Event()
+_stop = threading.Event()
+_workers = []
+
+def _new_row(to_email, subject, html_body, text_body, request_id=None):
+    return OutboundEmail(
+        id=str(uuid.uuid4()),
+        request_id=request_id,
+        to_email=to_email,
+        subject=subject,
+        html=html_body,
+        text=text_body,
+        status=OutboxStatus.pending,
+        attempts=0,
+        next_attempt_at=datetime.datetime.utcnow(),
+    )
+
+def enqueue_email(to_email: str, subject: str, html_body: str, text_body: str, request_id: str = None, db=None) -> str:
+    """
+    Insert a message into the outbox and return its id.
+    When `db` is given the row joins the caller's transaction and the caller commits.
+    """
+    rec = _new_row(to_email, subject, html_body, text_body, request_id=request_id)
+    rec_id = rec.id
+    if db is not None:
+        db.add(rec)
+        _after_commit(db, _wake.set)
+        return rec_id
+    db = SessionLocal()
+    try:
+        db.add(rec)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    _wake.set()
+    return rec_id
+
+def _run_deferred(session):
+    sends, session.info["deferred_sends"] = session.info.get("deferred_sends", []), []
+    for send in sends:
+        try:
+            send()
+        except Exception:
+            logger.exception("Sending mail after commit failed")
+
+def _drop_deferred(session):
+    session.info["deferred_sends"] = []
+
+def _after_commit(db, send):
+    """
+    Run `send` once `db` commits (dropped on rollback). With the outbox off, mail for
+    a caller's transaction goes out only after its data is durable, and the mailer
+    round trip never runs while the transaction holds write locks. With the outbox on,
+    the workers are woken this way, once the rows they would claim are visible.
+    """
+    if "deferred_sends" not in db.info:
+        event.listen(db, "after_commit", _run_deferred)
+        event.listen(db, "after_rollback", _drop_deferred)
+        db.info["deferred_sends"] = []
+    db.info["deferred_sends"].append(send)
+
+def submit_email(to_email: str, subject: str, html_body: str, text_body: str, request_id: str = None, db=None):
+    """
+    Queue a message for the workers, or send it inline when OUTBOX_ENABLED is off
+    (after `db` commits, when given).
+    """
+    if settings.OUTBOX_ENABLED:
+        return enqueue_email(to_email, subject, html_body, text_body, request_id=request_id, db=db)
+    send = lambda: get_mailer()(to_email, subject, html_body, text_body, request_id=request_id)
+    if db is not None:
+        _after_commit(db, send)
+    else:
+        send()
+    return None
+
+def submit_batch(messages, db=None):
+    """
+    Queue several messages at once (one transaction), or send them when OUTBOX_ENABLED
+    is off (after `db` commits, when given). Messages are dicts with to_email, subject,
+    html_body, text_body and optional request_id. Without outbox rows there is nothing
+    to reconcile a bulk against, so that path sends through a confirming mailer.
+    """
+    if not settings.OUTBOX_ENABLED:
+        if db is None:
+            return get_batch_mailer(confirmed=True)(messages)
+        messages = list(messages)
+        _after_commit(db, lambda: get_batch_mailer(confirmed=True)(messages))
+        return []
+    rows = [_new_row(m["to_email"], m["subject"], m.get("html_body"), m.get("text_body"), request_id=m.get("request_id"))
+            for m in messages]
+    ids = [r.id for r in rows]
+    if db is not None:
+        db.add_all(rows)
+        _after_commit(db, _wake.set)
+        return ids
+    db = SessionLocal()
+    try:
+        db.add_all(rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    _wake.set()
+    return ids
+
+def _claim_batch(limit: int):
+    """
+    Atomically lease up to `limit` due messages. The conditional UPDATE makes
+    the claim safe across threads and processes sharing the database.
+    """
+    now = datetime.datetime.utcnow()
+    claim = str(uuid.uuid4())
+    due = or_(
+        and_(OutboundEmail.status == OutboxStatus.pending, OutboundEmail.next_attempt_at <= now),
+        and_(OutboundEmail.status == OutboxStatus.sending, OutboundEmail.locked_until < now),
+    )
+    db = SessionLocal()
+    try:
+        ids = [row.id for row in db.query(OutboundEmail.id).filter(due).order_by(OutboundEmail.next_attempt_at).limit(limit)]
+        if not ids:
+            return []
+        db.execute(
+            update(OutboundEmail)
+            .where(OutboundEmail.id.in_(ids), due)
+            .values(status=OutboxStatus.sending, locked_by=claim,
+                    locked_until=now + datetime.timedelta(seconds=settings.OUTBOX_LEASE_SECONDS))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        rows = db.query(OutboundEmail).filter(OutboundEmail.locked_by == claim).all()
+        db.expunge_all()
+        return rows
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def _record_result(msg: OutboundEmail, error: str = None, bulk_email_id: str = None, bulk_index: int = None):
+    now = datetime.datetime.utcnow()
+    attempts = (msg.attempts or 0) + 1
+    if error is None and bulk_email_id:
+        values = {"status": OutboxStatus.accepted, "last_error": None, "bulk_email_id": bulk_email_id,
+                  "bulk_index": bulk_index,
+                  "next_attempt_at": now + datetime.timedelta(seconds=settings.OUTBOX_BULK_CHECK_INTERVAL_SECONDS)}
+    elif error is None:
+        values = {"status": OutboxStatus.sent, "sent_at": now, "last_error": None}
+    elif attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        values = {"status": OutboxStatus.failed, "last_error": error}
+        logger.error("Outbox message %s to %s failed permanently: %s", msg.id, msg.to_email, error)
+    else:
+        delay = settings.OUTBOX_RETRY_BACKOFF ** attempts
+        values = {"status": OutboxStatus.pending, "last_error": error,
+                  "next_attempt_at": now + datetime.timedelta(seconds=delay)}
+        logger.warning("Outbox message %s failed (attempt %d), retrying in %.1fs: %s", msg.id, attempts, delay, error)
+    if values["status"] != OutboxStatus.pending:
+        values.update(_CLEARED_BODIES)
+    values.update(attempts=attempts, locked_by=None, locked_until=None)
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(OutboundEmail)
+            .where(OutboundEmail.id == msg.id, OutboundEmail.locked_by == msg.locked_by)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to record outbox result for %s", msg.id)
+    finally:
+        db.close()
+
+def process_batch(limit: int = None) -> int:
+    """Claim and deliver one batch of due messages. Returns the number processed."""
+    batch = _claim_batch(limit or settings.OUTBOX_BATCH_SIZE)
+    if not batch:
+        return 0
+    messages = [{"to_email": m.to_email, "subject": m.subject, "html_body": m.html, "text_body": m.text,
+                 "request_id": m.request_id} for m in batch]
+    try:
+        results = get_batch_mailer()(messages)
+    except Exception as e:
+        results = [{"ok": False, "error": str(e) or e.__class__.__name__}] * len(batch)
+    for msg, result in zip(batch, results):
+        _record_result(msg, error=None if result["ok"] else result["error"],
+                       bulk_email_id=result.get("bulk_email_id"), bulk_index=result.get("bulk_index"))
+    return len(batch)
+
+_BULK_ERROR_KEY_RE = re.compile(r"^message\.(\d+)\.")
+
+def _bulk_failures(status: dict) -> dict:
+    """bulk_index -> error text, from a bulk status' validation errors."""
+    failures = {}
+    for key, messages in (status.get("validation_errors") or {}).items():
+        m = _BULK_ERROR_KEY_RE.match(key)
+        if m:
+            text = "; ".join(messages) if isinstance(messages, list) else str(messages)
+            failures.setdefault(int(m.group(1)), []).append(f"{key}: {text}")
+    return {i: "; ".join(errors) for i, errors in failures.items()}
+
+def _suppressed_emails(status: dict) -> set:
+    """Recipient addresses the provider suppressed (entries are strings or dicts with an email)."""
+    found = set()
+    def walk(value):
+        if isinstance(value, str) and "@" in value:
+            found.add(value.lower())
+        elif isinstance(value, dict):
+            for v in value.values():
+                walk(v)
+        elif isinstance(value, list):
+            for v in value:
+                walk(v)
+    walk(status.get("suppressed_recipients"))
+    return found
+
+def _claim_accepted(limit: int):
+    """Lease accepted messages whose bulk is due for a status check."""
+    now = datetime.datetime.utcnow()
+    claim = str(uuid.uuid4())
+    due = and_(OutboundEmail.status == OutboxStatus.accepted, OutboundEmail.next_attempt_at <= now,
+               or_(OutboundEmail.locked_until.is_(None), OutboundEmail.locked_until < now))
+    db = SessionLocal()
+    try:
+        ids = [row.id for row in db.query(OutboundEmail.id).filter(due).order_by(OutboundEmail.next_attempt_at).limit(limit)]
+        if not ids:
+            return []
+        db.execute(
+            update(OutboundEmail)
+            .where(OutboundEmail.id.in_(ids), due)
+            .values(locked_by=claim, locked_until=now + datetime.timedelta(seconds=settings.OUTBOX_LEASE_SECONDS))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        rows = db.query(OutboundEmail).filter(OutboundEmail.locked_by == claim).all()
+        db.expunge_all()
+        return rows
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def _finish_accepted(msg: OutboundEmail, values: dict):
+    if "status" in values:
+        values.update(_CLEARED_BODIES)
+    values.update(locked_by=None, locked_until=None)
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(OutboundEmail)
+            .where(OutboundEmail.id == msg.id, OutboundEmail.locked_by == msg.locked_by)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to record bulk status for %s", msg.id)
+    finally:
+        db.close()
+
+def _fail_accepted(msg: OutboundEmail, bulk_id: str, error: str):
+    _finish_accepted(msg, {"status": OutboxStatus.failed, "last_error": error})
+    logger.error("Outbox message %s to %s failed in bulk %s: %s", msg.id, msg.to_email, bulk_id, error)
+    log_audit(request_id=msg.request_id, actor="mailersend", action=f"email_failed:{msg.subject}",
+              meta=f"to={msg.to_email} bulk_email_id={bulk_id} error={error}")
+
+def _check_later(msgs, bulk_id: str, reason: str, now: datetime.datetime) -> int:
+    """
+    Schedule another status check, or fail the messages queued more than
+    OUTBOX_BULK_MAX_AGE_HOURS ago. Returns the number failed.
+    """
+    later = {"next_attempt_at": now + datetime.timedelta(seconds=settings.OUTBOX_BULK_CHECK_INTERVAL_SECONDS)}
+    give_up_before = now - datetime.timedelta(hours=settings.OUTBOX_BULK_MAX_AGE_HOURS)
+    failed = 0
+    for msg in msgs:
+        if msg.created_at is not None and msg.created_at < give_up_before:
+            _fail_accepted(msg, bulk_id, f"bulk not confirmed after {settings.OUTBOX_BULK_MAX_AGE_HOURS}h ({reason})")
+            failed += 1
+        else:
+            _finish_accepted(msg, dict(later))
+    return failed
+
+def reconcile_bulk(limit: int = None) -> int:
+    """
+    Check the provider's status of accepted bulk messages. Completed bulks mark each
+    message sent, or failed when it has a validation error or was suppressed; bulks
+    still processing, or whose status cannot be read, are checked again later until
+    OUTBOX_BULK_MAX_AGE_HOURS, then failed. Returns the number of messages settled.
+    """
+    batch = _claim_accepted(limit or settings.OUTBOX_BATCH_SIZE)
+    if not batch:
+        return 0
+    get_status = get_bulk_status_checker()
+    now = datetime.datetime.utcnow()
+    by_bulk = {}
+    for msg in batch:
+        by_bulk.setdefault(msg.bulk_email_id, []).append(msg)
+    settled = 0
+    for bulk_id, msgs in by_bulk.items():
+        if get_status is None:
+            # backend switched away from the provider that accepted the bulk; nothing to ask
+            for msg in msgs:
+                _finish_accepted(msg, {"status": OutboxStatus.sent, "sent_at": now})
+            settled += len(msgs)
+            continue
+        try:
+            status = get_status(bulk_id)
+        except Exception as e:
+            logger.warning("Bulk status check for %s failed; retrying later: %s", bulk_id, e)
+            settled += _check_later(msgs, bulk_id, f"status check failed: {e}", now)
+            continue
+        if status.get("state") != "completed":
+            settled += _check_later(msgs, bulk_id, f"state {status.get('state')}", now)
+            continue
+        failures, suppressed = _bulk_failures(status), _suppressed_emails(status)
+        for msg in msgs:
+            error = failures.get(msg.bulk_index)
+            if error is None and msg.to_email.lower() in suppressed:
+                error = "recipient suppressed by provider"
+            if error is None:
+                _finish_accepted(msg, {"status": OutboxStatus.sent, "sent_at": now, "last_error": None})
+                continue
+            # the provider refused this exact message: resending cannot help
+            _fail_accepted(msg, bulk_id, error)
+        settled += len(msgs)
+    return settled
+
+def prune_outbox(now: datetime.datetime = None) -> int:
+    """
+    Retention job: delete sent/failed messages older than OUTBOX_RETENTION_DAYS, in
+    chunks, and clear bodies still stored on settled rows. Returns rows deleted.
+    """
+    now = now or datetime.datetime.utcnow()
+    deleted = 0
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(OutboundEmail)
+            .where(OutboundEmail.status.in_(_SETTLED + (OutboxStatus.accepted,)),
+                   or_(OutboundEmail.html.isnot(None), OutboundEmail.text.isnot(None)))
+            .values(**_CLEARED_BODIES)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        if not settings.OUTBOX_RETENTION_DAYS:
+            return 0
+        cutoff = now - datetime.timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+        stale = and_(OutboundEmail.status.in_(_SETTLED), OutboundEmail.created_at < cutoff)
+        while True:
+            ids = [row.id for row in db.query(OutboundEmail.id).filter(stale).limit(settings.ARCHIVE_CHUNK_SIZE)]
+            if not ids:
+                break
+            db.execute(delete(OutboundEmail).where(OutboundEmail.id.in_(ids), stale)
+                       .execution_options(synchronize_session=False))
+            db.commit()
+            deleted += len(ids)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    if deleted:
+        logger.info("Pruned %d settled outbox messages", deleted)
+    return deleted
+
+def _worker_loop():
+    while not _stop.is_set():
+        try:
+            if process_batch() + reconcile_bulk():
+                continue
+        except Exception:
+            logger.exception("Outbox worker error")
+        _wake.wait(settings.OUTBOX_POLL_INTERVAL_SECONDS)
+        _wake.clear()
+
+def start_workers(count: int = None):
+    if not settings.OUTBOX_ENABLED or _workers:
+        return
+    _stop.clear()
+    for i in range(count or settings.OUTBOX_WORKERS):
+        t = threading.Thread(target=_worker_loop, name=f"outbox-worker-{i}", daemon=True)
+        t.start()
+        _workers.append(t)
+    logger.info("Started %d outbox workers", len(_workers))
+
+def stop_workers(timeout: float = 10):
+    _stop.set()
+    _wake.set()
+    for t in _workers:
+        t.join(timeout)
+    _workers.clear()
@@ -0,0 +1,134 @@
+"""
+Keycloak provisioning for approved requests.
+
+Approving a request (link, admin UI or email reply) only changes its status;
+this scheduled worker does the Keycloak role assignment off the HTTP path.
+Each run picks a batch of approved, unprovisioned requests, resolves every
+role they need once, and assigns all of a user's roles with one admin call.
+Failures are retried with exponential backoff; after PROVISION_MAX_ATTEMPTS,
+or on a permanent error (unknown role), the request moves to `error`.
+
+Every worker process runs this job, so a batch is claimed first: one
+conditional UPDATE stamps provision_lease_owner and pushes provision_next_at
+PROVISION_LEASE_SECONDS ahead, which hides the rows from other runs. The
+outcome replaces that time; a crashed run's rows become due again when it
+passes. (Unlike the reminder sweep, row locks are not used on Postgres/MySQL:
+they would be held across the Keycloak calls.)
+"""
+import datetime, logging, uuid
+from collections import defaultdict
+from sqlalchemy import and_, or_, select, update
+from .db import SessionLocal
+from .models import AccessRequest, RequestStatus
+from .mailer_utils import log_audit
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+def _due_filter(now: datetime.datetime):
+    # served by ix_access_requests_provision_due: (status, provisioned_at) equality, then (updated_at, id) order
+    return and_(AccessRequest.status == RequestStatus.approved,
+                AccessRequest.provisioned_at.is_(None),
+                or_(AccessRequest.provision_next_at.is_(None), AccessRequest.provision_next_at <= now))
+
+def _claim(db, now: datetime.datetime, limit: int):
+    """Lease up to `limit` due requests for this run and return them."""
+    claim = str(uuid.uuid4())
+    due = _due_filter(now)
+    ids = db.execute(
+        select(AccessRequest.id).where(due).order_by(AccessRequest.updated_at, AccessRequest.id).limit(limit)
+    ).scalars().all()
+    if not ids:
+        return []
+    db.execute(
+        update(AccessRequest)
+        .where(AccessRequest.id.in_(ids), due)
+        .values(provision_lease_owner=claim,
+                provision_next_at=now + datetime.timedelta(seconds=settings.PROVISION_LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return (db.query(AccessRequest)
+            .filter(AccessRequest.id.in_(ids), AccessRequest.provision_lease_owner == claim)
+            .order_by(AccessRequest.updated_at, AccessRequest.id)
+            .all())
+
+def _fail(db, req: AccessRequest, error: str, now: datetime.datetime, permanent: bool = False):
+    req.provision_attempts = (req.provision_attempts or 0) + 1
+    req.provision_error = error
+    req.provision_lease_owner = None
+    if permanent or req.provision_attempts >= settings.PROVISION_MAX_ATTEMPTS:
+        req.status = RequestStatus.error
+        req.provision_next_at = None
+        log_audit(req.id, actor="provisioning", action="provision_failed", meta=error, db=db)
+        logger.error("Provisioning request %s failed permanently: %s", req.id, error)
+    else:
+        delay = settings.PROVISION_RETRY_BACKOFF_SECONDS * (2 ** (req.provision_attempts - 1))
+        req.provision_next_at = now + datetime.timedelta(seconds=delay)
+        logger.warning("Provisioning request %s failed (attempt %d), retrying in %ss: %s",
+                       req.id, req.provision_attempts, delay, error)
+
+def provision_approved(client=None, batch_size: int = None) -> dict:
+    """Assign Keycloak roles for one batch of approved requests. Returns outcome counts."""
+    counts = {"provisioned": 0, "retry": 0, "error": 0}
+    db = SessionLocal()
+    try:
+        now = datetime.datetime.utcnow()
+        batch = _claim(db, now, batch_size or settings.PROVISION_BATCH_SIZE)
+        if not batch:
+            return counts
+        if client is None:
+            from .keyclock_client import get_keycloak_client
+            client = get_keycloak_client()
+
+        # resolve each distinct role once; a missing role is permanent, a lookup error is not
+        missing, lookup_errors = set(), {}
+        for role_name in {r.requested_role for r in batch}:
+            try:
+                if not client.get_realm_role(role_name):
+                    missing.add(role_name)
+            except Exception as e:
+                lookup_errors[role_name] = f"role lookup failed: {e}"
+
+        by_user = defaultdict(list)
+        for req in batch:
+            if req.requested_role in missing:
+                _fail(db, req, f"role not found: {req.requested_role}", now, permanent=True)
+            elif req.requested_role in lookup_errors:
+                _fail(db, req, lookup_errors[req.requested_role], now)
+            else:
+                by_user[req.keycloak_user_id].append(req)
+
+        for user_id, reqs in by_user.items():
+            roles = sorted({r.requested_role for r in reqs})
+            try:
+                client.assign_realm_roles(user_id, roles)
+            except Exception as e:
+                for req in reqs:
+                    _fail(db, req, str(e) or e.__class__.__name__, now)
+                continue
+            for req in reqs:
+                req.provisioned_at = now
+                req.provision_error = None
+                req.provision_next_at = None
+                req.provision_lease_owner = None
+                req.provision_attempts = (req.provision_attempts or 0) + 1
+                log_audit(req.id, actor="provisioning", action="provisioned",
+                          meta=f"user={user_id}, role={req.requested_role}", db=db)
+
+        for req in batch:
+            if req.provisioned_at:
+                counts["provisioned"] += 1
+            elif req.status == RequestStatus.error:
+                counts["error"] += 1
+            else:
+                counts["retry"] += 1
+        db.commit()
+        logger.info("Provisioning run: %s", counts)
+        return counts
+    except Exception as e:
+        db.rollback()
+        logger.exception("Provisioning run failed: %s", e)
+        return counts
+    finally:
+        db.close()
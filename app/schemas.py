@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, Dict
+from typing import Any, Optional, Dict, List
+import datetime
 
 class CreateRequest(BaseModel):
     keycloak_user_id: str
@@ -11,3 +12,31 @@ class CreateResponse(BaseModel):
     request_id: str
     status: str
 
+
+class BatchCreateRequest(BaseModel):
+    # items are validated one by one so a bad item (even a non-object) fails alone
+    items: List[Any]
+
+class BatchItemResult(BaseModel):
+    index: int
+    ok: bool
+    request_id: Optional[str] = None
+    status: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchCreateResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BatchItemResult]
+
+
+class RequestSummary(BaseModel):
+    id: str
+    requester_email: Optional[str]
+    requested_role: Optional[str]
+    status: str
+    created_at: Optional[datetime.datetime]
+
+class RequestPage(BaseModel):
+    items: List[RequestSummary]
+    next_cursor: Optional[str] = None
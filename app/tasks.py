@@ -1,21 +1,45 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from .db import SessionLocal
+from sqlalchemy import select, update, and_, or_, func, case
+from .db import SessionLocal, engine
 from .models import AccessRequest, RequestStatus
-from .tokens import create_token_jti
-from .mailer_factory import get_mailer
+from .tokens import create_token_jti, compact_tokens
+from .outbox import submit_email, submit_batch
+from .archive import run_retention
+from .workflow import expire_requests
+from .provisioning import provision_approved
 from .config import settings
-import datetime, urllib.parse, logging, os
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from .templating import render_email
+import datetime, threading, urllib.parse, logging, uuid
 
 logger = logging.getLogger(__name__)
 scheduler = BackgroundScheduler()
 
 def _render_templates(ctx):
-    here = os.path.join(os.path.dirname(__file__), "templates")
-    env = Environment(loader=FileSystemLoader(here), autoescape=select_autoescape(["html"]))
-    html = env.get_template("approve_email.html").render(**ctx)
-    text = env.get_template("approve_email.txt").render(**ctx)
-    return html, text
+    return render_email("approve_email", ctx)
+
+def build_initial_email(req: AccessRequest, approver_email: str, approver_name: str = None, preview: bool = False,
+                        db=None) -> dict:
+    """
+    Build the approval email for a request. With `preview=True` no tokens are issued
+    and the action links are inert placeholders (used by the admin view). With `db`
+    the token rows join the caller's transaction.
+    """
+    if preview:
+        approve_url = reject_url = "#preview"
+        ref = req.id
+    else:
+        # the approve token's jti doubles as the secret reply reference (see inbound_rules)
+        reply_ref = str(uuid.uuid4())
+        ref = f"{req.id}:{reply_ref}"
+        approve_token = create_token_jti(req.id, "approve", db=db, jti=reply_ref)
+        reject_token = create_token_jti(req.id, "reject", db=db)
+        approve_url = f"{settings.APP_BASE}/callback?token={urllib.parse.quote_plus(approve_token)}"
+        reject_url = f"{settings.APP_BASE}/callback?token={urllib.parse.quote_plus(reject_token)}"
+    expiry = (datetime.datetime.utcnow() + datetime.timedelta(seconds=settings.TOKEN_EXPIRY_SECONDS)).isoformat()
+    ctx = {"approver_name": approver_name, "requester_email": req.requester_email, "requested_role": req.requested_role, "approve_url": approve_url, "reject_url": reject_url, "expiry_date": expiry}
+    html, text = _render_templates(ctx)
+    return {"to_email": approver_email, "subject": f"[Action Required] Access request for {req.requester_email} [ref:{ref}]",
+            "html_body": html, "text_body": text, "request_id": req.id}
 
 def send_initial_email(request_id: str, approver_email: str, approver_name: str = None):
     db = SessionLocal()
@@ -23,37 +47,256 @@ def send_initial_email(request_id: str, approver_email: str, approver_name: str
         req = db.query(AccessRequest).filter_by(id=request_id).first()
         if not req:
             return
-        mailer = get_mailer()
-        approve_token = create_token_jti(request_id, "approve")
-        reject_token = create_token_jti(request_id, "reject")
-        approve_url = f"{settings.APP_BASE}/callback?token={urllib.parse.quote_plus(approve_token)}"
-        reject_url = f"{settings.APP_BASE}/callback?token={urllib.parse.quote_plus(reject_token)}"
-        expiry = (datetime.datetime.utcnow() + datetime.timedelta(seconds=settings.TOKEN_EXPIRY_SECONDS)).isoformat()
-        ctx = {"approver_name": approver_name, "requester_email": req.requester_email, "requested_role": req.requested_role, "approve_url": approve_url, "reject_url": reject_url, "expiry_date": expiry}
-        html, text = _render_templates(ctx)
-        mailer(approver_email, f"[Action Required] Access request for {req.requester_email}", html, text, request_id=req.id)
-        req.last_notified_at = datetime.datetime.utcnow()
+        msg = build_initial_email(req, approver_email, approver_name)
+        submit_email(msg["to_email"], msg["subject"], msg["html_body"], msg["text_body"], request_id=req.id, db=db)
+        now = datetime.datetime.utcnow()
+        req.last_notified_at = now
         req.notify_count = (req.notify_count or 0) + 1
+        req.next_reminder_at = next_reminder_at(req.requested_role, now)
         db.commit()
+        reminder_timer.schedule(req.next_reminder_at)
+    except Exception as e:
+        db.rollback()
+        logger.exception("Failed to queue initial email: %s", e)
+    finally:
+        db.close()
+
+def reminder_hours(role: str) -> float:
+    """Hours between reminders for a role (REMINDER_HOURS_BY_ROLE, else REMINDER_HOURS)."""
+    return settings.REMINDER_HOURS_BY_ROLE.get(role, settings.REMINDER_HOURS)
+
+def next_reminder_at(role: str, after: datetime.datetime) -> datetime.datetime:
+    return after + datetime.timedelta(hours=reminder_hours(role))
+
+def _next_reminder_expr(now: datetime.datetime):
+    """SQL CASE giving each row its role's next reminder time."""
+    default = next_reminder_at(None, now)
+    whens = [(AccessRequest.requested_role == role, next_reminder_at(role, now))
+             for role in settings.REMINDER_HOURS_BY_ROLE]
+    return case(*whens, else_=default) if whens else default
+
+def _reminder_due_filter(now: datetime.datetime):
+    """Pending requests whose next reminder time has passed (index range on next_reminder_at)."""
+    return and_(AccessRequest.status == RequestStatus.pending, AccessRequest.next_reminder_at <= now)
+
+def _claim_locked(db, now: datetime.datetime, limit: int):
+    """Postgres/MySQL: lock a chunk of due rows, skipping rows another worker holds."""
+    ids = db.execute(
+        select(AccessRequest.id)
+        .where(_reminder_due_filter(now))
+        .order_by(AccessRequest.created_at, AccessRequest.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    return ids, AccessRequest.id.in_(ids)
+
+def _claim_leased(db, now: datetime.datetime, limit: int):
+    """
+    SQLite: lease a chunk of due rows with one conditional UPDATE and commit it,
+    so the write lock is not held while emails are rendered. A worker that dies
+    mid-chunk leaves a lease that expires after REMINDER_LEASE_SECONDS.
+    """
+    claim = str(uuid.uuid4())
+    free = or_(AccessRequest.reminder_lease_until.is_(None), AccessRequest.reminder_lease_until < now)
+    due = and_(_reminder_due_filter(now), free)
+    chunk = select(AccessRequest.id).where(due).order_by(AccessRequest.created_at, AccessRequest.id).limit(limit)
+    db.execute(
+        update(AccessRequest)
+        .where(AccessRequest.id.in_(chunk.scalar_subquery()), due)
+        .values(reminder_lease_owner=claim,
+                reminder_lease_until=now + datetime.timedelta(seconds=settings.REMINDER_LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    ids = db.execute(select(AccessRequest.id).where(AccessRequest.reminder_lease_owner == claim)).scalars().all()
+    return ids, AccessRequest.reminder_lease_owner == claim
+
+def reminder_check() -> int:
+    """
+    Queue reminders for every due pending request. Returns the number queued.
+    Requests already reminded REMINDER_MAX_NOTIFICATIONS times are expired instead.
+
+    Safe to run from several processes or nodes at once: each chunk is claimed
+    atomically (SELECT ... FOR UPDATE SKIP LOCKED on Postgres/MySQL, a lease on
+    SQLite) and marked notified in the same transaction that queues its emails.
+    """
+    db = SessionLocal()
+    queued = expired = 0
+    claim_chunk = _claim_locked if engine.dialect.name in ("postgresql", "mysql") else _claim_leased
+    try:
+        approver_email = settings.APPROVER_EMAILS[0]
+        max_notifications = settings.REMINDER_MAX_NOTIFICATIONS
+        while True:
+            now = datetime.datetime.utcnow()
+            ids, claimed = claim_chunk(db, now, settings.REMINDER_BATCH_SIZE)
+            if not ids:
+                break
+            rows = db.execute(
+                select(AccessRequest.id, AccessRequest.requester_email, AccessRequest.requested_role,
+                       AccessRequest.notify_count)
+                .where(AccessRequest.id.in_(ids))
+            ).all()
+            exhausted = {r.id for r in rows if max_notifications and (r.notify_count or 0) >= max_notifications}
+            due = [r for r in rows if r.id not in exhausted]
+            expired += len(expire_requests(db, list(exhausted), reason=f"no decision after {max_notifications} notifications"))
+            batch = [build_initial_email(r, approver_email, db=db) for r in due]
+            if due:
+                db.execute(
+                    update(AccessRequest)
+                    .where(claimed, AccessRequest.id.in_([r.id for r in due]))
+                    .values(last_notified_at=now, next_reminder_at=_next_reminder_expr(now),
+                            notify_count=func.coalesce(AccessRequest.notify_count, 0) + 1)
+                    .execution_options(synchronize_session=False)
+                )
+                # bookkeeping, tokens and outbox rows commit together; workers deliver through the bulk mailer
+                submit_batch(batch, db=db)
+            # release the claim last: on SQLite it is what `claimed` matches
+            db.execute(
+                update(AccessRequest)
+                .where(claimed)
+                .values(reminder_lease_owner=None, reminder_lease_until=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            queued += len(batch)
+        if queued or expired:
+            logger.info("Queued %d reminder emails, expired %d requests", queued, expired)
+        return queued
     except Exception as e:
         db.rollback()
-        logger.exception("Failed to send initial email: %s", e)
+        logger.exception("Reminder check failed: %s", e)
+        return queued
     finally:
         db.close()
 
-def reminder_check():
+def expire_stale_requests() -> int:
+    """
+    Expire pending requests whose newest approval links are past TOKEN_EXPIRY_SECONDS
+    (nothing sent since then), in batches of EXPIRY_BATCH_SIZE. Their open tokens are
+    revoked and requesters are told through the batched outbox. Returns the count.
+    """
     db = SessionLocal()
+    expired = 0
     try:
-        threshold = datetime.datetime.utcnow() - datetime.timedelta(hours=settings.REMINDER_HOURS)
-        pendings = db.query(AccessRequest).filter(AccessRequest.status == RequestStatus.pending, AccessRequest.created_at <= threshold).all()
-        for r in pendings:
-            if not r.last_notified_at or (datetime.datetime.utcnow() - r.last_notified_at).total_seconds() > settings.REMINDER_CHECK_INTERVAL_MINUTES*60:
-                approver_email = "approver@example.com"
-                send_initial_email(r.id, approver_email)
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=settings.TOKEN_EXPIRY_SECONDS)
+        stale = and_(
+            AccessRequest.status == RequestStatus.pending,
+            or_(AccessRequest.last_notified_at < cutoff,
+                and_(AccessRequest.last_notified_at.is_(None), AccessRequest.created_at < cutoff)),
+        )
+        while True:
+            ids = db.execute(
+                select(AccessRequest.id).where(stale).order_by(AccessRequest.created_at)
+                .limit(settings.EXPIRY_BATCH_SIZE)
+            ).scalars().all()
+            if not ids:
+                break
+            # conditional UPDATE: a concurrent sweep or decision simply wins the row
+            done = expire_requests(db, ids, reason="approval links expired",
+                                   notify=settings.EXPIRY_NOTIFY_REQUESTER)
+            db.commit()
+            expired += len(done)
+            if len(ids) < settings.EXPIRY_BATCH_SIZE:
+                break
+        if expired:
+            logger.info("Expired %d stale requests", expired)
+        return expired
+    except Exception as e:
+        db.rollback()
+        logger.exception("Expiry sweep failed: %s", e)
+        return expired
     finally:
         db.close()
 
+def next_reminder_due():
+    """Earliest next_reminder_at among pending requests (one index lookup)."""
+    db = SessionLocal()
+    try:
+        return db.execute(
+            select(func.min(AccessRequest.next_reminder_at)).where(AccessRequest.status == RequestStatus.pending)
+        ).scalar()
+    finally:
+        db.close()
+
+class ReminderTimer:
+    """
+    Runs reminder_check when the earliest reminder falls due instead of on a
+    fixed interval. Only the next wake-up time is kept: it is lowered by
+    schedule() calls from this process and reset from the database (the
+    earliest next_reminder_at) after each sweep, so later times need not be
+    remembered. REMINDER_CHECK_INTERVAL_MINUTES caps the sleep, which picks
+    up requests created by other processes.
+    """
+
+    def __init__(self):
+        self._next_wake = None
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+    def schedule(self, when: datetime.datetime):
+        if when is None:
+            return
+        with self._cond:
+            if self._next_wake is None or when < self._next_wake:
+                self._next_wake = when
+                self._cond.notify()
+
+    def _run(self):
+        max_sleep = datetime.timedelta(minutes=settings.REMINDER_CHECK_INTERVAL_MINUTES)
+        last_sweep = None
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                now = datetime.datetime.utcnow()
+                wake = last_sweep + max_sleep if last_sweep else now
+                if self._next_wake is not None and self._next_wake < wake:
+                    wake = self._next_wake
+                if wake > now:
+                    self._cond.wait((wake - now).total_seconds())
+                    continue
+                # the sweep below reads the next due time back from the database
+                self._next_wake = None
+            reminder_check()
+            last_sweep = datetime.datetime.utcnow()
+            try:
+                due = next_reminder_due()
+            except Exception:
+                logger.exception("Could not read the next reminder time")
+                due = None
+            if due is not None:
+                # due rows may still be leased by another process: don't spin on them
+                self.schedule(max(due, last_sweep + datetime.timedelta(seconds=1)))
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="reminder-timer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+reminder_timer = ReminderTimer()
+
 def start_scheduler():
-    scheduler.add_job(reminder_check, 'interval', minutes=settings.REMINDER_CHECK_INTERVAL_MINUTES, id="reminder_check")
+    reminder_timer.start()
+    scheduler.add_job(expire_stale_requests, 'interval', minutes=settings.EXPIRY_INTERVAL_MINUTES, id="expire_stale_requests")
+    scheduler.add_job(compact_tokens, 'interval', minutes=settings.TOKEN_COMPACTION_INTERVAL_MINUTES, id="compact_tokens")
+    scheduler.add_job(run_retention, 'interval', hours=settings.ARCHIVE_INTERVAL_HOURS, id="run_retention")
+    if settings.PROVISION_ENABLED and settings.KEYCLOAK_SERVER_URL:
+        scheduler.add_job(provision_approved, 'interval', seconds=settings.PROVISION_INTERVAL_SECONDS, id="provision_approved")
     scheduler.start()
 
+def stop_scheduler():
+    reminder_timer.stop()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+
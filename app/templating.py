@@ -0,0 +1,48 @@
+"""
+Shared Jinja environment for emails and admin pages.
+
+One Environment is built per process, so every template is parsed and compiled
+once and then served from the in-memory cache. Compiled bytecode is also kept
+on disk (TEMPLATE_BYTECODE_CACHE) so new workers and restarts skip compilation.
+Template files are only re-checked for changes when TEMPLATES_AUTO_RELOAD is on
+(dev mode).
+"""
+import os, logging
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
+
+def _create_env() -> Environment:
+    bytecode_cache = None
+    if settings.TEMPLATE_BYTECODE_CACHE:
+        cache_dir = settings.TEMPLATE_BYTECODE_CACHE_DIR or None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    return Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=select_autoescape(["html", "xml"]),
+        auto_reload=settings.TEMPLATES_AUTO_RELOAD,
+        bytecode_cache=bytecode_cache,
+        cache_size=-1,  # never evict: the template set is small and fixed
+    )
+
+env = _create_env()
+
+def render(template_name: str, **ctx) -> str:
+    return env.get_template(template_name).render(**ctx)
+
+def render_email(base_name: str, ctx: dict):
+    """Render `<base_name>.html` and `<base_name>.txt`; returns (html, text)."""
+    return render(f"{base_name}.html", **ctx), render(f"{base_name}.txt", **ctx)
+
+def precompile_templates() -> int:
+    """Load every template up front so the first request does not pay for compilation."""
+    names = env.list_templates(extensions=["html", "txt"])
+    for name in names:
+        env.get_template(name)
+    logger.info("Precompiled %d templates", len(names))
+    return len(names)
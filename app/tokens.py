@@ -1,12 +1,20 @@
 import jwt, datetime, uuid
 from .config import settings
-from .db import SessionLocal
-from .models import ApprovalToken
+from .db import SessionLocal, insert_ignore
+from .models import ApprovalToken, ConsumedToken
+from sqlalchemy import update, delete, select, or_
+import logging
 from sqlalchemy.exc import SQLAlchemyError
 
-def create_token_jti(request_id: str, action: str, expiry_seconds: int=None):
+logger = logging.getLogger(__name__)
+
+def stateless_tokens() -> bool:
+    return settings.TOKEN_MODE == "stateless"
+
+def create_token_jti(request_id: str, action: str, expiry_seconds: int=None, db=None, jti: str=None):
+    """Sign a single-use token. With `db` (DB mode) the token row joins the caller's transaction."""
     expiry_seconds = expiry_seconds or settings.TOKEN_EXPIRY_SECONDS
-    jti = str(uuid.uuid4())
+    jti = jti or str(uuid.uuid4())
     now = datetime.datetime.utcnow()
     exp = now + datetime.timedelta(seconds=expiry_seconds)
     payload = {
@@ -18,9 +26,15 @@ def create_token_jti(request_id: str, action: str, expiry_seconds: int=None):
         "iss": "iam-email-service"
     }
     token = jwt.encode(payload, settings.TOKEN_SECRET, algorithm="HS256")
+    if stateless_tokens():
+        # signature + exp carry everything; single use is enforced on consumption
+        return token
+    db_token = ApprovalToken(jti=jti, request_id=request_id, action=action, created_at=now, expires_at=exp)
+    if db is not None:
+        db.add(db_token)
+        return token
     db = SessionLocal()
     try:
-        db_token = ApprovalToken(jti=jti, request_id=request_id, action=action, created_at=now, expires_at=exp)
         db.add(db_token)
         db.commit()
     except SQLAlchemyError:
@@ -30,9 +44,9 @@ def create_token_jti(request_id: str, action: str, expiry_seconds: int=None):
         db.close()
     return token
 
-def validate_token_no_mark(token_str: str):
+def decode_token(token_str: str):
     """
-    Validate token but DO NOT mark used. Returns (payload, error)
+    Check signature and expiry only (no DB access). Returns (payload, error)
     """
     try:
         payload = jwt.decode(token_str, settings.TOKEN_SECRET, algorithms=["HS256"], options={"require": ["exp","iat","jti"]})
@@ -40,9 +54,22 @@ def validate_token_no_mark(token_str: str):
         return None, "expired"
     except Exception as e:
         return None, f"invalid: {e}"
+    return payload, None
+
+def validate_token_no_mark(token_str: str):
+    """
+    Validate token but DO NOT mark used. Returns (payload, error)
+    """
+    payload, err = decode_token(token_str)
+    if err:
+        return None, err
     jti = payload.get("jti")
     db = SessionLocal()
     try:
+        if stateless_tokens():
+            if db.get(ConsumedToken, jti) is not None:
+                return None, "already used"
+            return payload, None
         db_token = db.query(ApprovalToken).filter_by(jti=jti).first()
         if not db_token:
             return None, "unknown token"
@@ -71,3 +98,133 @@ def mark_token_used(jti: str):
     finally:
         db.close()
 
+
+def consume_token(db, payload: dict) -> bool:
+    """
+    Mark a decoded token used inside the caller's transaction with a single statement.
+    Only one concurrent caller can win; returns False if the token is unknown, used or expired.
+
+    DB mode flips used_at on the approval_tokens row; stateless mode inserts the jti
+    into consumed_tokens, where the primary key rejects a second use.
+    """
+    jti = payload.get("jti")
+    now = datetime.datetime.utcnow()
+    if stateless_tokens():
+        res = db.execute(
+            insert_ignore(db, ConsumedToken.__table__).values(
+                jti=jti, request_id=payload.get("request_id"), consumed_at=now,
+                expires_at=datetime.datetime.utcfromtimestamp(payload["exp"]))
+        )
+        return res.rowcount == 1
+    res = db.execute(
+        update(ApprovalToken)
+        .where(ApprovalToken.jti == jti, ApprovalToken.used_at.is_(None), ApprovalToken.expires_at >= now)
+        .values(used_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    return res.rowcount == 1
+
+def token_rejection_reason(db, payload: dict) -> str:
+    """Explain why consume_token() refused a token (same wording as validate_token_no_mark)."""
+    jti = payload.get("jti")
+    if stateless_tokens():
+        return "already used"
+    db_token = db.query(ApprovalToken).filter_by(jti=jti).first()
+    if not db_token:
+        return "unknown token"
+    if db_token.used_at is not None:
+        return "already used"
+    return "expired (DB)"
+
+def reply_reference_valid(db, request_id: str, reference: str) -> bool:
+    """
+    True when `reference` is the jti of an open approve token of the request. Approval
+    emails quote that jti in their [ref:...] subject tag, so only someone who received
+    the email knows it. Stateless tokens are not stored and never match.
+    """
+    if stateless_tokens() or not reference:
+        return False
+    return db.execute(
+        select(ApprovalToken.jti).where(ApprovalToken.jti == reference,
+                                        ApprovalToken.request_id == request_id,
+                                        ApprovalToken.action == "approve",
+                                        ApprovalToken.used_at.is_(None),
+                                        ApprovalToken.expires_at >= datetime.datetime.utcnow())
+    ).first() is not None
+
+def revoke_request_tokens(db, request_id: str) -> int:
+    """
+    Mark every open token of a request used, inside the caller's transaction.
+    Stateless tokens are not enumerable; they are rejected by the request's status instead.
+    """
+    return revoke_tokens_for_requests(db, [request_id])
+
+def revoke_tokens_for_requests(db, request_ids) -> int:
+    """Bulk form of revoke_request_tokens: one UPDATE for many requests."""
+    if stateless_tokens() or not request_ids:
+        return 0
+    res = db.execute(
+        update(ApprovalToken)
+        .where(ApprovalToken.request_id.in_(list(request_ids)), ApprovalToken.used_at.is_(None))
+        .values(used_at=datetime.datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return res.rowcount
+
+def prune_consumed_tokens(batch_size: int = 1000) -> int:
+    """Delete consumed-jti entries whose tokens have expired anyway, in bounded batches."""
+    now = datetime.datetime.utcnow()
+    deleted = 0
+    db = SessionLocal()
+    try:
+        while True:
+            jtis = db.execute(select(ConsumedToken.jti).where(ConsumedToken.expires_at < now).limit(batch_size)).scalars().all()
+            if not jtis:
+                break
+            db.execute(delete(ConsumedToken).where(ConsumedToken.jti.in_(jtis)))
+            db.commit()
+            deleted += len(jtis)
+        return deleted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def compact_approval_tokens(batch_size: int = 1000) -> int:
+    """
+    Delete approval_tokens rows that can never validate again: expired ones, and used
+    ones older than TOKEN_USED_RETENTION_HOURS (kept briefly so a second click still
+    reports "already used"). Works in bounded batches to keep write locks short.
+    """
+    now = datetime.datetime.utcnow()
+    used_before = now - datetime.timedelta(hours=settings.TOKEN_USED_RETENTION_HOURS)
+    dead = or_(ApprovalToken.expires_at < now, ApprovalToken.used_at < used_before)
+    deleted = 0
+    db = SessionLocal()
+    try:
+        while True:
+            jtis = db.execute(select(ApprovalToken.jti).where(dead).limit(batch_size)).scalars().all()
+            if not jtis:
+                break
+            db.execute(delete(ApprovalToken).where(ApprovalToken.jti.in_(jtis)))
+            db.commit()
+            deleted += len(jtis)
+        return deleted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def compact_tokens() -> int:
+    """Scheduled job: prune dead approval tokens and expired consumed-jti entries."""
+    try:
+        deleted = compact_approval_tokens(settings.TOKEN_COMPACTION_BATCH_SIZE)
+        deleted += prune_consumed_tokens(settings.TOKEN_COMPACTION_BATCH_SIZE)
+    except Exception as e:
+        logger.exception("Token compaction failed: %s", e)
+        return 0
+    if deleted:
+        logger.info("Token compaction removed %d rows", deleted)
+    return deleted
@@ -0,0 +1,71 @@
+"""
+Request state transitions shared by the email callback, the admin UI and
+inbound replies. Everything here works inside the caller's session so one
+decision is one transaction.
+"""
+import datetime
+from sqlalchemy import and_, select, update
+from .models import AccessRequest, RequestStatus
+from .mailer_utils import log_audit, send_response_email, response_message
+from .tokens import revoke_tokens_for_requests
+
+def apply_decision(db, request_id: str, action: str, actor: str, ip: str = None, user_agent: str = None, notify: bool = True):
+    """
+    Move a pending request to approved/rejected with a conditional UPDATE, add the
+    audit entry and (when `notify`) queue the requester's response email.
+    Returns (req, status_str). req is None when the request does not exist;
+    status_str is None when it was no longer pending. The caller commits.
+    """
+    req = db.query(AccessRequest).filter_by(id=request_id).first()
+    if not req:
+        return None, None
+    new_status = RequestStatus.approved if action == "approve" else RequestStatus.rejected
+    res = db.execute(
+        update(AccessRequest)
+        .where(AccessRequest.id == request_id, AccessRequest.status == RequestStatus.pending)
+        .values(status=new_status, updated_at=datetime.datetime.utcnow())
+    )
+    if res.rowcount != 1:
+        return req, None
+    status_str = new_status.value
+    log_audit(request_id, actor=actor, action=status_str, ip=ip, user_agent=user_agent, db=db)
+    if notify and req.requester_email:
+        send_response_email(req.requester_email, req.requested_role, status_str, request_id=request_id, db=db)
+    return req, status_str
+
+def expire_requests(db, request_ids, actor: str = "system", reason: str = None, notify: bool = True) -> list:
+    """
+    Move still-pending requests to expired with one conditional UPDATE, revoke
+    their tokens and (when `notify`) queue the requesters' emails as one batch.
+    Returns the ids that actually expired. The caller commits.
+    """
+    if not request_ids:
+        return []
+    now = datetime.datetime.utcnow()
+    still_pending = and_(AccessRequest.id.in_(list(request_ids)), AccessRequest.status == RequestStatus.pending)
+    stmt = (update(AccessRequest)
+            .where(still_pending)
+            .values(status=RequestStatus.expired, updated_at=now, next_reminder_at=None)
+            .execution_options(synchronize_session=False))
+    if db.get_bind().dialect.update_returning:
+        expired = db.execute(stmt.returning(AccessRequest.id)).scalars().all()
+    else:
+        # no UPDATE ... RETURNING (MySQL): lock the rows first so the id list stays exact
+        expired = db.execute(select(AccessRequest.id).where(still_pending).with_for_update()).scalars().all()
+        if expired:
+            db.execute(stmt.where(AccessRequest.id.in_(expired)))
+    if not expired:
+        return []
+    revoke_tokens_for_requests(db, expired)
+    for request_id in expired:
+        log_audit(request_id, actor=actor, action="expired", meta=reason, db=db)
+    if notify:
+        from .outbox import submit_batch
+        rows = db.execute(
+            select(AccessRequest.id, AccessRequest.requester_email, AccessRequest.requested_role)
+            .where(AccessRequest.id.in_(expired), AccessRequest.requester_email.isnot(None))
+        ).all()
+        submit_batch([response_message(r.requester_email, r.requested_role, "expired", request_id=r.id) for r in rows], db=db)
+        for r in rows:
+            log_audit(r.id, actor="system", action="response_email_expired", meta=f"to={r.requester_email}", db=db)
+    return expired
@@ -0,0 +1,50 @@
+"""
+POST /api/v1/requests one at a time vs. POST /api/v1/requests:batch.
+
+    python bench/batch_create.py [--requests 500] [--batch 100]
+
+Both paths run in-process through TestClient on a fresh SQLite file with the
+outbox on (emails are queued, not sent).
+"""
+import argparse
+
+import common
+
+common.migrate()
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+def item(i):
+    return {"keycloak_user_id": f"user{i}", "requester_email": f"user{i}@example.com", "requested_role": "viewer"}
+
+
+def singles(client, n):
+    for i in range(n):
+        assert client.post("/api/v1/requests", json=item(i)).status_code == 200
+
+
+def batches(client, n, size):
+    for start in range(0, n, size):
+        resp = client.post("/api/v1/requests:batch", json={"items": [item(i) for i in range(start, min(start + size, n))]})
+        assert resp.status_code == 200 and resp.json()["failed"] == 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+    client = TestClient(app)
+    single_s, _ = common.timed(singles, client, args.requests)
+    batch_s, _ = common.timed(batches, client, args.requests, args.batch)
+    common.report(f"{args.requests} requests", [
+        ("one per call", f"{args.requests / single_s:8.0f} req/s"),
+        (f"batches of {args.batch}", f"{args.requests / batch_s:8.0f} req/s"),
+        ("speedup", f"{single_s / batch_s:8.1f}x"),
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Shared setup for the benchmark scripts: a scratch SQLite database migrated to
+head, and settings that keep the app away from real services. Import this
+module before anything from `app`.
+"""
+import os, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TMP = tempfile.mkdtemp(prefix="iam-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(TMP, 'bench.db')}")
+os.environ.setdefault("AUDIT_ASYNC", "false")
+os.environ["KEYCLOAK_SERVER_URL"] = ""
+os.environ.setdefault("MAILER_BACKEND", "mailersend")
+os.environ.setdefault("MAILERSEND_API_KEY", "bench-key")
+os.environ.setdefault("MAILERSEND_FROM_EMAIL", "noreply@example.com")
+os.environ.setdefault("ARCHIVE_DIR", os.path.join(TMP, "archive"))
+os.environ.setdefault("BLOB_DIR", os.path.join(TMP, "blobs"))
+
+
+def migrate():
+    from app.db import migrate_database
+    migrate_database()
+
+
+def timed(fn, *args, **kwargs):
+    """(seconds, result) of one call."""
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def report(title, rows):
+    """Print `rows` of (label, value) under a title, aligned."""
+    print(title)
+    width = max(len(label) for label, _ in rows)
+    for label, value in rows:
+        print(f"  {label.ljust(width)}  {value}")
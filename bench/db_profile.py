@@ -0,0 +1,86 @@
+"""
+Mixed load on a SQLite file with DB_PROFILE=plain vs DB_PROFILE=tuned.
+
+For each profile a child process (the engine is built at import) runs, for
+--seconds: request-creation threads (POST /api/v1/requests, outbox on,
+synchronous audit), inbox readers (GET /api/v1/requests) and one thread
+running the reminder sweep. Operations and failures are counted per kind.
+
+    python bench/db_profile.py [--seconds 5] [--writers 6] [--readers 4]
+"""
+import argparse, json, os, subprocess, sys, threading, time
+
+import common
+
+
+def worker(seconds, writers, readers):
+    common.migrate()
+    from fastapi.testclient import TestClient
+    from app import tasks
+    from app.main import app
+
+    client = TestClient(app)
+    stop = threading.Event()
+    counts = {"creates": 0, "reads": 0, "sweeps": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def count(name):
+        with lock:
+            counts[name] += 1
+
+    def create(n):
+        i = 0
+        while not stop.is_set():
+            i += 1
+            resp = client.post("/api/v1/requests", json={"keycloak_user_id": f"u{n}-{i}",
+                                                         "requester_email": f"u{n}-{i}@example.com",
+                                                         "requested_role": "viewer"})
+            count("creates" if resp.status_code == 200 else "errors")
+
+    def read():
+        while not stop.is_set():
+            resp = client.get("/api/v1/requests", params={"status": "pending", "limit": 50})
+            count("reads" if resp.status_code == 200 else "errors")
+
+    def sweep():
+        while not stop.is_set():
+            tasks.reminder_check()
+            count("sweeps")
+
+    threads = ([threading.Thread(target=create, args=(n,)) for n in range(writers)]
+               + [threading.Thread(target=read) for _ in range(readers)]
+               + [threading.Thread(target=sweep)])
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    print(json.dumps(counts))
+
+
+def main(args):
+    rows = []
+    for profile in ("plain", "tuned"):
+        env = dict(os.environ, DB_PROFILE=profile, AUDIT_ASYNC="false", OUTBOX_ENABLED="true",
+                   DATABASE_URL=f"sqlite:///{os.path.join(common.TMP, profile + '.db')}")
+        out = subprocess.run([sys.executable, __file__, "--worker", "--seconds", str(args.seconds),
+                              "--writers", str(args.writers), "--readers", str(args.readers)],
+                             env=env, check=True, capture_output=True, text=True).stdout
+        counts = json.loads(out.strip().splitlines()[-1])
+        rows.append((profile, "  ".join(f"{k} {v / args.seconds:6.0f}/s" if k != "errors" else f"errors {v}"
+                                        for k, v in counts.items())))
+    common.report(f"{args.seconds:g}s mixed load, {args.writers} writers, {args.readers} readers, 1 sweeper", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=6)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args.seconds, args.writers, args.readers)
+    else:
+        main(args)
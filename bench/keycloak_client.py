@@ -0,0 +1,89 @@
+"""
+Keycloak admin lookups: a new KeycloakClient per call (one token grant each,
+as before) vs the shared get_keycloak_client(), against a local stub of the
+token and users endpoints. The user cache is off so every call reaches the stub.
+
+The stub charges GRANT_MS per token grant, roughly what a real Keycloak spends
+on a client-credentials grant.
+
+    python bench/keycloak_client.py [--lookups 200] [--threads 16]
+"""
+import argparse, json, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import common
+
+from app import keyclock_client  # noqa: E402
+from app.config import settings  # noqa: E402
+
+GRANT_MS = 20
+
+
+class _StubKeycloak(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.grants += 1
+        time.sleep(GRANT_MS / 1000)
+        self._reply({"access_token": "token", "expires_in": 300, "refresh_token": "refresh",
+                     "refresh_expires_in": 1800, "token_type": "Bearer"})
+
+    def do_GET(self):
+        self._reply([{"id": "id-alice", "username": "alice"}])
+
+    def log_message(self, *args):
+        pass
+
+
+def _run(lookup, calls, threads):
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda _: lookup("alice"), range(calls)))
+
+
+def main(lookups, threads):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubKeycloak)
+    server.daemon_threads = True
+    server.lock, server.grants = threading.Lock(), 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    settings.KEYCLOAK_SERVER_URL = "http://%s:%d/" % server.server_address
+    settings.KEYCLOAK_CLIENT_ID, settings.KEYCLOAK_CLIENT_SECRET = "bench", "secret"
+    settings.KEYCLOAK_ADMIN_USERNAME = settings.KEYCLOAK_ADMIN_PASSWORD = None
+    keyclock_client._user_cache = keyclock_client.TTLCache(maxsize=1, ttl=0)
+
+    def per_call(name):
+        client = keyclock_client.KeycloakClient()
+        try:
+            return client.get_user_id_by_username_or_email(name)
+        finally:
+            client.close()
+
+    def shared(name):
+        return keyclock_client.get_keycloak_client().get_user_id_by_username_or_email(name)
+
+    rows = []
+    for label, lookup in (("new client per call", per_call), ("shared client", shared)):
+        before = server.grants
+        seconds, _ = common.timed(_run, lookup, lookups, threads)
+        rows.append((label, f"{seconds / lookups * 1000:6.1f} ms/lookup  ({server.grants - before} token grants)"))
+    keyclock_client.close_keycloak_client()
+    server.shutdown()
+    common.report(f"{lookups} user lookups, {threads} threads, {GRANT_MS} ms per grant", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+    main(args.lookups, args.threads)
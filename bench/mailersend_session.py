@@ -0,0 +1,79 @@
+"""
+MailerSend transport: a fresh requests.post per email (the old adapter) vs the
+shared keep-alive session, against a local HTTP/1.1 stub.
+
+The stub delays each new connection by HANDSHAKE_MS to stand in for the TCP +
+TLS setup to api.mailersend.com; requests on a kept-alive connection skip it.
+
+    python bench/mailersend_session.py [--emails 300] [--threads 8]
+"""
+import argparse, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import common
+
+import requests  # noqa: E402
+from app.mailers import mailersend_adapter  # noqa: E402
+
+HANDSHAKE_MS = 30
+
+
+class _StubAPI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        time.sleep(HANDSHAKE_MS / 1000)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(202)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _run(send, emails, threads):
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(send, range(emails)))
+
+
+def main(emails, threads):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubAPI)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://%s:%d/v1/email" % server.server_address
+    mailersend_adapter.MAILERSEND_API_URL = url
+
+    def payload(i):
+        return mailersend_adapter._build_payload(f"user{i}@example.com", "Access request", "<p>hi</p>", "hi")
+
+    def per_request(i):
+        requests.post(url, json=payload(i), headers=mailersend_adapter._headers(),
+                      timeout=mailersend_adapter.MAILERSEND_TIMEOUT).raise_for_status()
+
+    def shared(i):
+        mailersend_adapter._post_with_retries(url, payload(i), "bench").raise_for_status()
+
+    plain, _ = common.timed(_run, per_request, emails, threads)
+    pooled, _ = common.timed(_run, shared, emails, threads)
+    stats = mailersend_adapter.connection_stats()
+    mailersend_adapter.close_session()
+    server.shutdown()
+    common.report(f"{emails} emails, {threads} threads, {HANDSHAKE_MS} ms connection setup", [
+        ("requests.post per email", f"{emails / plain:8.0f} req/s  ({emails} connections)"),
+        ("shared session", f"{emails / pooled:8.0f} req/s  ({stats['connections']} connections, "
+                           f"reuse {stats['reuse_rate']:.0%})"),
+        ("speedup", f"{plain / pooled:8.1f}x"),
+    ])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+    main(args.emails, args.threads)
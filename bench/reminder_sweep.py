@@ -0,0 +1,88 @@
+"""
+Reminder sweep over a large access_requests table: the old reminder_check
+(load every pending request past the age threshold as ORM objects and test
+last_notified_at in Python) vs tasks.reminder_check (indexed due query,
+keyset chunks, bulk UPDATE).
+
+    python bench/reminder_sweep.py [--rows 100000] [--pending 20000] [--due 100]
+
+The old path here only selects and marks the due rows (rolled back); the new
+one also issues tokens and queues the reminder emails, so the comparison
+favours the old path.
+"""
+import argparse, datetime, random, uuid
+
+import common
+
+common.migrate()
+
+from sqlalchemy import insert  # noqa: E402
+from app import tasks  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.db import SessionLocal, engine  # noqa: E402
+from app.models import AccessRequest, RequestStatus  # noqa: E402
+
+
+def seed(rows, pending, due):
+    rng = random.Random(6)
+    now = datetime.datetime.utcnow()
+    recent = now - datetime.timedelta(minutes=5)
+    decided = [RequestStatus.approved, RequestStatus.rejected, RequestStatus.expired]
+    data = []
+    for i in range(rows):
+        created = now - datetime.timedelta(hours=settings.REMINDER_HOURS + rng.randrange(1, 24 * 365))
+        is_pending, is_due = i < pending, i < due
+        last = created if is_due else recent
+        data.append(dict(
+            id=str(uuid.uuid4()), keycloak_user_id=f"user{i}", requester_email=f"user{i}@example.com",
+            requested_role="viewer", status=RequestStatus.pending if is_pending else rng.choice(decided),
+            created_at=created, updated_at=last, notify_count=1, last_notified_at=last,
+            next_reminder_at=(tasks.next_reminder_at("viewer", last) if is_pending else None)))
+    with engine.begin() as conn:
+        for start in range(0, rows, 10000):
+            conn.execute(insert(AccessRequest), data[start:start + 10000])
+        conn.exec_driver_sql("ANALYZE")
+
+
+def old_sweep():
+    """Selection and marking of the pre-index reminder_check; rolled back."""
+    db = SessionLocal()
+    try:
+        now = datetime.datetime.utcnow()
+        threshold = now - datetime.timedelta(hours=settings.REMINDER_HOURS)
+        pendings = db.query(AccessRequest).filter(AccessRequest.status == RequestStatus.pending,
+                                                  AccessRequest.created_at <= threshold).all()
+        due = 0
+        for r in pendings:
+            if not r.last_notified_at or (now - r.last_notified_at).total_seconds() > settings.REMINDER_CHECK_INTERVAL_MINUTES * 60:
+                r.last_notified_at = now
+                r.notify_count = (r.notify_count or 0) + 1
+                due += 1
+        db.flush()
+        return due
+    finally:
+        db.rollback()
+        db.close()
+
+
+def main(rows, pending, due):
+    seed(rows, pending, due)
+    old, old_due = common.timed(old_sweep)
+    new, queued = common.timed(tasks.reminder_check)
+    idle, _ = common.timed(tasks.reminder_check)
+    assert old_due == queued == due, (old_due, queued)
+    common.report(f"{rows} requests, {pending} pending, {due} due", [
+        ("old sweep (select + mark only)", f"{old * 1000:8.1f} ms"),
+        ("reminder_check", f"{new * 1000:8.1f} ms  ({queued} reminders queued)"),
+        ("reminder_check, nothing due", f"{idle * 1000:8.1f} ms"),
+        ("speedup", f"{old / new:8.1f}x"),
+    ])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--pending", type=int, default=20000)
+    parser.add_argument("--due", type=int, default=100)
+    args = parser.parse_args()
+    main(args.rows, args.pending, args.due)
@@ -0,0 +1,106 @@
+"""
+Load test for the SMTP connection pool: N messages from several threads to a
+local stub server, one connection per message (the old adapters) vs the pool.
+
+The stub delays its greeting by HANDSHAKE_MS to stand in for the TCP + TLS +
+AUTH round trips of a real relay; the stub speaks plain SMTP, so both senders
+connect with smtplib.SMTP and the comparison is about reuse, not TLS.
+
+    python bench/smtp_pool.py [--messages 400] [--threads 8]
+"""
+import argparse, smtplib, socketserver, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+import common
+
+from app.mailers import smtp_pool  # noqa: E402
+
+HANDSHAKE_MS = 30
+
+
+class _StubSMTP(socketserver.StreamRequestHandler):
+    """Accepts every message; just enough ESMTP for smtplib."""
+
+    def handle(self):
+        time.sleep(HANDSHAKE_MS / 1000)
+        self.wfile.write(b"220 stub ESMTP\r\n")
+        in_data = False
+        for line in self.rfile:
+            if in_data:
+                if line == b".\r\n":
+                    in_data = False
+                    with self.server.lock:
+                        self.server.messages += 1
+                    self.wfile.write(b"250 queued\r\n")
+                continue
+            verb = line[:4].upper()
+            if verb == b"EHLO":
+                self.wfile.write(b"250-stub\r\n250 8BITMIME\r\n")
+            elif verb == b"DATA":
+                in_data = True
+                self.wfile.write(b"354 go ahead\r\n")
+            elif verb == b"QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 ok\r\n")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    messages = 0
+    lock = threading.Lock()
+
+
+class _PlainPool(smtp_pool.SMTPConnectionPool):
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        self._count("connects")
+        return smtp_pool._PooledConnection(server)
+
+
+def _message(i):
+    msg = EmailMessage()
+    msg["Subject"] = f"Access request {i}"
+    msg["From"] = "noreply@example.com"
+    msg["To"] = "approver@example.com"
+    msg.set_content("Please approve or reject.")
+    return msg
+
+
+def _run(send, messages, threads):
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(send, (_message(i) for i in range(messages))))
+
+
+def main(messages, threads):
+    server = _Server(("127.0.0.1", 0), _StubSMTP)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+
+    def per_message(msg):
+        with smtplib.SMTP(host, port, timeout=10) as conn:
+            conn.send_message(msg)
+
+    pool = _PlainPool(host, port, None, None, max_size=threads)
+    plain, _ = common.timed(_run, per_message, messages, threads)
+    pooled, _ = common.timed(_run, pool.send_message, messages, threads)
+    pool.close_all()
+    server.shutdown()
+    stats = pool.snapshot()
+    assert server.messages == 2 * messages and stats["messages"] == messages
+    common.report(f"{messages} messages, {threads} threads, {HANDSHAKE_MS} ms handshake", [
+        ("connect per message", f"{messages / plain:8.0f} msg/s  ({messages} connects)"),
+        ("pooled", f"{messages / pooled:8.0f} msg/s  ({stats['connects']} connects, {stats['reused']} reused)"),
+        ("speedup", f"{plain / pooled:8.1f}x"),
+    ])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+    main(args.messages, args.threads)
@@ -0,0 +1,64 @@
+"""
+Approval email rendering: a new Jinja Environment per email (as tasks and
+mailer_utils did) vs the shared app.templating environment.
+
+    python bench/templates.py [--emails 2000]
+
+Also times a cold start of the shared environment with and without the
+on-disk bytecode cache.
+"""
+import argparse, os, tempfile
+
+import common
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape  # noqa: E402
+from app import templating  # noqa: E402
+from app.config import settings  # noqa: E402
+
+CTX = {"approver_name": "Approver", "requester_email": "alice@example.com", "requested_role": "project_access",
+       "approve_url": "https://example.com/callback?token=a", "reject_url": "https://example.com/callback?token=r",
+       "expiry_date": "2026-01-01T00:00:00"}
+
+
+def per_email_env(emails):
+    for _ in range(emails):
+        env = Environment(loader=FileSystemLoader(templating.TEMPLATES_DIR), autoescape=select_autoescape(["html"]))
+        env.get_template("approve_email.html").render(**CTX)
+        env.get_template("approve_email.txt").render(**CTX)
+
+
+def shared_env(emails):
+    for _ in range(emails):
+        templating.render_email("approve_email", CTX)
+
+
+def cold_start(bytecode_dir):
+    """Fresh environment (a new worker process) precompiling every template."""
+    settings.TEMPLATE_BYTECODE_CACHE = bytecode_dir is not None
+    settings.TEMPLATE_BYTECODE_CACHE_DIR = bytecode_dir or ""
+    templating.env = templating._create_env()
+    return templating.precompile_templates()
+
+
+def main(emails):
+    assert templating.render_email("approve_email", CTX)[0]
+    old, _ = common.timed(per_email_env, emails)
+    new, _ = common.timed(shared_env, emails)
+    bytecode_dir = os.path.join(tempfile.mkdtemp(prefix="iam-bench-bytecode-"), "jinja")
+    no_cache, _ = common.timed(cold_start, None)
+    cold_start(bytecode_dir)   # fills the cache
+    warm_cache, _ = common.timed(cold_start, bytecode_dir)
+    common.report(f"{emails} approval emails (html + txt)", [
+        ("Environment per email", f"{old / emails * 1000:7.3f} ms/email"),
+        ("shared environment", f"{new / emails * 1000:7.3f} ms/email"),
+        ("speedup", f"{old / new:7.1f}x"),
+        ("cold start, no bytecode cache", f"{no_cache * 1000:7.1f} ms"),
+        ("cold start, bytecode cache", f"{warm_cache * 1000:7.1f} ms"),
+    ])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.emails)
@@ -0,0 +1,63 @@
+"""
+Approval tokens in TOKEN_MODE=db vs TOKEN_MODE=stateless: issuing (each in its
+own transaction, as send_initial_email does) and the callback path
+(validate_token_no_mark, then consume_token and commit).
+
+    python bench/tokens.py [--tokens 2000]
+"""
+import argparse
+
+import common
+
+common.migrate()
+
+from sqlalchemy import func, select  # noqa: E402
+from app import tokens  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.db import SessionLocal  # noqa: E402
+from app.models import ApprovalToken, ConsumedToken  # noqa: E402
+
+
+def issue(n):
+    return [tokens.create_token_jti(f"req-{i}", "approve") for i in range(n)]
+
+
+def callback(issued):
+    for token in issued:
+        payload, err = tokens.validate_token_no_mark(token)
+        assert err is None, err
+        db = SessionLocal()
+        try:
+            assert tokens.consume_token(db, payload)
+            db.commit()
+        finally:
+            db.close()
+
+
+def _rows():
+    db = SessionLocal()
+    try:
+        return (db.execute(select(func.count()).select_from(ApprovalToken)).scalar()
+                + db.execute(select(func.count()).select_from(ConsumedToken)).scalar())
+    finally:
+        db.close()
+
+
+def main(n):
+    rows = []
+    for mode in ("db", "stateless"):
+        settings.TOKEN_MODE = mode
+        before = _rows()
+        issue_s, issued = common.timed(issue, n)
+        written = _rows() - before
+        callback_s, _ = common.timed(callback, issued)
+        rows.append((f"{mode}: issue", f"{issue_s / n * 1000:6.3f} ms/token  ({written} rows written)"))
+        rows.append((f"{mode}: validate + consume", f"{callback_s / n * 1000:6.3f} ms/token"))
+    common.report(f"{n} approval tokens", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.tokens)
@@ -0,0 +1,80 @@
+"""initial schema
+
+Matches the tables created by create_tables() before migrations existed.
+Databases created that way can be adopted with `alembic stamp 0001_initial`.
+
+Revision ID: 0001_initial
+Revises:
+Create Date: 2026-10-17 09:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001_initial"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+request_status = sa.Enum("pending", "approved", "rejected", "error", "expired", name="requeststatus")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "access_requests",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("keycloak_user_id", sa.String(36), nullable=False),
+        sa.Column("requester_email", sa.String(256)),
+        sa.Column("requested_role", sa.String(256)),
+        sa.Column("meta", sa.Text(), nullable=True),
+        sa.Column("status", request_status),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+        sa.Column("last_notified_at", sa.DateTime(), nullable=True),
+        sa.Column("notify_count", sa.Integer()),
+    )
+    op.create_table(
+        "approval_tokens",
+        sa.Column("jti", sa.String(64), primary_key=True),
+        sa.Column("request_id", sa.String(36), sa.ForeignKey("access_requests.id"), nullable=False),
+        sa.Column("action", sa.String(16), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("used_at", sa.DateTime(), nullable=True),
+    )
+    op.create_table(
+        "audit_logs",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("request_id", sa.String(36), nullable=True),
+        sa.Column("actor", sa.String(256), nullable=True),
+        sa.Column("action", sa.String(256), nullable=False),
+        sa.Column("ip", sa.String(64), nullable=True),
+        sa.Column("user_agent", sa.String(512), nullable=True),
+        sa.Column("meta", sa.Text(), nullable=True),
+        sa.Column("timestamp", sa.DateTime()),
+    )
+    op.create_table(
+        "inbound_emails",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("message_id", sa.String(256), nullable=True),
+        sa.Column("from_email", sa.String(256), nullable=True),
+        sa.Column("from_name", sa.String(256), nullable=True),
+        sa.Column("to_email", sa.String(1024), nullable=True),
+        sa.Column("subject", sa.String(512), nullable=True),
+        sa.Column("text", sa.Text(), nullable=True),
+        sa.Column("html", sa.Text(), nullable=True),
+        sa.Column("received_at", sa.DateTime()),
+        sa.Column("raw_payload", sa.Text(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("inbound_emails")
+    op.drop_table("audit_logs")
+    op.drop_table("approval_tokens")
+    op.drop_table("access_requests")
+    request_status.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,51 @@
+"""outbound email queue and reminder sweep index
+
+Revision ID: 0002_outbox
+Revises: 0001_initial
+Create Date: 2026-10-17 09:10:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_outbox"
+down_revision: Union[str, None] = "0001_initial"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+outbox_status = sa.Enum("pending", "sending", "sent", "failed", name="outboxstatus")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "outbound_emails",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("request_id", sa.String(36), nullable=True),
+        sa.Column("to_email", sa.String(256), nullable=False),
+        sa.Column("subject", sa.String(512), nullable=False),
+        sa.Column("html", sa.Text(), nullable=True),
+        sa.Column("text", sa.Text(), nullable=True),
+        sa.Column("status", outbox_status, nullable=False),
+        sa.Column("attempts", sa.Integer()),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("next_attempt_at", sa.DateTime()),
+        sa.Column("locked_by", sa.String(36), nullable=True),
+        sa.Column("locked_until", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("sent_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_outbound_emails_status_next_attempt", "outbound_emails", ["status", "next_attempt_at"])
+    op.create_index("ix_outbound_emails_locked_by", "outbound_emails", ["locked_by"])
+    op.create_index("ix_access_requests_status_created_id", "access_requests", ["status", "created_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_access_requests_status_created_id", table_name="access_requests")
+    op.drop_index("ix_outbound_emails_locked_by", table_name="outbound_emails")
+    op.drop_index("ix_outbound_emails_status_next_attempt", table_name="outbound_emails")
+    op.drop_table("outbound_emails")
+    outbox_status.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,41 @@
+"""secondary indexes for hot query paths
+
+- approval_tokens(request_id, used_at): admin_action invalidating a request's open tokens
+- access_requests(created_at, id): admin inbox ordering
+- audit_logs(request_id, timestamp), audit_logs(timestamp): per-request history, retention
+- inbound_emails(message_id), inbound_emails(received_at): lookup by message id, retention
+
+Revision ID: 0003_hot_path_indexes
+Revises: 0002_outbox
+Create Date: 2026-10-17 09:20:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_hot_path_indexes"
+down_revision: Union[str, None] = "0002_outbox"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_approval_tokens_request_used", "approval_tokens", ["request_id", "used_at"]),
+    ("ix_access_requests_created_id", "access_requests", ["created_at", "id"]),
+    ("ix_audit_logs_request_timestamp", "audit_logs", ["request_id", "timestamp"]),
+    ("ix_audit_logs_timestamp", "audit_logs", ["timestamp"]),
+    ("ix_inbound_emails_message_id", "inbound_emails", ["message_id"]),
+    ("ix_inbound_emails_received_at", "inbound_emails", ["received_at"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
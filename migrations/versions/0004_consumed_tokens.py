@@ -0,0 +1,34 @@
+"""consumed-jti ledger for stateless approval tokens
+
+Revision ID: 0004_consumed_tokens
+Revises: 0003_hot_path_indexes
+Create Date: 2026-10-17 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_consumed_tokens"
+down_revision: Union[str, None] = "0003_hot_path_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "consumed_tokens",
+        sa.Column("jti", sa.String(64), primary_key=True),
+        sa.Column("request_id", sa.String(36), nullable=True),
+        sa.Column("consumed_at", sa.DateTime()),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_consumed_tokens_expires_at", "consumed_tokens", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_consumed_tokens_expires_at", table_name="consumed_tokens")
+    op.drop_table("consumed_tokens")
@@ -0,0 +1,27 @@
+"""indexes for approval token compaction
+
+Revision ID: 0005_token_compaction_indexes
+Revises: 0004_consumed_tokens
+Create Date: 2026-10-17 10:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_token_compaction_indexes"
+down_revision: Union[str, None] = "0004_consumed_tokens"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_approval_tokens_expires_at", "approval_tokens", ["expires_at"])
+    op.create_index("ix_approval_tokens_used_at", "approval_tokens", ["used_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_approval_tokens_used_at", table_name="approval_tokens")
+    op.drop_index("ix_approval_tokens_expires_at", table_name="approval_tokens")
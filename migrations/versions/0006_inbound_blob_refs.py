@@ -0,0 +1,32 @@
+"""blob store refs on inbound_emails
+
+Revision ID: 0006_inbound_blob_refs
+Revises: 0005_token_compaction_indexes
+Create Date: 2026-10-17 11:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_inbound_blob_refs"
+down_revision: Union[str, None] = "0005_token_compaction_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("inbound_emails") as batch_op:
+        batch_op.add_column(sa.Column("text_ref", sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column("html_ref", sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column("raw_ref", sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("inbound_emails") as batch_op:
+        batch_op.drop_column("raw_ref")
+        batch_op.drop_column("html_ref")
+        batch_op.drop_column("text_ref")
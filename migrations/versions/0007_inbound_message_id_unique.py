@@ -0,0 +1,33 @@
+"""unique message_id on inbound_emails
+
+Revision ID: 0007_inbound_message_id_unique
+Revises: 0006_inbound_blob_refs
+Create Date: 2026-10-17 12:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007_inbound_message_id_unique"
+down_revision: Union[str, None] = "0006_inbound_blob_refs"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # keep one row per message_id (webhook retries stored before this revision)
+    op.execute(
+        "DELETE FROM inbound_emails WHERE message_id IS NOT NULL AND id NOT IN ("
+        " SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM inbound_emails"
+        " WHERE message_id IS NOT NULL GROUP BY message_id) AS keep)"
+    )
+    op.drop_index("ix_inbound_emails_message_id", table_name="inbound_emails")
+    op.create_index("ix_inbound_emails_message_id", "inbound_emails", ["message_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inbound_emails_message_id", table_name="inbound_emails")
+    op.create_index("ix_inbound_emails_message_id", "inbound_emails", ["message_id"])
@@ -0,0 +1,50 @@
+"""provisioning state on access_requests
+
+Requests approved before this revision were never handed to Keycloak by the
+app (approval only changed the status), and their roles may have been granted
+or revoked by hand since. They are marked provisioned, with zero attempts as
+the legacy marker, so the provisioning worker does not grant them on first run.
+
+Revision ID: 0008_provisioning
+Revises: 0007_inbound_message_id_unique
+Create Date: 2026-10-17 14:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008_provisioning"
+down_revision: Union[str, None] = "0007_inbound_message_id_unique"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("access_requests") as batch_op:
+        batch_op.add_column(sa.Column("provisioned_at", sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column("provision_attempts", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("provision_next_at", sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column("provision_error", sa.Text(), nullable=True))
+
+    requests = sa.table("access_requests",
+                        sa.column("status", sa.String), sa.column("created_at", sa.DateTime),
+                        sa.column("updated_at", sa.DateTime), sa.column("provisioned_at", sa.DateTime),
+                        sa.column("provision_attempts", sa.Integer))
+    op.execute(
+        requests.update()
+        .where(requests.c.status == "approved", requests.c.provisioned_at.is_(None))
+        .values(provisioned_at=sa.func.coalesce(requests.c.updated_at, requests.c.created_at, sa.func.current_timestamp()),
+                provision_attempts=0)
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("access_requests") as batch_op:
+        batch_op.drop_column("provision_error")
+        batch_op.drop_column("provision_next_at")
+        batch_op.drop_column("provision_attempts")
+        batch_op.drop_column("provisioned_at")
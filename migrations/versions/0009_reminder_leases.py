@@ -0,0 +1,32 @@
+"""reminder sweep leases on access_requests
+
+Revision ID: 0009_reminder_leases
+Revises: 0008_provisioning
+Create Date: 2026-10-17 15:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009_reminder_leases"
+down_revision: Union[str, None] = "0008_provisioning"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("access_requests") as batch_op:
+        batch_op.add_column(sa.Column("reminder_lease_owner", sa.String(length=36), nullable=True))
+        batch_op.add_column(sa.Column("reminder_lease_until", sa.DateTime(), nullable=True))
+    op.create_index("ix_access_requests_reminder_lease_owner", "access_requests", ["reminder_lease_owner"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_access_requests_reminder_lease_owner", table_name="access_requests")
+    with op.batch_alter_table("access_requests") as batch_op:
+        batch_op.drop_column("reminder_lease_until")
+        batch_op.drop_column("reminder_lease_owner")
@@ -0,0 +1,49 @@
+"""per-request reminder due time on access_requests
+
+Revision ID: 0010_next_reminder_at
+Revises: 0009_reminder_leases
+Create Date: 2026-10-17 17:00:00
+
+"""
+import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0010_next_reminder_at"
+down_revision: Union[str, None] = "0009_reminder_leases"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("access_requests") as batch_op:
+        batch_op.add_column(sa.Column("next_reminder_at", sa.DateTime(), nullable=True))
+    op.create_index("ix_access_requests_status_next_reminder", "access_requests", ["status", "next_reminder_at"])
+
+    # pending requests: next reminder one interval after the last notification (or creation)
+    requests = sa.table("access_requests",
+                        sa.column("id", sa.String), sa.column("status", sa.String),
+                        sa.column("requested_role", sa.String), sa.column("created_at", sa.DateTime),
+                        sa.column("last_notified_at", sa.DateTime), sa.column("next_reminder_at", sa.DateTime))
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(requests.c.id, requests.c.requested_role, requests.c.created_at, requests.c.last_notified_at)
+        .where(requests.c.status == "pending")
+    ).all()
+    for row in rows:
+        after = row.last_notified_at or row.created_at or datetime.datetime.utcnow()
+        hours = settings.REMINDER_HOURS_BY_ROLE.get(row.requested_role, settings.REMINDER_HOURS)
+        bind.execute(requests.update().where(requests.c.id == row.id)
+                     .values(next_reminder_at=after + datetime.timedelta(hours=hours)))
+
+
+def downgrade() -> None:
+    op.drop_index("ix_access_requests_status_next_reminder", table_name="access_requests")
+    with op.batch_alter_table("access_requests") as batch_op:
+        batch_op.drop_column("next_reminder_at")
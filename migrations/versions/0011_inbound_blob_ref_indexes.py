@@ -0,0 +1,29 @@
+"""index inbound_emails blob refs for blob garbage collection
+
+Revision ID: 0011_inbound_blob_ref_indexes
+Revises: 0010_next_reminder_at
+Create Date: 2026-10-18 09:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0011_inbound_blob_ref_indexes"
+down_revision: Union[str, None] = "0010_next_reminder_at"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+REF_COLUMNS = ("text_ref", "html_ref", "raw_ref")
+
+
+def upgrade() -> None:
+    for column in REF_COLUMNS:
+        op.create_index(f"ix_inbound_emails_{column}", "inbound_emails", [column])
+
+
+def downgrade() -> None:
+    for column in REF_COLUMNS:
+        op.drop_index(f"ix_inbound_emails_{column}", table_name="inbound_emails")
@@ -0,0 +1,46 @@
+"""track MailerSend bulk ids on outbound_emails
+
+Revision ID: 0012_outbox_bulk_status
+Revises: 0011_inbound_blob_ref_indexes
+Create Date: 2026-10-18 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0012_outbox_bulk_status"
+down_revision: Union[str, None] = "0011_inbound_blob_ref_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+old_status = sa.Enum("pending", "sending", "sent", "failed", name="outboxstatus")
+new_status = sa.Enum("pending", "sending", "accepted", "sent", "failed", name="outboxstatus")
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE outboxstatus ADD VALUE IF NOT EXISTS 'accepted' AFTER 'sending'")
+        status_change = None
+    else:
+        status_change = dict(type_=new_status, existing_type=old_status, existing_nullable=False)
+    with op.batch_alter_table("outbound_emails") as batch_op:
+        if status_change:
+            batch_op.alter_column("status", **status_change)
+        batch_op.add_column(sa.Column("bulk_email_id", sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column("bulk_index", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    # accepted messages were handed to the provider; treat them as sent
+    op.execute("UPDATE outbound_emails SET status = 'sent' WHERE status = 'accepted'")
+    with op.batch_alter_table("outbound_emails") as batch_op:
+        batch_op.drop_column("bulk_index")
+        batch_op.drop_column("bulk_email_id")
+        if op.get_bind().dialect.name != "postgresql":
+            # Postgres cannot drop an enum value; the unused label stays
+            batch_op.alter_column("status", type_=old_status, existing_type=new_status, existing_nullable=False)
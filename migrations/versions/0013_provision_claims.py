@@ -0,0 +1,31 @@
+"""provisioning claim column and due-work index
+
+Revision ID: 0013_provision_claims
+Revises: 0012_outbox_bulk_status
+Create Date: 2026-10-18 11:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0013_provision_claims"
+down_revision: Union[str, None] = "0012_outbox_bulk_status"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("access_requests") as batch_op:
+        batch_op.add_column(sa.Column("provision_lease_owner", sa.String(length=36), nullable=True))
+    op.create_index("ix_access_requests_provision_due", "access_requests",
+                    ["status", "provisioned_at", "updated_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_access_requests_provision_due", table_name="access_requests")
+    with op.batch_alter_table("access_requests") as batch_op:
+        batch_op.drop_column("provision_lease_owner")
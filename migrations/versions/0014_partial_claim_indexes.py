@@ -0,0 +1,41 @@
+"""partial indexes on claim columns
+
+reminder_lease_owner and outbound_emails.locked_by are NULL except while a
+batch is claimed. After ANALYZE a full index on them has one huge NULL group,
+so SQLite stops using it for the `owner = :claim` lookups and scans the table.
+Indexing only non-NULL values keeps those lookups on the index.
+
+Revision ID: 0014_partial_claim_indexes
+Revises: 0013_provision_claims
+Create Date: 2026-10-18 15:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0014_partial_claim_indexes"
+down_revision: Union[str, None] = "0013_provision_claims"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_access_requests_reminder_lease_owner", "access_requests", "reminder_lease_owner"),
+    ("ix_outbound_emails_locked_by", "outbound_emails", "locked_by"),
+]
+
+
+def upgrade() -> None:
+    for name, table, column in INDEXES:
+        where = sa.text(f"{column} IS NOT NULL")
+        op.drop_index(name, table_name=table)
+        op.create_index(name, table, [column], sqlite_where=where, postgresql_where=where)
+
+
+def downgrade() -> None:
+    for name, table, column in INDEXES:
+        op.drop_index(name, table_name=table)
+        op.create_index(name, table, [column])
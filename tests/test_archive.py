@@ -0,0 +1,32 @@
+import datetime
+
+from app import archive
+from app.models import AuditLog
+
+
+def _logs(db, n, start):
+    for i in range(n):
+        db.add(AuditLog(id=f"log{i:03d}", actor="test", action=f"act{i}", meta="",
+                        timestamp=start + datetime.timedelta(hours=6 * i)))
+    db.commit()
+
+
+def test_failed_delete_does_not_duplicate_archived_rows(db, monkeypatch):
+    start = datetime.datetime(2025, 1, 1)
+    _logs(db, 10, start)
+    cutoff = start + datetime.timedelta(days=30)
+    delete = archive.delete
+
+    def failing_delete(model):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(archive, "delete", failing_delete)
+    try:
+        archive.archive_table("audit_logs", cutoff, chunk_size=4)
+    except RuntimeError:
+        pass
+    monkeypatch.setattr(archive, "delete", delete)
+
+    assert archive.archive_table("audit_logs", cutoff, chunk_size=4) == 10
+    archived = [r["id"] for r in archive.query_archive("audit_logs")]
+    assert sorted(archived) == [f"log{i:03d}" for i in range(10)]
+    assert db.query(AuditLog).count() == 0
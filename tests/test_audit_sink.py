@@ -0,0 +1,71 @@
+import json
+
+import pytest
+from sqlalchemy import select
+
+from app import audit
+from app.models import AuditLog
+
+
+class Store:
+    """Blob store stand-in that keeps what was put."""
+
+    def __init__(self):
+        self.blobs = []
+
+    def put(self, data):
+        self.blobs.append(data)
+        return f"ref{len(self.blobs)}"
+
+    def records(self, i=0):
+        return [json.loads(line) for line in self.blobs[i].decode().splitlines()]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = Store()
+    monkeypatch.setattr(audit, "get_blob_store", lambda: store)
+    return store
+
+
+def _sink(monkeypatch, failures):
+    """An AuditSink whose first `failures` inserts fail, with four records queued."""
+    sink = audit.AuditSink(batch_size=10, flush_interval=0.001, max_attempts=3)
+    write = sink._write
+    calls = []
+
+    def flaky(rows):
+        calls.append(len(rows))
+        if len(calls) <= failures:
+            raise RuntimeError("database is locked")
+        write(rows)
+    monkeypatch.setattr(sink, "_write", flaky)
+    for i in range(4):
+        sink._queue.put(({"id": f"a{i}", "actor": "test", "action": f"act{i}", "meta": ""}, 0))
+    return sink, calls
+
+
+def test_failed_batch_is_retried(db, monkeypatch, store):
+    sink, calls = _sink(monkeypatch, failures=2)
+    sink.flush()
+    assert calls == [4, 4, 4]
+    assert sorted(db.execute(select(AuditLog.action)).scalars()) == ["act0", "act1", "act2", "act3"]
+    assert store.blobs == []
+
+
+def test_batch_is_dead_lettered_after_max_attempts(db, monkeypatch, store):
+    sink, calls = _sink(monkeypatch, failures=10)
+    sink.flush()
+    assert calls == [4, 4, 4]
+    assert db.execute(select(AuditLog)).first() is None
+    assert [r["action"] for r in store.records()] == ["act0", "act1", "act2", "act3"]
+
+
+def test_failed_sync_write_is_dead_lettered(monkeypatch, store):
+    sink = audit.AuditSink()
+
+    def down(rows):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(sink, "_write", down)
+    sink.submit({"actor": "test", "action": "sync", "meta": ""})
+    assert [r["action"] for r in store.records()] == ["sync"]
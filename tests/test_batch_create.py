@@ -0,0 +1,32 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import AccessRequest, OutboundEmail
+
+client = TestClient(app)
+
+VALID = {"keycloak_user_id": "alice", "requester_email": "alice@example.com", "requested_role": "viewer"}
+
+
+def test_malformed_items_fail_alone(db):
+    items = [VALID, 5, "alice", None, dict(VALID, requester_email="not-an-email"), dict(VALID, keycloak_user_id="bob")]
+
+    resp = client.post("/api/v1/requests:batch", json={"items": items})
+
+    assert resp.status_code == 200
+    body = resp.json()
+    assert (body["created"], body["failed"]) == (2, 4)
+    assert [r["ok"] for r in body["results"]] == [True, False, False, False, False, True]
+    assert body["results"][1]["error"] == "item must be a JSON object"
+    assert body["results"][4]["error"].startswith("requester_email:")
+    assert db.query(AccessRequest).count() == 2
+    assert db.query(OutboundEmail).count() == 2
+
+
+def test_too_many_items(db, monkeypatch):
+    monkeypatch.setattr("app.main.settings.REQUEST_BATCH_MAX_ITEMS", 2)
+
+    resp = client.post("/api/v1/requests:batch", json={"items": [VALID] * 3})
+
+    assert resp.status_code == 413
+    assert db.query(AccessRequest).count() == 0
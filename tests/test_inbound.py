@@ -0,0 +1,41 @@
+import json, threading
+
+from app.inbound import InboundBatcher
+from app.models import InboundEmail
+
+
+def _body(i):
+    return json.dumps({"message_id": f"<m{i}@example.com>", "from": {"email": "a@example.com"},
+                       "subject": "hi", "text": "hello"}).encode()
+
+
+def test_store_routes_off_the_request_thread(db):
+    batcher = InboundBatcher()
+    release, routed = threading.Event(), []
+
+    def slow_stage(emails):
+        release.wait(5)
+        routed.append((threading.current_thread().name, [e["message_id"] for e in emails]))
+    batcher.stages.append(slow_stage)
+
+    stored = batcher.store(_body(1))
+
+    # stored and returned while the stage is still blocked
+    assert [r["message_id"] for r in stored] == ["<m1@example.com>"]
+    assert db.query(InboundEmail).count() == 1 and routed == []
+    release.set()
+    batcher.stop()
+    assert routed == [("inbound-stages_0", ["<m1@example.com>"])]
+
+
+def test_stats_from_concurrent_stores(db):
+    batcher = InboundBatcher()
+    threads = [threading.Thread(target=batcher.store, args=(_body(i % 10),)) for i in range(40)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.stop()
+    assert batcher.stats["received"] == 40
+    assert batcher.stats["stored"] + batcher.stats["duplicates"] == 40
+    assert db.query(InboundEmail).count() == 10 == batcher.stats["stored"]
@@ -0,0 +1,59 @@
+import time
+
+from app import inbound_rules
+from app.inbound_rules import DEFAULT_RULES, RuleSet
+from app.models import AccessRequest, AuditLog
+
+
+def test_later_rule_matches_when_an_earlier_one_shares_a_field():
+    rules = RuleSet([("A", "file", False, {"subject": "access", "sender": r"@corp\.com$"}),
+                     ("B", "reject", False, {"subject": "access"})])
+
+    assert rules.classify({"subject": "access please", "sender": "z@other.com"}, has_ref=False) == ("B", "reject")
+    assert rules.classify({"subject": "access please", "sender": "z@corp.com"}, has_ref=False) == ("A", "file")
+
+
+def test_default_rules():
+    rules = RuleSet(DEFAULT_RULES)
+
+    assert rules.classify({"body": "Approved, thanks"}, has_ref=True) == ("reply_approve", "approve")
+    assert rules.classify({"body": "> no way"}, has_ref=True) == ("reply_reject", "reject")
+    assert rules.classify({"subject": "Requesting access, role: viewer"}, has_ref=False) == ("file_request", "file")
+    assert rules.classify({"body": "approved"}, has_ref=False) == (None, None)
+
+
+def test_huge_body_is_cut_before_matching():
+    email = {"text": "hello " * 200000, "html": None}
+    body = inbound_rules._body(email)
+    rules = RuleSet(DEFAULT_RULES)
+
+    started = time.perf_counter()
+    rules.classify({"subject": "Re: access", "body": body}, has_ref=True)
+    assert len(body) == inbound_rules.settings.INBOUND_CLASSIFY_MAX_CHARS
+    assert time.perf_counter() - started < 0.05
+
+
+class FakeKeycloak:
+    def __init__(self):
+        self.lookups = []
+
+    def get_user_id_by_username_or_email(self, value):
+        self.lookups.append(value)
+        return "user-1"
+
+
+def test_file_request_needs_spf_and_dkim(db, monkeypatch):
+    sent = []
+    monkeypatch.setattr("app.tasks.send_initial_email", lambda *args: sent.append(args))
+    keycloak = FakeKeycloak()
+    email = {"message_id": "m1", "from_email": "alice@example.com", "subject": "access request role: viewer",
+             "text": "please", "auth": {"spf": True, "dkim": False}}
+
+    inbound_rules._file_request(email, keycloak)
+    assert keycloak.lookups == [] and sent == []
+    assert db.query(AuditLog).filter_by(action="inbound_ignored").one().meta.endswith("SPF/DKIM did not pass")
+
+    inbound_rules._file_request(dict(email, message_id="m2", auth={"spf": True, "dkim": True}), keycloak)
+    req = db.query(AccessRequest).one()
+    assert (req.keycloak_user_id, req.requested_role) == ("user-1", "viewer")
+    assert len(sent) == 1
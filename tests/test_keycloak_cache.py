@@ -0,0 +1,128 @@
+import pytest
+import requests
+
+from app import keyclock_client
+from app.keyclock_client import KeycloakClient, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(keyclock_client.time, "monotonic", clock)
+    return clock
+
+
+class StubAdmin:
+    """The parts of KeycloakAdmin the client uses, counting calls."""
+
+    def __init__(self):
+        self.users = {"alice": "id-alice"}
+        self.roles = {"viewer": {"id": "r1", "name": "viewer"}}
+        self.user_queries = 0
+        self.role_queries = 0
+        self.fail_assign = False
+
+    def get_users(self, query):
+        self.user_queries += 1
+        user_id = self.users.get(query.get("username") or query.get("email"))
+        return [{"id": user_id}] if user_id else []
+
+    def get_realm_role(self, role_name):
+        self.role_queries += 1
+        return self.roles[role_name]
+
+    def assign_realm_roles(self, user_id, roles):
+        if self.fail_assign:
+            raise RuntimeError("409 conflict")
+
+
+def _client(admin):
+    return KeycloakClient(kc_admin=admin, user_cache=TTLCache(maxsize=2, ttl=60, negative_ttl=5),
+                          role_cache=TTLCache(maxsize=2, ttl=60))
+
+
+def test_user_lookup_hits_the_cache(clock):
+    admin = StubAdmin()
+    client = _client(admin)
+
+    assert client.get_user_id_by_username_or_email("alice") == "id-alice"
+    assert client.get_user_id_by_username_or_email("ALICE") == "id-alice"
+    assert admin.user_queries == 1
+    assert client.cache_stats()["users"] == {"hits": 1, "misses": 1, "evictions": 0, "size": 1}
+
+
+def test_entries_expire_after_their_ttl(clock):
+    admin = StubAdmin()
+    client = _client(admin)
+    client.get_user_id_by_username_or_email("alice")
+    # unknown users are cached too, for the shorter negative TTL (two queries: username, then email)
+    assert client.get_user_id_by_username_or_email("bob") is None
+    assert admin.user_queries == 3
+
+    clock.now += 6
+    admin.users["bob"] = "id-bob"
+    assert client.get_user_id_by_username_or_email("bob") == "id-bob"
+    assert client.get_user_id_by_username_or_email("alice") == "id-alice"
+    assert admin.user_queries == 4
+
+    clock.now += 60
+    client.get_user_id_by_username_or_email("alice")
+    assert admin.user_queries == 5
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b", None) is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats["evictions"] == 1
+
+
+def test_invalidation(clock):
+    admin = StubAdmin()
+    client = _client(admin)
+    client.get_user_id_by_username_or_email("alice")
+    client.get_realm_role("viewer")
+
+    client.invalidate_user("Alice")
+    client.invalidate_role()
+    client.get_user_id_by_username_or_email("alice")
+    client.get_realm_role("viewer")
+    assert (admin.user_queries, admin.role_queries) == (2, 2)
+
+
+def test_failed_assignment_evicts_the_cached_role(clock):
+    admin = StubAdmin()
+    client = _client(admin)
+    client.assign_realm_roles("id-alice", ["viewer"])
+    client.assign_realm_roles("id-alice", ["viewer"])
+    assert admin.role_queries == 1
+
+    admin.fail_assign = True
+    with pytest.raises(RuntimeError):
+        client.assign_realm_roles("id-alice", ["viewer"])
+    client.get_realm_role("viewer")
+    assert admin.role_queries == 2
+
+
+def test_admin_session_retries_only_idempotent_methods():
+    admin = StubAdmin()
+    admin.connection = type("Connection", (), {"_s": requests.Session()})()
+    _client(admin)._tune_connection()
+
+    retry = admin.connection._s.get_adapter("https://keycloak.example.com/").max_retries
+    assert retry.total == 1
+    assert "GET" in retry.allowed_methods and "PUT" in retry.allowed_methods
+    assert "POST" not in retry.allowed_methods
@@ -0,0 +1,124 @@
+import datetime
+
+import pytest
+
+from app import outbox
+from app.config import settings
+from app.mailers import mailersend_adapter
+from app.models import OutboundEmail, OutboxStatus
+
+BULK_URL = mailersend_adapter.MAILERSEND_BULK_API_URL
+EMAIL_URL = mailersend_adapter.MAILERSEND_API_URL
+
+
+@pytest.fixture(autouse=True)
+def fresh_session():
+    mailersend_adapter.close_session()
+    yield
+    mailersend_adapter.close_session()
+
+
+def _messages(n, bad=()):
+    return [{"to_email": f"bad{i}@example.com" if i in bad else f"user{i}@example.com",
+             "subject": f"s{i}", "html_body": "<p>hi</p>", "text_body": "hi"} for i in range(n)]
+
+
+def _recipients(request):
+    return [m["to"][0]["email"] for m in request.json()]
+
+
+def _reject_bad(status):
+    """Bulk endpoint stub: accepts a payload only when it holds no bad address."""
+    def respond(request, context):
+        if any(r.startswith("bad") for r in _recipients(request)):
+            context.status_code = status
+            return {"message": "invalid"}
+        context.status_code = 202
+        return {"bulk_email_id": f"bulk-{len(request.json())}"}
+    return respond
+
+
+def _single(request, context):
+    context.status_code = 422 if request.json()["to"][0]["email"].startswith("bad") else 202
+    return {}
+
+
+@pytest.mark.parametrize("status", [413, 422])
+def test_rejected_bulk_is_split_to_isolate_bad_messages(requests_mock, status):
+    requests_mock.post(BULK_URL, json=_reject_bad(status))
+    requests_mock.post(EMAIL_URL, json=_single)
+
+    results = mailersend_adapter.send_bulk(_messages(4, bad={3}))
+
+    assert [r["ok"] for r in results] == [True, True, True, False]
+    assert [r["bulk_email_id"] for r in results[:2]] == ["bulk-2", "bulk-2"]
+    assert [r["bulk_index"] for r in results[:2]] == [0, 1]
+    # [0..3] rejected -> [0,1] accepted, [2,3] rejected -> 2 and 3 sent alone
+    assert [len(r.json()) if r.url == BULK_URL else 1 for r in requests_mock.request_history] == [4, 2, 2, 1, 1]
+
+
+def test_other_rejections_fail_the_batch_without_splitting(requests_mock):
+    requests_mock.post(BULK_URL, status_code=401, json={"message": "Unauthenticated."})
+
+    results = mailersend_adapter.send_bulk(_messages(8))
+
+    assert requests_mock.call_count == 1
+    assert all(not r["ok"] and "401" in r["error"] for r in results)
+
+
+def test_accepted_bulk_is_reconciled_per_message(db, requests_mock, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_BULK_CHECK_INTERVAL_SECONDS", 0)
+    requests_mock.post(BULK_URL, status_code=202, json={"bulk_email_id": "bulk-1"})
+    status = requests_mock.get(f"{BULK_URL}/bulk-1", json={"data": {"state": "processing"}})
+    for m in _messages(3):
+        outbox.enqueue_email(m["to_email"], m["subject"], m["html_body"], m["text_body"])
+
+    assert outbox.process_batch() == 3
+    sent_order = _recipients(requests_mock.request_history[0])
+    assert {r.status for r in db.query(OutboundEmail)} == {OutboxStatus.accepted}
+
+    assert outbox.reconcile_bulk() == 0
+    assert status.call_count == 1
+    db.expire_all()
+    assert {r.status for r in db.query(OutboundEmail)} == {OutboxStatus.accepted}
+
+    requests_mock.get(f"{BULK_URL}/bulk-1", json={"data": {
+        "state": "completed", "validation_errors": {"message.1.to.0.email": ["The email must be a valid address."]}}})
+    assert outbox.reconcile_bulk() == 3
+    db.expire_all()
+    rows = {r.to_email: r for r in db.query(OutboundEmail)}
+    assert [rows[to].status for to in sent_order] == [OutboxStatus.sent, OutboxStatus.failed, OutboxStatus.sent]
+    assert rows[sent_order[1]].last_error == "message.1.to.0.email: The email must be a valid address."
+    assert rows[sent_order[1]].bulk_index == 1
+    assert all(r.html is None and r.text is None for r in rows.values())
+
+
+def test_without_the_outbox_batches_are_sent_one_by_one(requests_mock, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_ENABLED", False)
+    bulk = requests_mock.post(BULK_URL, status_code=202, json={"bulk_email_id": "never-reconciled"})
+    single = requests_mock.post(EMAIL_URL, json=_single)
+
+    results = outbox.submit_batch(_messages(3, bad={1}))
+
+    assert bulk.call_count == 0 and single.call_count == 3
+    assert [r["ok"] for r in results] == [True, False, True]
+    assert not any(r.get("bulk_email_id") for r in results)
+
+
+def test_unconfirmed_bulk_is_failed_after_max_age(db, requests_mock, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_BULK_CHECK_INTERVAL_SECONDS", 0)
+    requests_mock.post(BULK_URL, status_code=202, json={"bulk_email_id": "bulk-1"})
+    requests_mock.get(f"{BULK_URL}/bulk-1", status_code=500)
+    for m in _messages(2):
+        outbox.enqueue_email(m["to_email"], m["subject"], m["html_body"], m["text_body"])
+    assert outbox.process_batch() == 2
+    stale = db.query(OutboundEmail).filter(OutboundEmail.to_email == "user0@example.com").one()
+    stale.created_at -= datetime.timedelta(hours=settings.OUTBOX_BULK_MAX_AGE_HOURS + 1)
+    db.commit()
+
+    assert outbox.reconcile_bulk() == 1
+    db.expire_all()
+    rows = {r.to_email: r for r in db.query(OutboundEmail)}
+    assert rows["user0@example.com"].status == OutboxStatus.failed
+    assert rows["user0@example.com"].last_error.startswith("bulk not confirmed after 24h (status check failed")
+    assert rows["user1@example.com"].status == OutboxStatus.accepted
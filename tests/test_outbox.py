@@ -0,0 +1,17 @@
+from app import outbox
+
+
+def test_workers_are_woken_after_the_caller_commits(db):
+    outbox._wake.clear()
+    outbox.enqueue_email("a@example.com", "s", "<p>x</p>", "x", db=db)
+    outbox.submit_batch([{"to_email": "b@example.com", "subject": "s"}], db=db)
+    assert not outbox._wake.is_set()
+    db.commit()
+    assert outbox._wake.is_set()
+
+
+def test_rolled_back_messages_do_not_wake_the_workers(db):
+    outbox._wake.clear()
+    outbox.enqueue_email("a@example.com", "s", "<p>x</p>", "x", db=db)
+    db.rollback()
+    assert not outbox._wake.is_set()
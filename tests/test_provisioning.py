@@ -0,0 +1,126 @@
+import datetime
+
+from alembic import command
+from sqlalchemy import create_engine, text
+
+from app import provisioning
+from app.config import settings
+from app.keyclock_client import KeycloakClient, TTLCache
+from app.models import AccessRequest, AuditLog, RequestStatus
+
+
+class FakeNotFound(Exception):
+    response_code = 404
+
+
+class FakeAdmin:
+    """Stands in for python-keycloak's KeycloakAdmin; records every admin call."""
+
+    def __init__(self, roles=("viewer", "editor"), failing_users=()):
+        self.roles = set(roles)
+        self.failing_users = set(failing_users)
+        self.role_lookups = []
+        self.assignments = []
+
+    def get_realm_role(self, role_name):
+        self.role_lookups.append(role_name)
+        if role_name not in self.roles:
+            raise FakeNotFound(role_name)
+        return {"id": f"id-{role_name}", "name": role_name}
+
+    def assign_realm_roles(self, user_id, roles):
+        if user_id in self.failing_users:
+            raise RuntimeError("keycloak unavailable")
+        self.assignments.append((user_id, sorted(r["name"] for r in roles)))
+
+
+def _client(admin):
+    return KeycloakClient(kc_admin=admin, user_cache=TTLCache(), role_cache=TTLCache())
+
+
+def _approved(db, user, role, **values):
+    req = AccessRequest(keycloak_user_id=user, requester_email=f"{user}@example.com", requested_role=role,
+                        status=values.pop("status", RequestStatus.approved), **values)
+    db.add(req)
+    db.commit()
+    return req.id
+
+
+def test_assigns_each_users_roles_in_one_call(db):
+    ids = [_approved(db, "alice", "viewer"), _approved(db, "alice", "editor"), _approved(db, "bob", "viewer")]
+    _approved(db, "carol", "viewer", status=RequestStatus.pending)
+    _approved(db, "dave", "viewer", provisioned_at=datetime.datetime.utcnow())
+    admin = FakeAdmin()
+
+    counts = provisioning.provision_approved(client=_client(admin))
+
+    assert counts == {"provisioned": 3, "retry": 0, "error": 0}
+    assert sorted(admin.role_lookups) == ["editor", "viewer"]
+    assert sorted(admin.assignments) == [("alice", ["editor", "viewer"]), ("bob", ["viewer"])]
+    for req in db.query(AccessRequest).filter(AccessRequest.id.in_(ids)):
+        assert req.provisioned_at is not None
+        assert req.provision_lease_owner is None
+    assert provisioning.provision_approved(client=_client(admin)) == {"provisioned": 0, "retry": 0, "error": 0}
+    assert len(admin.assignments) == 2
+
+
+def test_claimed_rows_are_hidden_until_the_lease_expires(db):
+    _approved(db, "alice", "viewer")
+    now = datetime.datetime.utcnow()
+
+    assert len(provisioning._claim(db, now, 10)) == 1
+    assert provisioning._claim(db, now, 10) == []
+    later = now + datetime.timedelta(seconds=settings.PROVISION_LEASE_SECONDS + 1)
+    assert len(provisioning._claim(db, later, 10)) == 1
+
+
+def test_failures_back_off_then_give_up(db, monkeypatch):
+    monkeypatch.setattr(settings, "PROVISION_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(settings, "PROVISION_RETRY_BACKOFF_SECONDS", 60)
+    request_id = _approved(db, "alice", "viewer")
+    admin = FakeAdmin(failing_users={"alice"})
+
+    assert provisioning.provision_approved(client=_client(admin))["retry"] == 1
+    req = db.get(AccessRequest, request_id)
+    assert (req.status, req.provision_attempts, req.provision_error) == (RequestStatus.approved, 1, "keycloak unavailable")
+    assert req.provision_next_at > datetime.datetime.utcnow() + datetime.timedelta(seconds=50)
+    # backing off: the next run leaves it alone
+    assert provisioning.provision_approved(client=_client(admin))["retry"] == 0
+
+    req.provision_next_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db.commit()
+    assert provisioning.provision_approved(client=_client(admin))["error"] == 1
+    db.expire_all()
+    req = db.get(AccessRequest, request_id)
+    assert (req.status, req.provision_attempts, req.provision_next_at) == (RequestStatus.error, 2, None)
+    assert db.query(AuditLog).filter_by(request_id=request_id, action="provision_failed").count() == 1
+
+
+def test_unknown_role_fails_at_once(db):
+    request_id = _approved(db, "alice", "no-such-role")
+    admin = FakeAdmin()
+
+    assert provisioning.provision_approved(client=_client(admin))["error"] == 1
+    assert admin.assignments == []
+    req = db.get(AccessRequest, request_id)
+    assert (req.status, req.provision_error) == (RequestStatus.error, "role not found: no-such-role")
+
+
+def test_migration_marks_earlier_approvals_provisioned(alembic_cfg, tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    monkeypatch.setattr(settings, "DATABASE_URL", url)
+    command.upgrade(alembic_cfg, "0007_inbound_message_id_unique")
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        for request_id, status in (("r1", "approved"), ("r2", "pending")):
+            conn.execute(text("INSERT INTO access_requests (id, keycloak_user_id, status, created_at, updated_at) "
+                              "VALUES (:id, 'alice', :status, '2025-01-01 00:00:00', '2025-01-02 00:00:00')"),
+                         {"id": request_id, "status": status})
+
+    command.upgrade(alembic_cfg, "0008_provisioning")
+
+    with engine.connect() as conn:
+        rows = dict(conn.execute(text("SELECT id, provisioned_at FROM access_requests")).all())
+    engine.dispose()
+    assert rows["r1"].startswith("2025-01-02")
+    assert rows["r2"] is None
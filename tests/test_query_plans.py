@@ -0,0 +1,165 @@
+"""
+EXPLAIN QUERY PLAN checks for the hot queries. Each test runs the real code
+path against the migrated SQLite schema, records the SQL it issues and fails
+if any statement reads its table with a full scan instead of an index.
+
+The tables are seeded with a production-like mix (mostly settled rows, a few
+due ones) and ANALYZEd first, so the planner chooses with real statistics.
+"""
+import contextlib, datetime, random, re, uuid
+
+import pytest
+from sqlalchemy import event, insert
+
+from app import outbox, provisioning, tasks, tokens
+from app.db import SessionLocal
+from app.main import list_requests
+from app.models import AccessRequest, ApprovalToken, OutboundEmail, OutboxStatus, RequestStatus
+
+REQUESTS = 20000
+
+_FULL_SCAN_RE = re.compile(r"^SCAN (\w+)$")
+
+
+@pytest.fixture(scope="module", autouse=True)
+def seeded(migrated_db):
+    """~20k requests over a year, mostly decided and provisioned; every claim query has a few due rows."""
+    rng = random.Random(7)
+    now = datetime.datetime.utcnow()
+    soon = now + datetime.timedelta(hours=1)
+    requests, tokens_, emails = [], [], []
+    for i in range(REQUESTS):
+        created = now - datetime.timedelta(minutes=rng.randrange(60, 365 * 24 * 60))
+        status = rng.choices(list(RequestStatus), weights=[5, 60, 20, 1, 14])[0]
+        pending = status == RequestStatus.pending
+        due = i % 1000 == 0
+        request_id = str(uuid.uuid4())
+        requests.append(dict(
+            id=request_id, keycloak_user_id=f"user{i % 3000}", requester_email=f"user{i % 3000}@example.com",
+            requested_role=rng.choice(["viewer", "editor", "admin"]), status=status, created_at=created,
+            updated_at=created, notify_count=1, last_notified_at=now if pending else created,
+            next_reminder_at=(now if due else soon + datetime.timedelta(minutes=i % 600)) if pending else None,
+            provisioned_at=created if status == RequestStatus.approved and not due else None,
+            provision_attempts=1))
+        for action in ("approve", "reject"):
+            tokens_.append(dict(jti=str(uuid.uuid4()), request_id=request_id, action=action, created_at=created,
+                                expires_at=created + datetime.timedelta(days=2), used_at=None if pending else created))
+        email_status = OutboxStatus.pending if pending else OutboxStatus.sent
+        if due:
+            email_status = rng.choice([OutboxStatus.pending, OutboxStatus.accepted])
+        emails.append(dict(id=str(uuid.uuid4()), to_email="approver@example.com", subject="s",
+                           status=email_status, attempts=1, created_at=created,
+                           next_attempt_at=now if due else soon if pending else created,
+                           sent_at=None if pending or due else created))
+    with migrated_db.begin() as conn:
+        conn.execute(insert(AccessRequest), requests)
+        conn.execute(insert(ApprovalToken), tokens_)
+        conn.execute(insert(OutboundEmail), emails)
+        conn.exec_driver_sql("ANALYZE")
+    yield
+    with migrated_db.begin() as conn:
+        for model in (OutboundEmail, ApprovalToken, AccessRequest):
+            conn.execute(model.__table__.delete())
+
+
+@contextlib.contextmanager
+def _recorded(engine):
+    """Collect (sql, params) of every statement executed inside the block."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def _plans(engine, statements):
+    """Plan detail lines of each recorded statement."""
+    with engine.connect() as conn:
+        return [(sql, [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params)])
+                for sql, params in statements]
+
+
+def assert_indexed(engine, statements, *tables):
+    """No statement may full-scan one of `tables`; at least one statement must touch them."""
+    assert statements, "the code path issued no queries"
+    touched = False
+    for sql, details in _plans(engine, statements):
+        for detail in details:
+            m = _FULL_SCAN_RE.match(detail)
+            assert not (m and m.group(1) in tables), f"full scan of {m.group(1)}:\n{sql}\n{details}"
+            touched = touched or any(f" {t} " in f" {detail} " for t in tables)
+    assert touched, f"no statement read {tables}"
+
+
+def test_reminder_claim_uses_index(migrated_db):
+    with _recorded(migrated_db) as statements:
+        tasks.reminder_check()
+    assert_indexed(migrated_db, statements, "access_requests")
+
+
+def test_reminder_next_due_uses_index(migrated_db):
+    with _recorded(migrated_db) as statements:
+        tasks.next_reminder_due()
+    assert_indexed(migrated_db, statements, "access_requests")
+
+
+def test_expiry_sweep_uses_index(migrated_db):
+    with _recorded(migrated_db) as statements:
+        tasks.expire_stale_requests()
+    assert_indexed(migrated_db, statements, "access_requests")
+
+
+def test_outbox_claim_uses_index(migrated_db):
+    with _recorded(migrated_db) as statements:
+        outbox._claim_batch(10)
+        outbox._claim_accepted(10)
+    assert_indexed(migrated_db, statements, "outbound_emails")
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"status": RequestStatus.pending},
+    {"status": RequestStatus.pending, "created_from": datetime.date(2024, 1, 1),
+     "created_to": datetime.date(2024, 1, 31)},
+    {"created_from": datetime.datetime(2024, 1, 1, 12, 0)},
+    {"status": RequestStatus.approved, "cursor": "MjAyNC0wMS0wMVQwMDowMDowMHx4"},
+])
+def test_inbox_listing_uses_index(migrated_db, filters):
+    with _recorded(migrated_db) as statements:
+        list_requests(limit=50, **filters)
+    assert_indexed(migrated_db, statements, "access_requests")
+    for _, details in _plans(migrated_db, statements):
+        assert not any("TEMP B-TREE" in d for d in details), details
+
+
+def test_provisioning_claim_uses_index(migrated_db):
+    db = SessionLocal()
+    try:
+        with _recorded(migrated_db) as statements:
+            provisioning._claim(db, datetime.datetime.utcnow(), 10)
+    finally:
+        db.close()
+    assert_indexed(migrated_db, statements, "access_requests")
+    # the due scan reads the index in claim order; later statements only touch the claimed ids
+    _, details = _plans(migrated_db, statements[:1])[0]
+    assert any("ix_access_requests_provision_due" in d for d in details), details
+    assert not any("TEMP B-TREE" in d for d in details), details
+
+
+def test_token_lookups_use_index(migrated_db):
+    db = SessionLocal()
+    try:
+        with _recorded(migrated_db) as statements:
+            tokens.consume_token(db, {"jti": "missing"})
+            tokens.reply_reference_valid(db, "req", "missing")
+            tokens.revoke_tokens_for_requests(db, ["req-1", "req-2"])
+        db.rollback()
+    finally:
+        db.close()
+    assert_indexed(migrated_db, statements, "approval_tokens")
@@ -0,0 +1,44 @@
+import datetime, os, subprocess, sys, time, uuid
+
+from sqlalchemy import func, insert
+
+from app.models import AccessRequest, OutboundEmail, RequestStatus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REQUESTS = 600
+PROCESSES = 4
+
+# each process starts its sweep at the same moment, so their claims overlap
+SWEEP = """
+import sys, time
+from app import tasks
+while time.time() < float(sys.argv[1]):
+    time.sleep(0.005)
+print(tasks.reminder_check())
+"""
+
+
+def test_each_due_request_gets_one_reminder_across_processes(db):
+    now = datetime.datetime.utcnow()
+    db.execute(insert(AccessRequest), [
+        dict(id=str(uuid.uuid4()), keycloak_user_id=f"user{i}", requester_email=f"user{i}@example.com",
+             requested_role="viewer", status=RequestStatus.pending, created_at=now - datetime.timedelta(days=3),
+             updated_at=now, last_notified_at=now - datetime.timedelta(days=3), notify_count=1,
+             next_reminder_at=now - datetime.timedelta(minutes=1))
+        for i in range(REQUESTS)])
+    db.commit()
+
+    env = dict(os.environ, REMINDER_BATCH_SIZE="25", PYTHONPATH=ROOT)
+    start = str(time.time() + 3)
+    procs = [subprocess.Popen([sys.executable, "-c", SWEEP, start], cwd=ROOT, env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+             for _ in range(PROCESSES)]
+    outputs = [p.communicate(timeout=120) for p in procs]
+    assert all(p.returncode == 0 for p in procs), [err for _, err in outputs]
+    queued = [int(out.strip().splitlines()[-1]) for out, _ in outputs]
+
+    assert sum(queued) == REQUESTS
+    per_request = dict(db.query(OutboundEmail.request_id, func.count()).group_by(OutboundEmail.request_id).all())
+    assert len(per_request) == REQUESTS and set(per_request.values()) == {1}
+    assert db.query(AccessRequest).filter(AccessRequest.notify_count != 2).count() == 0
+    assert db.query(AccessRequest).filter(AccessRequest.reminder_lease_owner.isnot(None)).count() == 0
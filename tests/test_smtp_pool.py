@@ -0,0 +1,63 @@
+import smtplib
+from email.message import EmailMessage
+
+from app.mailers import smtp_pool
+
+
+class FakeServer:
+    def __init__(self, kind, host, port, **kwargs):
+        self.kind = kind
+        self.calls = []
+
+    def starttls(self, context=None):
+        self.calls.append("starttls")
+
+    def login(self, user, password):
+        self.calls.append("login")
+
+    def send_message(self, msg):
+        self.calls.append("send")
+
+    def noop(self):
+        return (250, b"ok")
+
+    def quit(self):
+        pass
+
+
+def _patch(monkeypatch, created):
+    def factory(kind):
+        def make(host, port, **kwargs):
+            server = FakeServer(kind, host, port, **kwargs)
+            created.append(server)
+            return server
+        return make
+    monkeypatch.setattr(smtplib, "SMTP", factory("plain"))
+    monkeypatch.setattr(smtplib, "SMTP_SSL", factory("ssl"))
+
+
+def _msg():
+    msg = EmailMessage()
+    msg.set_content("x")
+    return msg
+
+
+def test_implicit_tls_unless_starttls_opted_in(monkeypatch):
+    created = []
+    _patch(monkeypatch, created)
+    smtp_pool.SMTPConnectionPool("smtp.example.com", 587, "u", "p").send_message(_msg())
+    smtp_pool.SMTPConnectionPool("smtp.example.com", 587, "u", "p", starttls=True).send_message(_msg())
+    assert [(s.kind, s.calls) for s in created] == [
+        ("ssl", ["login", "send"]),
+        ("plain", ["starttls", "login", "send"]),
+    ]
+
+
+def test_sessions_are_reused(monkeypatch):
+    created = []
+    _patch(monkeypatch, created)
+    pool = smtp_pool.SMTPConnectionPool("smtp.example.com", 465, "u", "p", max_size=2)
+    for _ in range(5):
+        pool.send_message(_msg())
+    assert len(created) == 1
+    assert pool.snapshot() == {"connects": 1, "reused": 4, "noop_failures": 0, "messages": 5}